@@ -0,0 +1,175 @@
+"""Generate a synthetic Rasa NLU data tree with a target files config for benchmarking.
+
+Items are spread randomly over the NLU files and the generated config assigns them to
+different files, so that `enforce` has to move data around. The output only depends on
+the parameters and `--seed`.
+
+Usage: python benchmarks/generate_corpus.py <output_dir> [--intents 100 ...]
+"""
+import argparse
+import json
+import os
+import random
+
+VERSION_LINE = 'version: "2.0"\n'
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliett kilo lima mike "
+    "november oscar papa quebec romeo sierra tango uniform victor whiskey xray yankee zulu"
+).split()
+
+
+class CorpusParameters:
+    def __init__(
+        self,
+        intents=100,
+        examples_per_intent=20,
+        synonyms=20,
+        examples_per_synonym=5,
+        regexes=10,
+        lookups=5,
+        lookup_size=100,
+        files=10,
+        target_files=None,
+        entity_ratio=0.2,
+        seed=0,
+    ):
+        self.intents = intents
+        self.examples_per_intent = examples_per_intent
+        self.synonyms = synonyms
+        self.examples_per_synonym = examples_per_synonym
+        self.regexes = regexes
+        self.lookups = lookups
+        self.lookup_size = lookup_size
+        self.files = files
+        self.target_files = target_files or max(1, files // 2)
+        self.entity_ratio = entity_ratio
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    @property
+    def total_examples(self):
+        return self.intents * self.examples_per_intent
+
+
+def random_words(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def random_example(rng, parameters, example_ix):
+    text = f"{random_words(rng, rng.randint(2, 8))} {example_ix}"
+    if rng.random() < parameters.entity_ratio:
+        if rng.random() < 0.5:
+            text += f" [{rng.choice(WORDS)}](entity_{rng.randrange(10)})"
+        else:
+            # Inline synonym; the entity text is unique per value to avoid conflicting synonyms
+            value = f"synonym_{rng.randrange(max(1, parameters.synonyms))}"
+            text += f' [{rng.choice(WORDS)} {value}]{{"entity": "entity_{rng.randrange(10)}", "value": "{value}"}}'
+    return text
+
+
+def block(kind, name, examples):
+    lines = [f"- {kind}: {name}\n", "  examples: |\n"]
+    lines.extend(f"    - {example}\n" for example in examples)
+    return "".join(lines)
+
+
+def generate_corpus(output_dir, parameters):
+    """Write the NLU files to `<output_dir>/data/nlu` and the config to `<output_dir>/target_files.yml`."""
+    rng = random.Random(parameters.seed)
+    nlu_dir = os.path.join(output_dir, "data", "nlu")
+    os.makedirs(nlu_dir, exist_ok=True)
+    nlu_files = [os.path.join("data", "nlu", f"file_{ix:04d}.yml") for ix in range(parameters.files)]
+    target_files = [
+        os.path.join("data", "nlu", f"target_{ix:04d}.yml") for ix in range(parameters.target_files)
+    ]
+
+    sections = {
+        "intents": [f"intent_{ix}" for ix in range(parameters.intents)],
+        "synonyms": [f"synonym_{ix}" for ix in range(parameters.synonyms)],
+        "regexes": [f"regex_{ix}" for ix in range(parameters.regexes)],
+        "lookups": [f"lookup_{ix}" for ix in range(parameters.lookups)],
+    }
+    blocks_per_file = {nlu_file: [] for nlu_file in nlu_files}
+    for intent in sections["intents"]:
+        blocks_per_file[rng.choice(nlu_files)].append(
+            block(
+                "intent",
+                intent,
+                [random_example(rng, parameters, ix) for ix in range(parameters.examples_per_intent)],
+            )
+        )
+    for synonym in sections["synonyms"]:
+        blocks_per_file[rng.choice(nlu_files)].append(
+            block(
+                "synonym",
+                synonym,
+                [f"{synonym} {random_words(rng, 2)} {ix}" for ix in range(parameters.examples_per_synonym)],
+            )
+        )
+    for regex in sections["regexes"]:
+        blocks_per_file[rng.choice(nlu_files)].append(
+            block("regex", regex, [f"\\d{{{rng.randint(1, 12)}}}-{regex}"])
+        )
+    for lookup in sections["lookups"]:
+        blocks_per_file[rng.choice(nlu_files)].append(
+            block(
+                "lookup",
+                lookup,
+                [f"{random_words(rng, 2)} {ix}" for ix in range(parameters.lookup_size)],
+            )
+        )
+
+    for nlu_file, blocks in blocks_per_file.items():
+        with open(os.path.join(output_dir, nlu_file), "w", encoding="utf-8") as f:
+            f.write(VERSION_LINE)
+            f.write("nlu:\n")
+            f.writelines(blocks)
+
+    # Only assign part of the keys explicitly, the rest goes to the default target files.
+    config = {
+        "nlu_data_path": os.path.join("data", "nlu"),
+        "default_target_files": {
+            section: os.path.join("data", "nlu", f"default_{section}.yml") for section in sections
+        },
+        "target_files": {
+            section: {key: rng.choice(target_files) for key in keys if rng.random() < 0.8}
+            for section, keys in sections.items()
+        },
+    }
+    # JSON is valid YAML, so the config can be written without any YAML library.
+    with open(os.path.join(output_dir, "target_files.yml"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return output_dir
+
+
+def add_corpus_arguments(parser: argparse.ArgumentParser):
+    defaults = CorpusParameters()
+    for name, value in defaults.as_dict().items():
+        if name == "target_files":
+            parser.add_argument(
+                "--target_files",
+                help="Number of target files in the config (default: half of --files).",
+                default=None,
+                type=int,
+            )
+            continue
+        parser.add_argument(f"--{name}", default=value, type=type(value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output_dir")
+    add_corpus_arguments(parser)
+    args = vars(parser.parse_args())
+    output_dir = args.pop("output_dir")
+    parameters = CorpusParameters(**args)
+    generate_corpus(output_dir, parameters)
+    print(
+        f"Generated {parameters.total_examples} examples in {parameters.files} files in {output_dir}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure cold start time of `python -m nlu_target_files --help`.
+
+Exits with a non-zero exit code if the fastest of several runs takes longer than
+the budget, or if any of the heavy dependencies that should only be imported when a
+command actually runs (Rasa, ruamel) is imported.
+
+Usage: python benchmarks/import_time.py [--budget_seconds 0.5] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMAND = [sys.executable, "-X", "importtime", "-m", "nlu_target_files", "--help"]
+FORBIDDEN_MODULES = ["rasa", "ruamel", "nlu_target_files.target_files"]
+
+
+def run_once():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [REPO_ROOT] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    start = time.perf_counter()
+    completed = subprocess.run(
+        COMMAND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True
+    )
+    elapsed = time.perf_counter() - start
+    imported_modules = [
+        line.split("|")[-1].strip()
+        for line in completed.stderr.decode().splitlines()
+        if line.startswith("import time:") and "|" in line
+    ]
+    return elapsed, imported_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget_seconds", default=0.5, type=float)
+    parser.add_argument("--runs", default=5, type=int)
+    args = parser.parse_args()
+
+    timings = []
+    imported_modules = []
+    for _ in range(args.runs):
+        elapsed, imported_modules = run_once()
+        timings.append(elapsed)
+
+    best = min(timings)
+    print(
+        f"`python {' '.join(COMMAND[3:])}`: best {best:.3f}s, "
+        f"median {sorted(timings)[len(timings) // 2]:.3f}s over {args.runs} runs "
+        f"(budget {args.budget_seconds:.3f}s)"
+    )
+
+    failed = False
+    heavy_imports = [
+        module
+        for module in imported_modules
+        if any(
+            module == forbidden or module.startswith(forbidden + ".")
+            for forbidden in FORBIDDEN_MODULES
+        )
+    ]
+    if heavy_imports:
+        print(f"Heavy modules imported on startup: {', '.join(sorted(set(heavy_imports)))}")
+        failed = True
+    if best > args.budget_seconds:
+        print(f"Startup time exceeds budget of {args.budget_seconds:.3f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Benchmark `infer` and `enforce` on synthetic NLU data at several scales.
+
+For each scale a corpus is generated with `generate_corpus.py` (and reused on later
+runs), then each command is run in a fresh process on a fresh copy of the corpus.
+Wall time and peak RSS of each command are recorded. Results are written to a JSON file
+and compared against the baseline in `benchmarks/baseline.json`, which records the
+machine it was recorded on. Everything runs locally, no
+network access is needed.
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales toy small medium
+    python benchmarks/run_benchmarks.py --scales toy small --save_baseline
+    python benchmarks/run_benchmarks.py --extra_args "--jobs 4 --yaml_backend native"
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+from generate_corpus import CorpusParameters, generate_corpus
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORK_DIR = os.path.join(REPO_ROOT, ".benchmarks")
+DEFAULT_BASELINE_FILE = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+
+SCALES = {
+    "toy": CorpusParameters(intents=10, examples_per_intent=5, synonyms=5, regexes=2, lookups=2, lookup_size=10, files=3),
+    "small": CorpusParameters(intents=100, examples_per_intent=20, files=10),
+    "medium": CorpusParameters(intents=1000, examples_per_intent=50, synonyms=200, regexes=50, lookups=20, lookup_size=1000, files=50),
+    "large": CorpusParameters(intents=2000, examples_per_intent=100, synonyms=1000, regexes=100, lookups=50, lookup_size=5000, files=200),
+    "xlarge": CorpusParameters(intents=10000, examples_per_intent=100, synonyms=5000, regexes=200, lookups=100, lookup_size=10000, files=500),
+}
+
+# Each command runs on its own copy of the corpus, except `enforce_unchanged`, which
+# runs again on the copy `enforce` was run on, so that no file needs to be written.
+COMMANDS = {
+    "infer": ["infer", "--nlu_data_path", "data/nlu", "--target_files_config", "inferred.yml"],
+    "enforce": ["enforce"],
+    "enforce_unchanged": ["enforce"],
+    "check": ["check", "--full_report"],
+}
+
+
+def get_corpus(work_dir, scale):
+    """Generate the corpus for `scale`, unless one with the same parameters already exists."""
+    parameters = SCALES[scale]
+    corpus_dir = os.path.join(work_dir, "corpora", scale)
+    parameters_file = os.path.join(corpus_dir, "parameters.json")
+    try:
+        with open(parameters_file) as f:
+            if json.load(f) == parameters.as_dict():
+                return corpus_dir
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    generate_corpus(corpus_dir, parameters)
+    with open(parameters_file, "w") as f:
+        json.dump(parameters.as_dict(), f)
+    return corpus_dir
+
+
+def run_command(args, cwd):
+    """Run `python -m nlu_target_files <args>` and return its wall time in seconds and peak RSS in MB."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT] + [p for p in [env.get("PYTHONPATH")] if p])
+    env["PYTHONHASHSEED"] = "0"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "nlu_target_files"] + args,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    stderr = process.stderr.read()
+    # Unlike `Popen.wait`, `wait4` also returns the resource usage of the process.
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    # `check` exits with 1 if the data doesn't match the config, which is expected here.
+    allowed_exit_codes = (0, 1) if args[0] == "check" else (0,)
+    if process.returncode not in allowed_exit_codes:
+        sys.stderr.write(stderr.decode(errors="replace")[-2000:])
+        raise RuntimeError(f"`nlu_target_files {' '.join(args)}` failed in {cwd}")
+    # ru_maxrss is in kilobytes on Linux
+    return wall_time, rusage.ru_maxrss / 1024
+
+
+def run_scale(work_dir, scale, extra_args, repeat):
+    corpus_dir = get_corpus(work_dir, scale)
+    results = {}
+    for command, args in COMMANDS.items():
+        timings = []
+        peak_rss = 0
+        run_dir = os.path.join(work_dir, "runs", scale)
+        for _ in range(repeat):
+            if command != "enforce_unchanged":
+                shutil.rmtree(run_dir, ignore_errors=True)
+                shutil.copytree(corpus_dir, run_dir)
+            wall_time, rss = run_command(args + extra_args, run_dir)
+            timings.append(wall_time)
+            peak_rss = max(peak_rss, rss)
+        results[command] = {"wall_time_s": round(min(timings), 4), "peak_rss_mb": round(peak_rss, 1)}
+    return {
+        "examples": SCALES[scale].total_examples,
+        "files": SCALES[scale].files,
+        "commands": results,
+    }
+
+
+def compare_with_baseline(results, baseline, max_regression, min_regression_seconds):
+    """Print a table of results next to the baseline; returns whether anything regressed.
+
+    A command regressed if it took more than `max_regression` times as long as in the
+    baseline, and at least `min_regression_seconds` longer, so that the jitter of
+    runs that only take a fraction of a second doesn't count.
+    """
+    regressed = False
+    header = f"{'scale':<8} {'command':<18} {'time (s)':>10} {'baseline':>10} {'ratio':>7} {'RSS (MB)':>10} {'baseline':>10}"
+    print(header)
+    print("-" * len(header))
+    for scale, scale_results in results["scales"].items():
+        baseline_scale = baseline.get("scales", {}).get(scale, {}).get("commands", {})
+        for command, result in scale_results["commands"].items():
+            base = baseline_scale.get(command)
+            line = f"{scale:<8} {command:<18} {result['wall_time_s']:>10.3f}"
+            if base:
+                ratio = result["wall_time_s"] / base["wall_time_s"] if base["wall_time_s"] else 1.0
+                line += f" {base['wall_time_s']:>10.3f} {ratio:>7.2f} {result['peak_rss_mb']:>10.1f} {base['peak_rss_mb']:>10.1f}"
+                slower_by = result["wall_time_s"] - base["wall_time_s"]
+                if ratio > max_regression and slower_by >= min_regression_seconds:
+                    line += "  REGRESSION"
+                    regressed = True
+            else:
+                line += f" {'-':>10} {'-':>7} {result['peak_rss_mb']:>10.1f} {'-':>10}"
+            print(line)
+    return regressed
+
+
+def get_cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def get_machine_info():
+    """The machine and environment results were recorded on, to tell whether they are comparable."""
+    return {
+        "platform": platform.platform(),
+        "cpu": get_cpu_model(),
+        "cpu_count": os.cpu_count(),
+        # `--yaml_backend auto` uses Rasa if it is installed
+        "rasa_installed": importlib.util.find_spec("rasa") is not None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0], formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--scales", nargs="+", default=["toy", "small", "medium"], choices=list(SCALES))
+    parser.add_argument("--work_dir", default=DEFAULT_WORK_DIR, help="Where corpora and run copies are kept.")
+    parser.add_argument("--extra_args", default="", help="Extra arguments for every nlu_target_files command.")
+    parser.add_argument("--repeat", default=1, type=int, help="Runs per command; the fastest one counts.")
+    parser.add_argument("--output", default=None, help="JSON file for the results (default: <work_dir>/results.json).")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="Baseline results to compare with.")
+    parser.add_argument("--save_baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument(
+        "--max_regression", default=1.25, type=float,
+        help="Exit with a non-zero exit code if a wall time exceeds the baseline by more than this factor.",
+    )
+    parser.add_argument(
+        "--min_regression_seconds", default=0.1, type=float,
+        help="Only count a wall time as a regression if it is also at least this much slower than the baseline.",
+    )
+    args = parser.parse_args()
+
+    extra_args = shlex.split(args.extra_args)
+    results = {
+        "python": sys.version.split()[0],
+        "machine": get_machine_info(),
+        "extra_args": extra_args,
+        "scales": {},
+    }
+    for scale in args.scales:
+        print(f"Running {scale} ({SCALES[scale].total_examples} examples)...", flush=True)
+        results["scales"][scale] = run_scale(args.work_dir, scale, extra_args, args.repeat)
+
+    output = args.output or os.path.join(args.work_dir, "results.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+        if not args.save_baseline:
+            print(f"No baseline found in {args.baseline}; nothing to compare with")
+    if baseline.get("machine") and baseline.get("machine") != results["machine"]:
+        print(f"The baseline was recorded on another machine ({baseline['machine']}); timings may not be comparable")
+    regressed = compare_with_baseline(
+        results, baseline, args.max_regression, args.min_regression_seconds
+    )
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        baseline.setdefault("scales", {}).update(results["scales"])
+        baseline.update({key: value for key, value in results.items() if key != "scales"})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ def main():
     if not hasattr(args, "func"):
         parser.print_usage()
         exit()
-    args.func(args)
+    cli.run_subcommand(args)
 
 
 if __name__ == "__main__":
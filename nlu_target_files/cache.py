@@ -0,0 +1,182 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Optional, Text
+
+import nlu_target_files
+from nlu_target_files.yaml_backends import get_yaml_backend
+
+logger = logging.getLogger(__name__)
+
+CACHE_INFO_FILE = "cache_info.json"
+CACHE_ENTRY_SUFFIX = ".json"
+CACHE_ENTRY_NAME_PATTERN = re.compile(r"[0-9a-f]{64}" + re.escape(CACHE_ENTRY_SUFFIX))
+# Bump when the layout or encoding of cache entries changes
+CACHE_FORMAT_VERSION = 2
+# Modules that parse NLU files or turn them into cache entries; a cache written with
+# other versions of them is discarded even if the package version is the same.
+PARSER_SOURCE_FILES = ["native_yaml.py", "training_data.py"]
+
+# YAML timestamps, e.g. in metadata, are stored as {tag: ISO format} and restored on load
+DATETIME_TAG = "__nlu_target_files_datetime__"
+DATE_TAG = "__nlu_target_files_date__"
+
+
+def encode_json_value(value):
+    if isinstance(value, datetime.datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {DATE_TAG: value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def decode_json_object(obj: dict):
+    if len(obj) == 1:
+        if DATETIME_TAG in obj:
+            return datetime.datetime.fromisoformat(obj[DATETIME_TAG])
+        if DATE_TAG in obj:
+            return datetime.date.fromisoformat(obj[DATE_TAG])
+    return obj
+
+
+class ParsedNLUFileCache:
+    """On-disk cache of parsed NLU files, keyed by a hash of the file contents.
+
+    Each entry is the compact serialized form produced by
+    `training_data.training_data_as_dict`. Entries are evicted least recently used
+    first once the cache grows beyond `max_size_mb`. The whole cache is
+    discarded when the YAML backend (or its version) or the nlu_target_files version
+    it was written with changes.
+    """
+
+    def __init__(self, cache_dir: Text, max_size_mb: float, yaml_backend=None):
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.yaml_backend = yaml_backend or get_yaml_backend()
+        self.hits = 0
+        self.misses = 0
+        self.ensure_valid_cache_dir()
+
+    def get_cache_info(self):
+        import ruamel.yaml
+
+        return {
+            "cache_format_version": CACHE_FORMAT_VERSION,
+            "yaml_backend": self.yaml_backend.name,
+            "yaml_backend_version": self.yaml_backend.version,
+            "nlu_target_files_version": nlu_target_files.__version__,
+            "parser_source_hash": get_parser_source_hash(),
+            "ruamel_yaml_version": ruamel.yaml.__version__,
+        }
+
+    def ensure_valid_cache_dir(self):
+        info_file = os.path.join(self.cache_dir, CACHE_INFO_FILE)
+        try:
+            with open(info_file, encoding="utf-8") as f:
+                cache_info = json.load(f)
+        except (OSError, ValueError):
+            cache_info = None
+
+        if cache_info != self.get_cache_info():
+            if os.path.isdir(self.cache_dir):
+                logger.warning(
+                    f"Cache in {self.cache_dir} was written by other versions; clearing it"
+                )
+                for path, _, _ in self.get_entries():
+                    os.remove(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(info_file, "w", encoding="utf-8") as f:
+                json.dump(self.get_cache_info(), f)
+
+    @staticmethod
+    def hash_file(filepath: Text) -> Text:
+        with open(filepath, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def entry_path(self, content_hash: Text) -> Text:
+        return os.path.join(self.cache_dir, content_hash + CACHE_ENTRY_SUFFIX)
+
+    def get(self, content_hash: Text) -> Optional[dict]:
+        entry_path = self.entry_path(content_hash)
+        try:
+            with open(entry_path, encoding="utf-8") as f:
+                entry = json.load(f, object_hook=decode_json_object)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Mark the entry as recently used for LRU eviction.
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Evicted by another process sharing the cache in the meantime
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, content_hash: Text, entry: dict):
+        """Store `entry`; raises `TypeError` for values that can't be serialized, without
+        leaving anything behind in the cache directory.
+        """
+        entry_path = self.entry_path(content_hash)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    entry, f, ensure_ascii=False, separators=(",", ":"), default=encode_json_value
+                )
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def get_entries(self):
+        """Paths, last use times and sizes of all cache entries."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for dir_entry in it:
+                if CACHE_ENTRY_NAME_PATTERN.fullmatch(dir_entry.name):
+                    stat = dir_entry.stat()
+                    entries.append((dir_entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in its size limit."""
+        entries = sorted(self.get_entries(), key=lambda entry: entry[1])
+        total_size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process sharing the cache
+                pass
+            total_size -= size
+
+    def log_stats(self):
+        logger.warning(
+            f"NLU file cache: {self.hits} file(s) loaded from cache, {self.misses} file(s) parsed"
+        )
+
+
+def get_parser_source_hash() -> Text:
+    source_hash = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for filename in PARSER_SOURCE_FILES:
+        with open(os.path.join(package_dir, filename), "rb") as f:
+            source_hash.update(f.read())
+    return source_hash.hexdigest()
+
+
+def create_cache(
+    cache_dir: Optional[Text], max_size_mb: float, yaml_backend=None
+) -> Optional[ParsedNLUFileCache]:
+    if not cache_dir:
+        return None
+    return ParsedNLUFileCache(cache_dir, max_size_mb, yaml_backend)
@@ -0,0 +1,41 @@
+import logging
+import os
+import subprocess
+from typing import List, Text
+
+logger = logging.getLogger(__name__)
+
+
+def run_git(*args) -> List[Text]:
+    try:
+        completed = subprocess.run(
+            ["git", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None)
+        logger.error(
+            f"ERROR: Could not run `git {' '.join(args)}`"
+            + (f": {stderr.decode().strip()}" if stderr else "")
+        )
+        raise
+    return [line for line in completed.stdout.decode().splitlines() if line]
+
+
+def get_files_changed_since(git_ref: Text) -> List[Text]:
+    """Files that differ between `git_ref` and the working tree, including untracked files.
+
+    Paths are relative to the current directory. Deleted files are included too.
+    """
+    repo_root = run_git("rev-parse", "--show-toplevel")[0]
+    changed_files = run_git("diff", "--name-only", git_ref, "--")
+    untracked_files = run_git(
+        "ls-files", "--others", "--exclude-standard", "--full-name", ":/"
+    )
+    return sorted(
+        set(
+            [
+                os.path.relpath(os.path.join(repo_root, f))
+                for f in changed_files + untracked_files
+            ]
+        )
+    )
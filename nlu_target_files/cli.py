@@ -1,18 +1,126 @@
 import argparse
 import logging
 import os
+import sys
 
 from nlu_target_files import constants
-from nlu_target_files.target_files import (
-    enforce_nlu_target_files,
-    infer_nlu_target_files,
-)
+from nlu_target_files.profiling import DEFAULT_PROFILE_OUTPUT, profile_phase, profiling
+from nlu_target_files.yaml_backends import YAML_BACKEND_AUTO, YAML_BACKENDS
 
 logger = logging.getLogger(__file__)
 
 
+# Subcommands import `target_files` only when they run, so that `--help` and
+# argument errors don't pay for importing ruamel or Rasa.
+
+
+def is_batch(args):
+    from nlu_target_files.target_files import is_glob_pattern
+
+    return len(args.target_files_config) > 1 or is_glob_pattern(args.target_files_config[0])
+
+
+def run_batch_command(args, command, **kwargs):
+    """Run `command` on every config in `--target_files_config`; exits with 1 if any project fails."""
+    from nlu_target_files.target_files import (
+        OverlappingNLUDataPathsError,
+        expand_target_files_configs,
+        run_batch,
+        write_batch_report,
+    )
+
+    target_files_configs = expand_target_files_configs(args.target_files_config)
+    if not target_files_configs:
+        logger.error("No target files configs found")
+        sys.exit(2)
+    try:
+        results = run_batch(command, target_files_configs, args.project_jobs, **kwargs)
+    except OverlappingNLUDataPathsError as e:
+        logger.error(str(e))
+        sys.exit(2)
+    if args.batch_report:
+        write_batch_report(results, args.batch_report)
+    if any(result.exit_code != 0 for result in results):
+        sys.exit(1)
+
+
 def enforce(args):
-    enforce_nlu_target_files(target_files_config=args.target_files_config, update_config_file=args.update_config_file)
+    with profile_phase("import"):
+        from nlu_target_files.target_files import enforce_nlu_target_files
+
+    if args.streaming and args.splice:
+        logger.error("--splice can't be used together with --streaming")
+        sys.exit(2)
+    kwargs = dict(
+        update_config_file=args.update_config_file,
+        changed_files=args.changed_files,
+        key_index=args.key_index,
+        since=args.since,
+        streaming=args.streaming,
+        splice=args.splice,
+        jobs=args.jobs,
+        cache_dir=args.cache_dir,
+        cache_max_size_mb=args.cache_max_size_mb,
+        yaml_backend=args.yaml_backend,
+        **get_lookup_kwargs(args),
+        **get_duplicate_kwargs(args),
+    )
+    if is_batch(args):
+        run_batch_command(args, "enforce", **kwargs)
+        return
+    summary = enforce_nlu_target_files(args.target_files_config[0], **kwargs)
+    if summary.failed:
+        sys.exit(1)
+
+
+def check(args):
+    with profile_phase("import"):
+        from nlu_target_files.target_files import check_nlu_target_files
+
+    kwargs = dict(
+        full_report=args.full_report,
+        key_index=args.key_index,
+        splice=args.splice,
+        jobs=args.jobs,
+        cache_dir=args.cache_dir,
+        cache_max_size_mb=args.cache_max_size_mb,
+        yaml_backend=args.yaml_backend,
+        **get_lookup_kwargs(args),
+        **get_duplicate_kwargs(args),
+    )
+    if is_batch(args):
+        run_batch_command(args, "check", **kwargs)
+        return
+    if not check_nlu_target_files(args.target_files_config[0], **kwargs):
+        sys.exit(1)
+
+
+def watch(args):
+    with profile_phase("import"):
+        from nlu_target_files.watch import watch_nlu_target_files
+
+    watch_nlu_target_files(
+        target_files_config=args.target_files_config,
+        update_config_file=args.update_config_file,
+        streaming=args.streaming,
+        jobs=args.jobs,
+        cache_dir=args.cache_dir,
+        cache_max_size_mb=args.cache_max_size_mb,
+        yaml_backend=args.yaml_backend,
+        debounce=args.debounce_seconds,
+        poll_interval=args.poll_interval_seconds,
+        polling=args.polling,
+        **get_lookup_kwargs(args),
+        **get_duplicate_kwargs(args),
+    )
+
+
+def locate(args):
+    with profile_phase("import"):
+        from nlu_target_files.target_files import locate_nlu_keys
+
+    if not locate_nlu_keys(args.target_files_config, args.keys, args.section, args.show):
+        sys.exit(1)
 
 
 def infer(args):
@@ -21,13 +129,206 @@ def infer(args):
     except AssertionError:
         logger.error(f"ERROR: Directory {args.nlu_data_path} does not exist")
         raise
+    with profile_phase("import"):
+        from nlu_target_files.target_files import infer_nlu_target_files
+
     infer_nlu_target_files(
         nlu_data_path=args.nlu_data_path,
         target_files_config=args.target_files_config,
         default_nlu_target_file=args.default_nlu_target_file,
+        jobs=args.jobs,
+        cache_dir=args.cache_dir,
+        cache_max_size_mb=args.cache_max_size_mb,
+        yaml_backend=args.yaml_backend,
+        compress_rules=args.compress_rules,
+        full_parse=args.full_parse,
     )
 
 
+def add_loading_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--jobs",
+        help=("Number of processes to use for parsing NLU data files, and for writing them with `enforce`."),
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help=(
+            """
+            Directory in which to cache parsed NLU data files between runs.
+            Only files whose contents changed since they were cached are parsed again.
+            Caching is disabled if not specified.
+            """
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--cache_max_size_mb",
+        help=("Maximum size of the cache directory; least recently used entries are removed first."),
+        default=constants.DEFAULT_CACHE_MAX_SIZE_MB,
+        type=float,
+    )
+    parser.add_argument(
+        "--yaml_backend",
+        help=(
+            """
+            How to read and write NLU data files. `rasa` uses Rasa's own reader and writer,
+            `native` a built-in one that doesn't need Rasa installed but only supports YAML files.
+            `auto` uses Rasa if it is installed.
+            """
+        ),
+        default=YAML_BACKEND_AUTO,
+        choices=YAML_BACKENDS,
+    )
+
+
+def add_lookup_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--lookup_chunk_size",
+        help=(
+            """
+            Sort lookup tables with more elements than this externally, in sorted chunks of this many
+            elements that are written to temporary files and merged, instead of all at once in memory.
+            """
+        ),
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--dedupe_lookups",
+        help=("Drop duplicate elements from lookup tables."),
+        default=False,
+        action="store_true"
+    )
+    parser.add_argument(
+        "--lookup_sidecar_threshold",
+        help=(
+            """
+            Keep lookup tables with more elements than this in temporary sidecar files once they are sorted,
+            instead of in memory, and stream them into their target files when these are written.
+            """
+        ),
+        default=None,
+        type=int,
+    )
+
+
+def get_lookup_kwargs(args):
+    return dict(
+        lookup_chunk_size=args.lookup_chunk_size,
+        dedupe_lookups=args.dedupe_lookups,
+        lookup_sidecar_threshold=args.lookup_sidecar_threshold,
+    )
+
+
+def add_duplicate_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--report_duplicates",
+        help=(
+            """
+            Report example texts found under more than one intent and synonym values mapped to more than
+            one synonym, ignoring case and whitespace.
+            """
+        ),
+        default=False,
+        action="store_true"
+    )
+    parser.add_argument(
+        "--drop_duplicates",
+        help=(
+            """
+            Drop examples with the same intent and annotated text as an earlier example, and regexes
+            with the same name and pattern as an earlier one. Also reports duplicates.
+            """
+        ),
+        default=False,
+        action="store_true"
+    )
+
+
+def get_duplicate_kwargs(args):
+    return dict(
+        report_duplicates=args.report_duplicates,
+        drop_duplicates=args.drop_duplicates,
+    )
+
+
+def add_key_index_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--key_index",
+        help=(
+            """
+            Keep an index of the file, lines and bytes of each key next to the config file
+            (e.g. target_files.index.json), see `locate`. `check` uses it to skip parsing when
+            nothing changed since the last enforcement.
+            """
+        ),
+        default=False,
+        action="store_true"
+    )
+
+
+def add_splice_arguments(parser: argparse.ArgumentParser, help_text: str):
+    parser.add_argument(
+        "--splice",
+        help=help_text,
+        default=False,
+        action="store_true"
+    )
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--project_jobs",
+        help=(
+            """
+            With several target files configs, the number of projects to run in parallel, each in its own process.
+            The NLU data paths of the projects must not overlap.
+            """
+        ),
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--batch_report",
+        help=("With several target files configs, a JSON file to which to write the exit code and error of each project."),
+        default=None,
+    )
+
+
+def add_profiling_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile",
+        help=(
+            """
+            Measure the time and peak memory of each phase of the command (imports, file discovery,
+            parsing, sorting, partitioning, rendering, writing, ...). The results are printed as a table
+            at the end and written to --profile_output.
+            """
+        ),
+        default=False,
+        action="store_true"
+    )
+    parser.add_argument(
+        "--profile_output",
+        help=("JSON file to which to write the --profile results."),
+        default=DEFAULT_PROFILE_OUTPUT,
+    )
+    parser.add_argument(
+        "--cprofile_dir",
+        help=(
+            "With --profile, also write cProfile stats of the parsing, sorting, partitioning and rendering phases to this directory."
+        ),
+        default=None,
+    )
+
+
+def run_subcommand(args):
+    with profiling(args.profile, args.func.__name__, args.profile_output, args.cprofile_dir):
+        args.func(args)
+
+
 def add_infer_subparser(subparsers: argparse._SubParsersAction):
     subparser = subparsers.add_parser(
         "infer",
@@ -54,6 +355,30 @@ def add_infer_subparser(subparsers: argparse._SubParsersAction):
         help=("Target file for items that don't already have a target file."),
         default=constants.DEFAULT_NLU_TARGET_FILE,
     )
+    subparser.add_argument(
+        "--compress_rules",
+        help=(
+            """
+            Where all items with a common prefix (e.g. intents starting with `faq_`) are in the same file,
+            write a prefix rule under `target_file_rules` instead of listing the items one by one.
+            """
+        ),
+        default=False,
+        action="store_true"
+    )
+    subparser.add_argument(
+        "--full_parse",
+        help=(
+            """
+            Load all examples of each file, as `enforce` does, instead of only scanning the files for the names of
+            intents, synonyms, regexes and lookup tables. Slower; the inferred config is the same.
+            """
+        ),
+        default=False,
+        action="store_true"
+    )
+    add_loading_arguments(subparser)
+    add_profiling_arguments(subparser)
 
 
 def add_enforce_subparser(subparsers: argparse._SubParsersAction):
@@ -66,9 +391,14 @@ def add_enforce_subparser(subparsers: argparse._SubParsersAction):
     parser_enforce.add_argument(
         "--target_files_config",
         help=(
-            "YAML file specifying NLU target files. Bootstrap this file with `infer` if you don't have one yet."
+            """
+            YAML file specifying NLU target files. Bootstrap this file with `infer` if you don't have one yet.
+            Several files or glob patterns (e.g. 'assistants/*/target_files.yml') can be given to enforce
+            several projects in one run, see --project_jobs.
+            """
         ),
-        default=constants.TARGET_FILES_CONFIG_FILE,
+        nargs="+",
+        default=[constants.TARGET_FILES_CONFIG_FILE],
     )
     parser_enforce.add_argument(
         "--update_config_file",
@@ -81,6 +411,179 @@ def add_enforce_subparser(subparsers: argparse._SubParsersAction):
         default=False,
         action="store_true"
     )
+    changes = parser_enforce.add_mutually_exclusive_group()
+    changes.add_argument(
+        "--changed_files",
+        help=(
+            """
+            Only rewrite these NLU data files and the target files of the items in them,
+            e.g. the files changed in a pull request. Gives the same result as enforcing on
+            all files, provided the other files already matched the config.
+            """
+        ),
+        nargs="*",
+        default=None,
+    )
+    changes.add_argument(
+        "--since",
+        help=(
+            "Like --changed_files, with the files changed in the working tree since this git ref, e.g. `origin/main`."
+        ),
+        default=None,
+    )
+    parser_enforce.add_argument(
+        "--streaming",
+        help=(
+            """
+            Write each target file item by item instead of rendering it in memory first,
+            one file at a time, to bound memory use on large data sets. The output is identical.
+            """
+        ),
+        default=False,
+        action="store_true"
+    )
+    add_loading_arguments(parser_enforce)
+    add_lookup_arguments(parser_enforce)
+    add_duplicate_arguments(parser_enforce)
+    add_key_index_arguments(parser_enforce)
+    add_splice_arguments(
+        parser_enforce,
+        """
+        Only replace, remove and insert the top-level nlu items that changed in existing
+        target files, keeping the other items, comments and formatting byte for byte.
+        Files that can't be spliced safely, e.g. with other top-level keys, are rewritten
+        in full. Can't be used with --streaming.
+        """,
+    )
+    add_batch_arguments(parser_enforce)
+    add_profiling_arguments(parser_enforce)
+
+
+def add_check_subparser(subparsers: argparse._SubParsersAction):
+    parser_check = subparsers.add_parser(
+        "check",
+        description="""
+    Checks whether NLU training data is already distributed according to the YAML config file, without changing any files.
+    Exits with a non-zero exit code if `enforce` would change any file, e.g. for use in pre-commit hooks or CI.
+    """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser_check.set_defaults(func=check)
+    parser_check.add_argument(
+        "--target_files_config",
+        help=(
+            "YAML file specifying NLU target files. Several files or glob patterns can be given to check several projects."
+        ),
+        nargs="+",
+        default=[constants.TARGET_FILES_CONFIG_FILE],
+    )
+    parser_check.add_argument(
+        "--full_report",
+        help=(
+            "Report all misplaced keys and files that would change instead of stopping at the first mismatch."
+        ),
+        default=False,
+        action="store_true"
+    )
+    add_loading_arguments(parser_check)
+    add_lookup_arguments(parser_check)
+    add_duplicate_arguments(parser_check)
+    add_key_index_arguments(parser_check)
+    add_splice_arguments(
+        parser_check,
+        "Check whether `enforce --splice` would change any files, i.e. only require the right items in each file.",
+    )
+    add_batch_arguments(parser_check)
+    add_profiling_arguments(parser_check)
+
+
+def add_watch_subparser(subparsers: argparse._SubParsersAction):
+    parser_watch = subparsers.add_parser(
+        "watch",
+        description="""
+    Enforces the YAML config file, then keeps watching the NLU data and the config file and enforces it again on every change.
+    The data is kept in memory, so only changed files are parsed again and only the target files of their items are rewritten.
+    """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser_watch.set_defaults(func=watch)
+    parser_watch.add_argument(
+        "--target_files_config",
+        help=("YAML file specifying NLU target files."),
+        default=constants.TARGET_FILES_CONFIG_FILE,
+    )
+    parser_watch.add_argument(
+        "--update_config_file",
+        help=("Update the config file with any new items found, as with `enforce`."),
+        default=False,
+        action="store_true"
+    )
+    parser_watch.add_argument(
+        "--streaming",
+        help=("Write target files item by item, as with `enforce --streaming`."),
+        default=False,
+        action="store_true"
+    )
+    parser_watch.add_argument(
+        "--debounce_seconds",
+        help=("Wait until no file changed for this long before enforcing, so that saving several files triggers a single update."),
+        default=constants.DEFAULT_WATCH_DEBOUNCE_SECONDS,
+        type=float,
+    )
+    parser_watch.add_argument(
+        "--poll_interval_seconds",
+        help=("How often to check for changes when polling."),
+        default=constants.DEFAULT_WATCH_POLL_INTERVAL_SECONDS,
+        type=float,
+    )
+    parser_watch.add_argument(
+        "--polling",
+        help=("Poll for changes even if inotify is available, e.g. for network file systems."),
+        default=False,
+        action="store_true"
+    )
+    add_loading_arguments(parser_watch)
+    add_lookup_arguments(parser_watch)
+    add_duplicate_arguments(parser_watch)
+    add_profiling_arguments(parser_watch)
+
+
+def add_locate_subparser(subparsers: argparse._SubParsersAction):
+    parser_locate = subparsers.add_parser(
+        "locate",
+        description="""
+    Shows which file and lines hold each of the given keys, according to the key index next to the config file.
+    The index is created, or updated for files that changed since it was written, first. Only files laid out like
+    the files `enforce` writes can be indexed by key.
+    """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser_locate.set_defaults(func=locate)
+    parser_locate.add_argument(
+        "keys",
+        help=("Names of the intents, synonyms, regexes or lookup tables to locate."),
+        nargs="+",
+    )
+    parser_locate.add_argument(
+        "--target_files_config",
+        help=("YAML file specifying NLU target files."),
+        default=constants.TARGET_FILES_CONFIG_FILE,
+    )
+    parser_locate.add_argument(
+        "--section",
+        help=("Only look for keys in these sections."),
+        nargs="+",
+        choices=["intents", "synonyms", "regexes", "lookups"],
+        default=None,
+    )
+    parser_locate.add_argument(
+        "--show",
+        help=("Also show the lines of each key."),
+        default=False,
+        action="store_true"
+    )
+    add_profiling_arguments(parser_locate)
+
 
 def create_argument_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
@@ -99,5 +602,8 @@ def create_argument_parser() -> argparse.ArgumentParser:
     subparsers = parser.add_subparsers()
     add_infer_subparser(subparsers)
     add_enforce_subparser(subparsers)
+    add_check_subparser(subparsers)
+    add_watch_subparser(subparsers)
+    add_locate_subparser(subparsers)
 
     return parser
@@ -1,3 +1,7 @@
 TARGET_FILES_CONFIG_FILE = "./target_files.yml"
 NLU_DATA_PATH = "./data/nlu"
 DEFAULT_NLU_TARGET_FILE = "./data/nlu/nlu.yml"
+DEFAULT_CACHE_MAX_SIZE_MB = 512
+DEFAULT_ENCODING = "utf-8"
+DEFAULT_WATCH_DEBOUNCE_SECONDS = 0.3
+DEFAULT_WATCH_POLL_INTERVAL_SECONDS = 1.0
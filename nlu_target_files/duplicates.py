@@ -0,0 +1,121 @@
+"""Detection of duplicate examples and conflicting synonyms in the NLU data.
+
+Example texts and synonym values are normalized (case folded, with whitespace collapsed)
+and looked up in dicts, so that finding duplicates takes a single pass over the data
+instead of comparing every pair of examples.
+
+- An example text that appears under more than one intent is a cross-intent duplicate.
+- A synonym value that maps to more than one synonym, e.g. `NYC` to `New York` and `nyc`
+  to `New York City`, is a conflicting synonym mapping. Values that are exactly the same
+  can only map to one synonym once the data is loaded; Rasa warns about those when it
+  loads the data.
+
+With `drop`, exact duplicates are dropped: examples with the same intent and the same
+text including entity annotations as an earlier example, and regexes with the same name
+and pattern as an earlier one. Cross-intent duplicates are only reported, since it takes
+a person to decide which intent an example belongs to.
+"""
+from collections import OrderedDict, namedtuple
+import logging
+from typing import Text
+
+from nlu_target_files.native_yaml import ENTITIES, INTENT, INTENT_RESPONSE_KEY, TEXT, generate_message
+
+logger = logging.getLogger(__name__)
+
+DuplicateOptions = namedtuple("DuplicateOptions", ["report", "drop"])
+DEFAULT_DUPLICATE_OPTIONS = DuplicateOptions(False, False)
+
+MAX_LOGGED_DUPLICATES = 20
+
+
+def normalize_text(text: Text) -> Text:
+    return " ".join(text.split()).casefold()
+
+
+class DuplicateIndex:
+    """Index of normalized example texts and synonym values, filled while the data is partitioned."""
+
+    def __init__(self, drop: bool = False):
+        self.drop = drop
+        # Normalized text -> the first intent it was found under; texts found under
+        # several intents are moved to `intents_per_duplicate_text`.
+        self.intent_per_text = {}
+        self.intents_per_duplicate_text = {}
+        self.synonym_per_value = {}
+        self.synonyms_per_conflicting_value = {}
+        self.seen_examples = set()
+        self.seen_regexes = set()
+        self.dropped_examples = 0
+        self.dropped_regexes = 0
+
+    def add_examples(self, examples) -> list:
+        """Index the examples; returns them without exact duplicates if `drop`."""
+        kept = []
+        for example in examples:
+            intent = example.get(INTENT_RESPONSE_KEY) or example.get(INTENT)
+            text = example.get(TEXT, "")
+            if self.drop:
+                annotated_text = generate_message(example.data) if example.get(ENTITIES) else text
+                if (intent, annotated_text) in self.seen_examples:
+                    self.dropped_examples += 1
+                    continue
+                self.seen_examples.add((intent, annotated_text))
+            kept.append(example)
+
+            normalized_text = normalize_text(text)
+            first_intent = self.intent_per_text.setdefault(normalized_text, intent)
+            if first_intent != intent:
+                self.intents_per_duplicate_text.setdefault(
+                    normalized_text, OrderedDict([(first_intent, None)])
+                )[intent] = None
+        return kept
+
+    def add_synonym(self, value: Text, synonym: Text):
+        normalized_value = normalize_text(value)
+        first_synonym = self.synonym_per_value.setdefault(normalized_value, synonym)
+        if first_synonym != synonym:
+            self.synonyms_per_conflicting_value.setdefault(
+                normalized_value, OrderedDict([(first_synonym, None)])
+            )[synonym] = None
+
+    def add_regexes(self, regexes) -> list:
+        """Returns the regexes without exact duplicates if `drop`."""
+        if not self.drop:
+            return regexes
+        kept = []
+        for regex in regexes:
+            key = (regex.get("name"), regex.get("pattern"))
+            if key in self.seen_regexes:
+                self.dropped_regexes += 1
+                continue
+            self.seen_regexes.add(key)
+            kept.append(regex)
+        return kept
+
+    def log_report(self):
+        log_duplicates(
+            "example text(s) under more than one intent",
+            self.intents_per_duplicate_text,
+        )
+        log_duplicates(
+            "synonym value(s) mapped to more than one synonym",
+            self.synonyms_per_conflicting_value,
+        )
+        if self.drop:
+            logger.warning(
+                f"Dropped {self.dropped_examples} duplicate example(s) "
+                f"and {self.dropped_regexes} duplicate regex(es)"
+            )
+
+
+def log_duplicates(description: Text, names_per_text):
+    if not names_per_text:
+        return
+    lines = [
+        f"  '{text}': {', '.join(sorted([str(name) for name in names]))}"
+        for text, names in sorted(names_per_text.items())[:MAX_LOGGED_DUPLICATES]
+    ]
+    if len(names_per_text) > MAX_LOGGED_DUPLICATES:
+        lines.append(f"  ... and {len(names_per_text) - MAX_LOGGED_DUPLICATES} more")
+    logger.warning(f"Found {len(names_per_text)} {description} (normalized):\n" + "\n".join(lines))
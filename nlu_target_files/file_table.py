@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from os.path import relpath
+from typing import Dict, Iterable, Optional, Text
+
+
+class FileTable:
+    """Interns target file paths, so that each distinct path is stored (and made
+    relative) only once and keys can refer to their target file by a small integer id.
+    """
+
+    def __init__(self):
+        self.filenames = []
+        self.ids = {}
+        # Paths as given -> id of their relative path, so `relpath` runs once per path
+        self.path_ids = {}
+
+    def intern(self, path: Text) -> int:
+        """The id of the relative path of `path`, adding it to the table if needed."""
+        file_id = self.path_ids.get(path)
+        if file_id is None:
+            filename = relpath(path)
+            file_id = self.ids.get(filename)
+            if file_id is None:
+                file_id = len(self.filenames)
+                self.filenames.append(filename)
+                self.ids[filename] = file_id
+            self.path_ids[path] = file_id
+        return file_id
+
+    def __getitem__(self, file_id: int) -> Text:
+        return self.filenames[file_id]
+
+    def __len__(self):
+        return len(self.filenames)
+
+
+class SectionTargetFiles:
+    """The target file of each key in one section of the config, stored as ids into a
+    shared `FileTable`.
+
+    The inverse index of keys per file is kept up to date as keys are assigned, so that
+    finding all keys in a file doesn't require scanning all keys. Within each file,
+    keys are kept in the order of the section.
+
+    Keys can be assigned implicitly, i.e. by a target file rule: they are handled like
+    all other keys, but left out of `as_ordered_dict`, so they aren't written to the
+    config file.
+    """
+
+    def __init__(self, file_table: FileTable, target_files: Optional[Dict[Text, Text]] = None):
+        self.file_table = file_table
+        self.file_ids = OrderedDict()
+        # file id -> keys in that file, as an OrderedDict with `None` values
+        self.keys_per_file = OrderedDict()
+        # Keys are numbered in the order they are added, to keep `keys_per_file` in order
+        self.positions = {}
+        self.implicit_keys = set()
+        for key, path in (target_files or {}).items():
+            self.set_file_id(key, file_table.intern(path))
+
+    def set_file_id(self, key: Text, file_id: int, implicit: bool = False):
+        if implicit:
+            self.implicit_keys.add(key)
+        else:
+            self.implicit_keys.discard(key)
+        old_file_id = self.file_ids.get(key)
+        if old_file_id == file_id:
+            return
+        if old_file_id is not None:
+            del self.keys_per_file[old_file_id][key]
+            if not self.keys_per_file[old_file_id]:
+                del self.keys_per_file[old_file_id]
+        else:
+            self.positions[key] = len(self.positions)
+        self.file_ids[key] = file_id
+        keys = self.keys_per_file.setdefault(file_id, OrderedDict())
+        keys[key] = None
+        if old_file_id is not None and len(keys) > 1:
+            # A key that moved files may belong before keys added to its new file earlier.
+            self.keys_per_file[file_id] = OrderedDict.fromkeys(
+                sorted(keys, key=self.positions.__getitem__)
+            )
+
+    def set_value_for_keys(
+        self, keys: Optional[Iterable[Text]] = None, value: Text = "", implicit: bool = False
+    ):
+        if not keys:
+            return
+        file_id = self.file_table.intern(value)
+        for key in keys:
+            self.set_file_id(key, file_id, implicit)
+
+    def sort(self):
+        """Group keys by target file, in the order in which the files first appear."""
+        file_order = OrderedDict.fromkeys(self.file_ids.values())
+        self.file_ids = OrderedDict(
+            (key, file_id) for file_id in file_order for key in self.keys_per_file[file_id]
+        )
+        self.keys_per_file = OrderedDict(
+            (file_id, self.keys_per_file[file_id]) for file_id in file_order
+        )
+        self.positions = {key: position for position, key in enumerate(self.file_ids)}
+
+    def get(self, key: Text, default: Optional[Text] = None) -> Optional[Text]:
+        file_id = self.file_ids.get(key)
+        if file_id is None:
+            return default
+        return self.file_table[file_id]
+
+    def __getitem__(self, key: Text) -> Text:
+        return self.file_table[self.file_ids[key]]
+
+    def __contains__(self, key) -> bool:
+        return key in self.file_ids
+
+    def __iter__(self):
+        return iter(self.file_ids)
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def keys(self):
+        return self.file_ids.keys()
+
+    def items(self):
+        filenames = self.file_table.filenames
+        return ((key, filenames[file_id]) for key, file_id in self.file_ids.items())
+
+    def filenames(self):
+        """The target files that have at least one key."""
+        return [self.file_table[file_id] for file_id in self.keys_per_file]
+
+    def keys_in_file(self, filename: Text):
+        file_id = self.file_table.ids.get(filename)
+        return list(self.keys_per_file.get(file_id, ()))
+
+    def as_ordered_dict(self) -> OrderedDict:
+        """The explicitly assigned keys with their target files."""
+        if not self.implicit_keys:
+            return OrderedDict(self.items())
+        return OrderedDict(
+            (key, filename) for key, filename in self.items() if key not in self.implicit_keys
+        )
@@ -0,0 +1,242 @@
+"""A persistent index of where each key currently is in the NLU data.
+
+The index is kept next to the target files config (`target_files.yml` ->
+`target_files.index.json`) and records, for each NLU file, a hash of its contents and
+the blocks of each key in it: the byte range, the line range and a hash of the bytes
+of each top-level `nlu:` item with the key's name (consecutive items of the same key,
+like the retrieval intents of one intent, form one block).
+
+Blocks are found by scanning the lines of each file, without parsing it as YAML, so
+this only works for files laid out like the files `enforce` writes: top-level items
+that start with their `intent`, `synonym`, `regex` or `lookup` name. Other files are
+indexed by their hash only, without keys.
+
+An index is stale where the hashes of files don't match, or files were added or
+removed; `KeyIndex.refresh` scans these files again. An index written right after
+enforcement also records the signature of the config and options it was enforced
+with (see `TargetFilesConfig.get_enforcement_signature`); as long as nothing is stale,
+the data is known to match that config without loading it.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set, Text
+
+import nlu_target_files
+from nlu_target_files.constants import DEFAULT_ENCODING
+from nlu_target_files.native_yaml import read_yaml, separate_intent_response_key
+from nlu_target_files.writing import write_file_atomically
+
+logger = logging.getLogger(__name__)
+
+KEY_INDEX_SUFFIX = ".index.json"
+KEY_INDEX_FORMAT_VERSION = 1
+
+SECTIONS_PER_ITEM_KEY = OrderedDict(
+    [
+        ("intent", "intents"),
+        ("synonym", "synonyms"),
+        ("regex", "regexes"),
+        ("lookup", "lookups"),
+    ]
+)
+
+TOP_LEVEL_ITEM_PATTERN = re.compile(rb"- (intent|synonym|regex|lookup):[ \t]*(.*?)[ \t]*\r?\n?")
+# Examples and other list items within an item, which readers skip items without
+ITEM_EXAMPLE_PATTERN = re.compile(rb"[ \t]+- ")
+PLAIN_NAME_PATTERN = re.compile(r"[\w][\w/.\- ]*")
+
+
+def get_key_index_path(target_files_config: Text) -> Text:
+    root, _ = os.path.splitext(target_files_config)
+    return root + KEY_INDEX_SUFFIX
+
+
+def hash_bytes(contents: bytes) -> Text:
+    return hashlib.sha256(contents).hexdigest()
+
+
+def decode_name(raw_name: bytes):
+    """The name of an item from its header line, as YAML reads it; `None` if that isn't a string."""
+    name = raw_name.decode(DEFAULT_ENCODING)
+    if PLAIN_NAME_PATTERN.fullmatch(name):
+        return name.rstrip()
+    try:
+        name = read_yaml(f"name: {name}\n")["name"]
+    except Exception:
+        return None
+    return name if isinstance(name, str) else None
+
+
+def scan_key_blocks(contents: bytes) -> Optional[Dict[Text, Dict[Text, List[dict]]]]:
+    """The blocks of each key per section in a file, or `None` if its layout isn't understood.
+
+    Each block has its `bytes` as [start, end), its `lines` as [first, last] counting
+    from 1, and the `hash` of its bytes.
+    """
+    keys = OrderedDict((section, OrderedDict()) for section in SECTIONS_PER_ITEM_KEY.values())
+    in_nlu = False
+    current = None
+    offset = 0
+    line_number = 0
+
+    def close_block(end, last_line):
+        section, key, start, first_line, has_examples = current
+        if not has_examples:
+            return
+        blocks = keys[section].setdefault(key, [])
+        if blocks and blocks[-1]["bytes"][1] == start:
+            previous = blocks.pop()
+            start, first_line = previous["bytes"][0], previous["lines"][0]
+        blocks.append(
+            {
+                "bytes": [start, end],
+                "lines": [first_line, last_line],
+                "hash": hash_bytes(contents[start:end]),
+            }
+        )
+
+    for line_number, line in enumerate(contents.splitlines(keepends=True), 1):
+        if line[:1] not in b" \t\r\n#":
+            if current is not None:
+                close_block(offset, line_number - 1)
+                current = None
+            if line.startswith(b"- "):
+                match = TOP_LEVEL_ITEM_PATTERN.fullmatch(line)
+                if not in_nlu or match is None:
+                    return None
+                name = decode_name(match.group(2))
+                if name is None:
+                    return None
+                section = SECTIONS_PER_ITEM_KEY[match.group(1).decode()]
+                if section == "intents":
+                    name = separate_intent_response_key(name)[0].strip()
+                current = [section, name, offset, line_number, False]
+            elif line.startswith(b"---") or line.startswith(b"..."):
+                # Several documents
+                return None
+            else:
+                in_nlu = line.rstrip() == b"nlu:"
+        elif current is not None and ITEM_EXAMPLE_PATTERN.match(line):
+            current[4] = True
+        offset += len(line)
+    if current is not None:
+        close_block(offset, line_number)
+    return keys
+
+
+class KeyIndex:
+    """The key index of one target files config, see the module docstring.
+
+    `files` maps each indexed NLU file to its `hash` and its `keys` as returned by
+    `scan_key_blocks`. `enforcement_signature` is set while the files are known to be
+    enforced.
+    """
+
+    def __init__(self, path: Text):
+        self.path = path
+        self.files = OrderedDict()
+        self.enforcement_signature = None
+        self.changed = False
+
+    @classmethod
+    def load(cls, path: Text) -> "KeyIndex":
+        """The index in `path`, or an empty one if there is none or it can't be used."""
+        key_index = cls(path)
+        try:
+            with open(path, encoding=DEFAULT_ENCODING) as f:
+                loaded = json.load(f)
+        except FileNotFoundError:
+            return key_index
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read key index {path}, rebuilding it: {e!r}")
+            return key_index
+        if loaded.get("format_version") != KEY_INDEX_FORMAT_VERSION or loaded.get(
+            "nlu_target_files_version"
+        ) != nlu_target_files.__version__:
+            logger.warning(f"Key index {path} was written by another version; rebuilding it")
+            return key_index
+        key_index.files = OrderedDict(loaded.get("files", {}))
+        key_index.enforcement_signature = loaded.get("enforcement_signature")
+        return key_index
+
+    def as_dict(self):
+        return OrderedDict(
+            [
+                ("format_version", KEY_INDEX_FORMAT_VERSION),
+                ("nlu_target_files_version", nlu_target_files.__version__),
+                ("enforcement_signature", self.enforcement_signature),
+                ("files", self.files),
+            ]
+        )
+
+    def save(self):
+        write_file_atomically(
+            self.path, json.dumps(self.as_dict(), indent=1).encode(DEFAULT_ENCODING)
+        )
+        self.changed = False
+
+    def refresh(self, nlu_files: Iterable[Text]) -> Set[Text]:
+        """Bring the index up to date with `nlu_files`, scanning files whose hash changed.
+
+        Returns the stale files: those that changed, were added or were removed.
+        """
+        nlu_files = list(nlu_files)
+        stale = set(self.files) - set(nlu_files)
+        for filename in stale:
+            del self.files[filename]
+        for filename in nlu_files:
+            with open(filename, "rb") as f:
+                contents = f.read()
+            file_hash = hash_bytes(contents)
+            if self.files.get(filename, {}).get("hash") == file_hash:
+                continue
+            stale.add(filename)
+            self.files[filename] = OrderedDict(
+                [("hash", file_hash), ("keys", scan_key_blocks(contents))]
+            )
+        if stale:
+            self.files = OrderedDict(sorted(self.files.items()))
+            self.changed = True
+        return stale
+
+    def set_enforcement_signature(self, signature: Optional[dict]):
+        if signature != self.enforcement_signature:
+            self.enforcement_signature = signature
+            self.changed = True
+
+    def get_keys_per_file(self) -> Optional[Dict[Text, Dict[Text, List[Text]]]]:
+        """The keys in each file per section, or `None` if some file couldn't be scanned."""
+        if any(entry["keys"] is None for entry in self.files.values()):
+            return None
+        return OrderedDict(
+            (
+                filename,
+                OrderedDict((section, list(keys)) for section, keys in entry["keys"].items()),
+            )
+            for filename, entry in self.files.items()
+        )
+
+    def locate(self, section: Text, key: Text) -> List[tuple]:
+        """The blocks of `key` as (filename, block), in all files that could be scanned."""
+        return [
+            (filename, block)
+            for filename, entry in self.files.items()
+            for block in ((entry["keys"] or {}).get(section, {}).get(key) or [])
+        ]
+
+    def read_block(self, filename: Text, block: dict) -> Optional[bytes]:
+        """The bytes of `block` in `filename`, or `None` if they changed since they were indexed."""
+        start, end = block["bytes"]
+        try:
+            with open(filename, "rb") as f:
+                f.seek(start)
+                contents = f.read(end - start)
+        except OSError:
+            return None
+        if hash_bytes(contents) != block["hash"]:
+            return None
+        return contents
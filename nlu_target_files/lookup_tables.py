@@ -0,0 +1,155 @@
+"""Sorting and storage of very large lookup tables.
+
+By default the elements of each lookup table are sorted in memory with `sorted()`.
+With `LookupOptions`:
+
+- `chunk_size`: tables with more elements are sorted externally, i.e. in sorted runs
+  of at most `chunk_size` elements that are spilled to disk and then merged.
+- `dedupe`: duplicate elements are dropped while sorting.
+- `sidecar_threshold`: tables with more elements are kept in a sidecar text file after
+  sorting instead of in memory (see `LookupSidecar`), and streamed into their target
+  file when it is written.
+
+Rasa 2.x YAML has no way to refer to a lookup table in another file, so sidecars only
+live for the run that creates them; target files always contain the whole table.
+"""
+from collections import namedtuple
+import heapq
+import os
+import re
+import tempfile
+from typing import Iterable, Iterator, List, Optional, Text
+
+LookupOptions = namedtuple("LookupOptions", ["chunk_size", "dedupe", "sidecar_threshold"])
+DEFAULT_LOOKUP_OPTIONS = LookupOptions(None, False, None)
+
+# Runs are merged in several passes if there are more, to stay below open file limits
+MAX_RUNS_PER_MERGE = 128
+
+ESCAPED_CHAR_PATTERN = re.compile(r"\\(.)")
+
+
+def create_lookup_options(
+    chunk_size: Optional[int] = None,
+    dedupe: bool = False,
+    sidecar_threshold: Optional[int] = None,
+) -> LookupOptions:
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError(f"Lookup chunk size must be at least 1, got {chunk_size}")
+    if sidecar_threshold is not None and sidecar_threshold < 0:
+        raise ValueError(f"Lookup sidecar threshold must not be negative, got {sidecar_threshold}")
+    return LookupOptions(chunk_size, dedupe, sidecar_threshold)
+
+
+def encode_element(element: Text) -> Text:
+    """One line of a run or sidecar file; backslashes and newlines are escaped."""
+    if "\\" in element or "\n" in element:
+        element = element.replace("\\", "\\\\").replace("\n", "\\n")
+    return element + "\n"
+
+
+def decode_element(line: Text) -> Text:
+    line = line[:-1]
+    if "\\" not in line:
+        return line
+    return ESCAPED_CHAR_PATTERN.sub(lambda m: "\n" if m.group(1) == "n" else m.group(1), line)
+
+
+def write_elements(elements: Iterable[Text], directory: Text) -> tuple:
+    """Write the elements to a new file in `directory`; returns its path and the number of elements."""
+    fd, path = tempfile.mkstemp(suffix=".txt", dir=directory)
+    count = 0
+    with open(fd, "w", encoding="utf-8", newline="\n") as f:
+        for element in elements:
+            f.write(encode_element(element))
+            count += 1
+    return path, count
+
+
+def read_elements(path: Text) -> Iterator[Text]:
+    with open(path, encoding="utf-8", newline="\n") as f:
+        for line in f:
+            yield decode_element(line)
+
+
+def drop_duplicates(sorted_elements: Iterable[Text]) -> Iterator[Text]:
+    previous = None
+    for element in sorted_elements:
+        if element != previous:
+            yield element
+        previous = element
+
+
+class LookupSidecar:
+    """The sorted elements of a lookup table, kept in a text file instead of in memory.
+
+    The file has one element per line. It can be iterated over any number of times,
+    and is passed to other processes by its path only.
+    """
+
+    def __init__(self, path: Text, count: int):
+        self.path = path
+        self.count = count
+
+    def __iter__(self) -> Iterator[Text]:
+        return read_elements(self.path)
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return f"LookupSidecar({self.path!r}, {self.count})"
+
+
+def spill_sorted_runs(elements: List[Text], chunk_size: int, dedupe: bool, directory: Text) -> List[Text]:
+    runs = []
+    for start in range(0, len(elements), chunk_size):
+        chunk = elements[start : start + chunk_size]
+        run, _ = write_elements(sorted(set(chunk)) if dedupe else sorted(chunk), directory)
+        runs.append(run)
+    return runs
+
+
+def merge_runs(runs: List[Text], dedupe: bool, directory: Text) -> Iterator[Text]:
+    """Merge sorted run files into one sorted stream, deleting each run once it is read."""
+    while len(runs) > MAX_RUNS_PER_MERGE:
+        merged_runs = []
+        for start in range(0, len(runs), MAX_RUNS_PER_MERGE):
+            group = runs[start : start + MAX_RUNS_PER_MERGE]
+            merged_run, _ = write_elements(_merge(group, dedupe), directory)
+            merged_runs.append(merged_run)
+        runs = merged_runs
+    yield from _merge(runs, dedupe)
+
+
+def _merge(runs: List[Text], dedupe: bool) -> Iterator[Text]:
+    try:
+        merged = heapq.merge(*[read_elements(run) for run in runs])
+        yield from drop_duplicates(merged) if dedupe else merged
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+def sort_lookup_elements(elements, options: LookupOptions, get_spill_dir):
+    """The elements of a lookup table sorted as set out in `options`.
+
+    Returns a list, or a `LookupSidecar` for tables above the sidecar threshold.
+    `get_spill_dir` is called for the directory for run and sidecar files only once
+    one is needed.
+    """
+    if options.chunk_size is not None and len(elements) > options.chunk_size:
+        spill_dir = get_spill_dir()
+        sorted_elements = merge_runs(
+            spill_sorted_runs(elements, options.chunk_size, options.dedupe, spill_dir),
+            options.dedupe,
+            spill_dir,
+        )
+    elif options.dedupe:
+        sorted_elements = sorted(set(elements))
+    else:
+        sorted_elements = sorted(elements)
+
+    if options.sidecar_threshold is not None and len(elements) > options.sidecar_threshold:
+        return LookupSidecar(*write_elements(sorted_elements, get_spill_dir()))
+    return list(sorted_elements)
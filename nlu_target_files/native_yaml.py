@@ -0,0 +1,984 @@
+"""Reading and writing of Rasa NLU training data in YAML format without importing Rasa.
+
+This covers intents with their examples (including entity annotations and metadata),
+synonyms, regexes and lookup tables, and mirrors the behaviour of Rasa 2.x's
+`RasaYAMLReader` and `RasaYAMLWriter` closely enough that files written by either
+are byte-identical.
+"""
+from collections import OrderedDict
+from io import StringIO
+from itertools import islice
+import json
+import logging
+import os
+from pathlib import Path
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Text
+
+from ruamel import yaml
+from ruamel.yaml import RoundTripRepresenter
+from ruamel.yaml.scalarstring import DoubleQuotedScalarString, LiteralScalarString
+
+from nlu_target_files.constants import DEFAULT_ENCODING
+
+logger = logging.getLogger(__name__)
+
+KEY_TRAINING_DATA_FORMAT_VERSION = "version"
+LATEST_TRAINING_DATA_FORMAT_VERSION = "2.0"
+KEY_NLU = "nlu"
+KEY_RESPONSES = "responses"
+KEY_INTENT = "intent"
+KEY_INTENT_EXAMPLES = "examples"
+KEY_INTENT_TEXT = "text"
+KEY_SYNONYM = "synonym"
+KEY_SYNONYM_EXAMPLES = "examples"
+KEY_REGEX = "regex"
+KEY_REGEX_EXAMPLES = "examples"
+KEY_LOOKUP = "lookup"
+KEY_LOOKUP_EXAMPLES = "examples"
+KEY_METADATA = "metadata"
+
+TEXT = "text"
+INTENT = "intent"
+INTENT_RESPONSE_KEY = "intent_response_key"
+RESPONSE = "response"
+ENTITIES = "entities"
+METADATA = "metadata"
+METADATA_INTENT = "intent"
+METADATA_EXAMPLE = "example"
+RESPONSE_IDENTIFIER_DELIMITER = "/"
+INTENT_MESSAGE_PREFIX = "/"
+
+ENTITY_ATTRIBUTE_START = "start"
+ENTITY_ATTRIBUTE_END = "end"
+ENTITY_ATTRIBUTE_VALUE = "value"
+ENTITY_ATTRIBUTE_TYPE = "entity"
+ENTITY_ATTRIBUTE_ROLE = "role"
+ENTITY_ATTRIBUTE_GROUP = "group"
+
+YAML_FILE_EXTENSIONS = [".yml", ".yaml"]
+TRAINING_DATA_EXTENSIONS = set([".json", ".md"] + YAML_FILE_EXTENSIONS)
+YAML_VERSION = (1, 2)
+YAML_LINE_MAX_WIDTH = 4096
+
+MULTILINE_TRAINING_EXAMPLE_LEADING_SYMBOL = "-"
+STRIP_SYMBOLS = "\n\r "
+
+ENTITY_REGEX = re.compile(
+    r"\[(?P<entity_text>[^\]]+?)\](\((?P<entity>[^:)]+?)(?:\:(?P<value>[^)]+))?\)|\{(?P<entity_dict>[^}]+?)\}|\[(?P<list_entity_dicts>.*?)\])"  # noqa: E501
+)
+SINGLE_ENTITY_DICT = re.compile(r"{(?P<entity_dict>[^}]+?)\}")
+
+YAML_DIRECTIVE_PATTERN = re.compile(r"^%", re.MULTILINE)
+C_PARSER_UNSUPPORTED_CHARS_PATTERN = re.compile("[\x85\u2028\u2029]")
+
+ESCAPE_DCT = {"\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+ESCAPE = re.compile(f'[{"".join(ESCAPE_DCT.values())}]')
+
+
+class Message:
+    """A training example, holding the same `data` as Rasa's `Message` would."""
+
+    def __init__(self, data: Optional[Dict[Text, Any]] = None):
+        self.data = data if data is not None else {}
+
+    def get(self, prop: Text, default: Any = None) -> Any:
+        return self.data.get(prop, default)
+
+    def set(self, prop: Text, info: Any) -> None:
+        self.data[prop] = info
+
+    def fingerprint(self) -> Text:
+        return json.dumps(self.data, sort_keys=True, default=str)
+
+    def __eq__(self, other: Any) -> bool:
+        if not hasattr(other, "data"):
+            return False
+        return self.fingerprint() == json.dumps(other.data, sort_keys=True, default=str)
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint())
+
+    @classmethod
+    def build(
+        cls,
+        text: Text,
+        intent: Optional[Text] = None,
+        entities: Optional[List[Dict[Text, Any]]] = None,
+        intent_metadata: Optional[Any] = None,
+        example_metadata: Optional[Any] = None,
+    ) -> "Message":
+        data = {TEXT: text}
+        if intent:
+            split_intent, response_key = separate_intent_response_key(intent)
+            if split_intent:
+                data[INTENT] = split_intent
+            if response_key:
+                data[INTENT_RESPONSE_KEY] = intent
+        if entities:
+            data[ENTITIES] = entities
+        if intent_metadata is not None:
+            data[METADATA] = {METADATA_INTENT: intent_metadata}
+        if example_metadata is not None:
+            data.setdefault(METADATA, {})[METADATA_EXAMPLE] = example_metadata
+        return cls(data)
+
+
+class TrainingData:
+    """Holds NLU training data with the same attributes as Rasa's `TrainingData`.
+
+    Like Rasa's, it strips intent names, drops duplicate examples and sorts regexes
+    when it is created.
+    """
+
+    def __init__(
+        self,
+        training_examples: Optional[List[Message]] = None,
+        entity_synonyms: Optional[Dict[Text, Text]] = None,
+        regex_features: Optional[List[Dict[Text, Text]]] = None,
+        lookup_tables: Optional[List[Dict[Text, Any]]] = None,
+        responses: Optional[Dict[Text, List[Dict[Text, Any]]]] = None,
+    ):
+        if training_examples:
+            self.training_examples = self.sanitize_examples(training_examples)
+        else:
+            self.training_examples = []
+        self.entity_synonyms = entity_synonyms or {}
+        self.regex_features = regex_features or []
+        self.sort_regex_features()
+        self.lookup_tables = lookup_tables or []
+        self.responses = responses or {}
+
+    @staticmethod
+    def sanitize_examples(examples):
+        for ex in examples:
+            if ex.get(INTENT):
+                ex.set(INTENT, ex.get(INTENT).strip())
+            if ex.get(RESPONSE):
+                ex.set(RESPONSE, ex.get(RESPONSE).strip())
+        return list(OrderedDict.fromkeys(examples))
+
+    def sort_regex_features(self):
+        self.regex_features = sorted(
+            self.regex_features, key=lambda e: "{}+{}".format(e["name"], e["pattern"])
+        )
+
+
+class UnsupportedNLUDataError(ValueError):
+    """Raised for NLU data that the native YAML reader and writer do not handle."""
+
+
+def separate_intent_response_key(original_intent):
+    split_title = original_intent.split(RESPONSE_IDENTIFIER_DELIMITER)
+    if len(split_title) == 2:
+        return split_title[0], split_title[1]
+    elif len(split_title) == 1:
+        return split_title[0], None
+    raise UnsupportedNLUDataError(
+        f"Intent name '{original_intent}' is invalid, "
+        f"it cannot contain more than one '{RESPONSE_IDENTIFIER_DELIMITER}'."
+    )
+
+
+def check_duplicate_synonym(entity_synonyms, text, syn, context_str=""):
+    if text in entity_synonyms and entity_synonyms[text] != syn:
+        logger.warning(
+            f"Found inconsistent entity synonyms while {context_str}, "
+            f"overwriting {text}->{entity_synonyms[text]} "
+            f"with {text}->{syn} during merge."
+        )
+
+
+def read_yaml(content: Text, pure: bool = True) -> Any:
+    """Parse YAML like Rasa's `read_yaml`.
+
+    Unless `pure`, ruamel's C parser is used if `ruamel.yaml.clib` is installed. It
+    resolves and constructs values the same way, but see `can_use_c_parser`.
+    """
+    if all(ord(character) < 128 for character in content):
+        # Same as Rasa, so that escaped emojis are parsed the same way
+        content = (
+            content.encode("utf-8")
+            .decode("raw_unicode_escape")
+            .encode("utf-16", "surrogatepass")
+            .decode("utf-16")
+        )
+    yaml_parser = yaml.YAML(typ="safe", pure=pure)
+    yaml_parser.version = YAML_VERSION
+    yaml_parser.preserve_quotes = True
+    return yaml_parser.load(content) or {}
+
+
+def can_use_c_parser(content: Text) -> bool:
+    """Whether the C parser gives the same result as the pure one for `content`.
+
+    It ignores `%YAML` directives and handles Unicode line breaks differently.
+    """
+    return not (
+        C_PARSER_UNSUPPORTED_CHARS_PATTERN.search(content)
+        or YAML_DIRECTIVE_PATTERN.search(content)
+    )
+
+
+def read_yaml_file(filename: Text) -> Any:
+    with open(filename, encoding=DEFAULT_ENCODING) as f:
+        return read_yaml(f.read())
+
+
+def convert_to_ordered_dict(obj: Any) -> Any:
+    if isinstance(obj, OrderedDict):
+        return obj
+    if isinstance(obj, list):
+        return [convert_to_ordered_dict(element) for element in obj]
+    if isinstance(obj, dict):
+        return OrderedDict(
+            [(key, convert_to_ordered_dict(value)) for key, value in obj.items()]
+        )
+    return obj
+
+
+def create_yaml_dumper() -> yaml.YAML:
+    """A YAML dumper configured like the one in `rasa.shared.utils.io.write_yaml`."""
+    dumper = yaml.YAML()
+    dumper.representer.add_representer(OrderedDict, RoundTripRepresenter.represent_dict)
+    dumper.width = YAML_LINE_MAX_WIDTH
+    dumper.representer.add_representer(
+        type(None),
+        lambda self, _: self.represent_scalar("tag:yaml.org,2002:null", "null"),
+    )
+    return dumper
+
+
+def dump_obj_as_yaml_to_string(obj: Any, should_preserve_key_order: bool = False) -> Text:
+    """Dump `obj` as YAML the same way `rasa.shared.utils.io.write_yaml` does."""
+    if should_preserve_key_order:
+        obj = convert_to_ordered_dict(obj)
+    stream = StringIO()
+    create_yaml_dumper().dump(obj, stream)
+    return stream.getvalue()
+
+
+def is_key_in_yaml(filename: Text, *keys: Text) -> bool:
+    with open(filename, encoding=DEFAULT_ENCODING) as f:
+        return any(
+            any(line.lstrip().startswith(f"{key}:") for key in keys) for line in f
+        )
+
+
+def is_nlu_file(filename: Text) -> bool:
+    """Whether `filename` is a YAML file with NLU data, using the same heuristic as Rasa."""
+    if Path(filename).suffix not in YAML_FILE_EXTENSIONS:
+        return False
+    return is_key_in_yaml(filename, KEY_NLU, KEY_RESPONSES)
+
+
+MARKDOWN_NLU_SECTION_PATTERN = re.compile(r"\s*##\s*(intent|synonym|regex|lookup):")
+KEY_RASA_NLU_DATA = "rasa_nlu_data"
+
+
+def is_nlu_file_in_other_format(filename: Text) -> bool:
+    """Whether `filename` is a Markdown or JSON file with NLU data, which only Rasa can read.
+
+    Like Rasa, Markdown files are NLU data if they have an intent, synonym, regex or
+    lookup section, and JSON files if they have `rasa_nlu_data`.
+    """
+    suffix = Path(filename).suffix
+    if suffix == ".md":
+        with open(filename, encoding=DEFAULT_ENCODING) as f:
+            return any(MARKDOWN_NLU_SECTION_PATTERN.match(line) for line in f)
+    if suffix == ".json":
+        with open(filename, encoding=DEFAULT_ENCODING) as f:
+            return KEY_RASA_NLU_DATA in f.read()
+    return False
+
+
+def get_nlu_files(nlu_data_path: Text) -> List[Text]:
+    """Collect NLU files like `rasa.shared.data.get_data_files` with `is_nlu_file` would.
+
+    Only YAML files are supported. Raises `UnsupportedNLUDataError` for NLU data in
+    other formats, rather than leaving it out of enforcement.
+    """
+    unsupported_files = []
+
+    def is_training_data_file(path):
+        return os.path.isfile(path) and Path(path).suffix in TRAINING_DATA_EXTENSIONS
+
+    def check(path):
+        if is_nlu_file(path):
+            return True
+        if is_nlu_file_in_other_format(path):
+            unsupported_files.append(path)
+        return False
+
+    if is_training_data_file(nlu_data_path):
+        nlu_files = set([os.path.abspath(nlu_data_path)] if check(nlu_data_path) else [])
+    else:
+        nlu_files = set()
+        for root, _, files in os.walk(nlu_data_path, followlinks=True):
+            for f in sorted(files):
+                full_path = os.path.join(root, f)
+                if is_training_data_file(full_path) and check(full_path):
+                    nlu_files.add(full_path)
+    if unsupported_files:
+        raise UnsupportedNLUDataError(
+            f"Only YAML NLU data can be read without Rasa, found {', '.join(sorted(unsupported_files))}. "
+            f"Install Rasa and use `--yaml_backend rasa` (or `auto`) for Markdown or JSON NLU data."
+        )
+    return sorted(nlu_files)
+
+
+def _build_entity(start, end, value, entity_type, role=None, group=None):
+    entity = {
+        ENTITY_ATTRIBUTE_START: start,
+        ENTITY_ATTRIBUTE_END: end,
+        ENTITY_ATTRIBUTE_VALUE: value,
+        ENTITY_ATTRIBUTE_TYPE: entity_type,
+    }
+    if role:
+        entity[ENTITY_ATTRIBUTE_ROLE] = role
+    if group:
+        entity[ENTITY_ATTRIBUTE_GROUP] = group
+    return entity
+
+
+def _parse_entity_dict(entity_text, entity_dict_str):
+    try:
+        entity_dict = json.loads(f"{{{entity_dict_str}}}")
+    except ValueError as e:
+        raise UnsupportedNLUDataError(
+            f"Incorrect training data format ('{{{entity_dict_str}}}')."
+        ) from e
+    return (
+        entity_dict.get(ENTITY_ATTRIBUTE_TYPE),
+        entity_dict.get(ENTITY_ATTRIBUTE_VALUE, entity_text),
+        entity_dict.get(ENTITY_ATTRIBUTE_ROLE),
+        entity_dict.get(ENTITY_ATTRIBUTE_GROUP),
+    )
+
+
+def find_entities_in_training_example(example: Text) -> List[Dict[Text, Any]]:
+    """Extract entities from an annotated example, as Rasa's `entities_parser` does."""
+    entities = []
+    offset = 0
+    for match in re.finditer(ENTITY_REGEX, example):
+        groups = match.groupdict()
+        entity_text = groups["entity_text"]
+        start_index = match.start() - offset
+        end_index = start_index + len(entity_text)
+        offset += len(match.group(0)) - len(entity_text)
+
+        if groups["entity_dict"] or groups["entity"]:
+            if groups["entity_dict"]:
+                entity_type, value, role, group = _parse_entity_dict(
+                    entity_text, groups["entity_dict"]
+                )
+            else:
+                entity_type = groups["entity"]
+                value = groups["value"] or entity_text
+                role, group = None, None
+            entities.append(
+                _build_entity(start_index, end_index, value, entity_type, role, group)
+            )
+        else:
+            for match_inner in re.finditer(SINGLE_ENTITY_DICT, groups["list_entity_dicts"]):
+                entity_type, value, role, group = _parse_entity_dict(
+                    entity_text, match_inner.groupdict()["entity_dict"]
+                )
+                entities.append(
+                    _build_entity(start_index, end_index, value, entity_type, role, group)
+                )
+    return entities
+
+
+def replace_entities(example: Text) -> Text:
+    return re.sub(ENTITY_REGEX, lambda m: m.groupdict()["entity_text"], example)
+
+
+def _is_supported_version(version_value) -> bool:
+    try:
+        parsed_version = tuple(int(part) for part in str(version_value).split("."))
+    except ValueError:
+        return False
+    latest = tuple(int(part) for part in LATEST_TRAINING_DATA_FORMAT_VERSION.split("."))
+    return isinstance(version_value, str) and parsed_version <= latest
+
+
+class NativeYAMLReader:
+    """Reads NLU training data from a YAML file like Rasa's `RasaYAMLReader`."""
+
+    def __init__(self):
+        self.filename = ""
+        self.training_examples = []
+        self.entity_synonyms = {}
+        self.regex_features = []
+        self.lookup_tables = []
+        self.responses = {}
+
+    def read(self, filename: Text) -> TrainingData:
+        self.filename = filename
+        with open(filename, encoding=DEFAULT_ENCODING) as f:
+            return self.reads(f.read())
+
+    def load_yaml(self, string: Text) -> Any:
+        return read_yaml(string)
+
+    def reads(self, string: Text) -> TrainingData:
+        yaml_content = self.load_yaml(string)
+        if not isinstance(yaml_content, dict):
+            raise UnsupportedNLUDataError(
+                f"YAML content in {self.filename} is not a mapping."
+            )
+
+        version_value = yaml_content.get(KEY_TRAINING_DATA_FORMAT_VERSION)
+        if version_value and not _is_supported_version(version_value):
+            logger.warning(
+                f"Training data file {self.filename} has an unsupported "
+                f"'{KEY_TRAINING_DATA_FORMAT_VERSION}' and will be skipped."
+            )
+            return TrainingData()
+
+        for key, value in yaml_content.items():
+            if key == KEY_NLU:
+                self._parse_nlu(value)
+            elif key == KEY_RESPONSES:
+                self.responses = value
+
+        return TrainingData(
+            self.training_examples,
+            self.entity_synonyms,
+            self.regex_features,
+            self.lookup_tables,
+            self.responses,
+        )
+
+    def _warn(self, message):
+        logger.warning(f"Issue found while processing '{self.filename}': {message}")
+
+    def _parse_nlu(self, nlu_data):
+        if not nlu_data:
+            return
+        for nlu_item in nlu_data:
+            if not isinstance(nlu_item, dict):
+                self._warn(f"Items under the '{KEY_NLU}' key must be YAML dictionaries; skipping {nlu_item}")
+                continue
+            if KEY_INTENT in nlu_item.keys():
+                self._parse_intent(nlu_item)
+            elif KEY_SYNONYM in nlu_item.keys():
+                self._parse_synonym(nlu_item)
+            elif KEY_REGEX in nlu_item.keys():
+                self._parse_regex(nlu_item)
+            elif KEY_LOOKUP in nlu_item.keys():
+                self._parse_lookup(nlu_item)
+            else:
+                self._warn(f"Could not find supported key in the section {nlu_item}; skipping it")
+
+    def _parse_intent(self, intent_data):
+        intent = intent_data.get(KEY_INTENT, "")
+        if not intent:
+            self._warn("The intent has an empty name. It will be skipped.")
+            return
+
+        examples = intent_data.get(KEY_INTENT_EXAMPLES, "")
+        intent_metadata = intent_data.get(KEY_METADATA)
+        for example, entities, metadata in self._parse_training_examples(examples, intent):
+            plain_text = replace_entities(example)
+            self._add_inline_synonyms(plain_text, entities)
+            self.training_examples.append(
+                Message.build(plain_text, intent, entities, intent_metadata, metadata)
+            )
+
+    def _add_inline_synonyms(self, plain_text, entities):
+        """Entity annotations with a value other than their text define synonyms as well."""
+        for entity in entities:
+            entity_text = plain_text[entity[ENTITY_ATTRIBUTE_START] : entity[ENTITY_ATTRIBUTE_END]]
+            if entity_text != entity[ENTITY_ATTRIBUTE_VALUE]:
+                self._add_synonym(entity_text, entity[ENTITY_ATTRIBUTE_VALUE])
+
+    def _parse_training_examples(self, examples, intent):
+        return [
+            (example, find_entities_in_training_example(example), metadata)
+            for example, metadata in self._get_example_tuples(examples, intent)
+        ]
+
+    def _get_example_tuples(self, examples, intent):
+        """The text and metadata of each example of an intent, with annotations."""
+        if isinstance(examples, list):
+            example_tuples = [
+                (
+                    example.get(KEY_INTENT_TEXT, "").strip(STRIP_SYMBOLS),
+                    example.get(KEY_METADATA),
+                )
+                for example in examples
+                if example
+            ]
+        elif isinstance(examples, str):
+            example_tuples = [
+                (example, None)
+                for example in self._parse_multiline_example(intent, examples)
+            ]
+        else:
+            self._warn(f"Unexpected block found while processing intent '{intent}'; skipping it")
+            return []
+
+        if not example_tuples:
+            self._warn(f"Intent '{intent}' has no examples.")
+        return example_tuples
+
+    def _get_multiline_examples(self, key, nlu_item):
+        name = nlu_item[key]
+        if not name:
+            self._warn(f"The {key} has an empty name. It will be skipped.")
+            return name, []
+        examples = nlu_item.get(KEY_INTENT_EXAMPLES, "")
+        if not examples:
+            self._warn(f"'{key}: {name}' doesn't have any examples. It will be skipped.")
+            return name, []
+        if not isinstance(examples, str):
+            self._warn(f"Unexpected block found for '{key}: {name}'; skipping it")
+            return name, []
+        return name, self._parse_multiline_example(name, examples)
+
+    def _add_synonym(self, synonym_value, synonym_name):
+        check_duplicate_synonym(self.entity_synonyms, synonym_value, synonym_name, "reading YAML")
+        self.entity_synonyms[synonym_value] = synonym_name
+
+    def _parse_synonym(self, nlu_item):
+        synonym_name, examples = self._get_multiline_examples(KEY_SYNONYM, nlu_item)
+        for example in examples:
+            self._add_synonym(example, synonym_name)
+
+    def _parse_regex(self, nlu_item):
+        regex_name, examples = self._get_multiline_examples(KEY_REGEX, nlu_item)
+        for example in examples:
+            self.regex_features.append({"name": regex_name, "pattern": example})
+
+    def _parse_lookup(self, nlu_item):
+        lookup_name, examples = self._get_multiline_examples(KEY_LOOKUP, nlu_item)
+        for example in examples:
+            matches = [table for table in self.lookup_tables if table["name"] == lookup_name]
+            if not matches:
+                self.lookup_tables.append({"name": lookup_name, "elements": [example]})
+            else:
+                matches[0]["elements"].append(example)
+
+    def _parse_multiline_example(self, item, examples):
+        for example in examples.splitlines():
+            if not example.startswith(MULTILINE_TRAINING_EXAMPLE_LEADING_SYMBOL):
+                self._warn(
+                    f"The item '{item}' contains an example that doesn't start with a "
+                    f"'{MULTILINE_TRAINING_EXAMPLE_LEADING_SYMBOL}' symbol: {example}\n"
+                    f"This training example will be skipped."
+                )
+                continue
+            yield example[1:].strip(STRIP_SYMBOLS)
+
+
+def read_nlu_file(filename: Text) -> TrainingData:
+    return NativeYAMLReader().read(filename)
+
+
+class KeyScanner(NativeYAMLReader):
+    """Finds the keys (intent, synonym, regex and lookup names) in a YAML NLU file.
+
+    Gives the same keys as `training_data.get_keys_present` does for the data read by
+    `NativeYAMLReader`, with the same warnings, but doesn't build examples, regexes or
+    lookup tables. Only annotated examples are parsed, for the synonyms they define.
+    The YAML is parsed with ruamel's C parser where possible.
+
+    Intents that only a full read handles the same way set `needs_full_parse`. Unless
+    `inline_synonyms`, only synonyms listed under `synonym:` are included.
+    """
+
+    def __init__(self, inline_synonyms: bool = True):
+        super().__init__()
+        self.inline_synonyms = inline_synonyms
+        self.intents = OrderedDict()
+        self.regex_names = set()
+        self.lookup_names = set()
+        self.needs_full_parse = False
+
+    def load_yaml(self, string: Text) -> Any:
+        if can_use_c_parser(string):
+            try:
+                return read_yaml(string, pure=False)
+            except Exception:
+                # Fall through, so that errors are the same as when reading the file
+                pass
+        return read_yaml(string)
+
+    def _parse_intent(self, intent_data):
+        intent = intent_data.get(KEY_INTENT, "")
+        if not intent:
+            self._warn("The intent has an empty name. It will be skipped.")
+            return
+
+        example_tuples = self._get_example_tuples(intent_data.get(KEY_INTENT_EXAMPLES, ""), intent)
+        if not example_tuples:
+            return
+        if not isinstance(intent, str) or not separate_intent_response_key(intent)[0]:
+            self.needs_full_parse = True
+            return
+        self.intents[separate_intent_response_key(intent)[0].strip()] = None
+        if not self.inline_synonyms:
+            return
+        for example, _ in example_tuples:
+            # Entity annotations always start with "["
+            if "[" in example:
+                self._add_inline_synonyms(
+                    replace_entities(example), find_entities_in_training_example(example)
+                )
+
+    @staticmethod
+    def has_examples(examples) -> bool:
+        # Go through all examples, to warn about each invalid one like a full read does
+        has_examples = False
+        for _ in examples:
+            has_examples = True
+        return has_examples
+
+    def _parse_regex(self, nlu_item):
+        regex_name, examples = self._get_multiline_examples(KEY_REGEX, nlu_item)
+        if self.has_examples(examples):
+            self.regex_names.add(regex_name)
+
+    def _parse_lookup(self, nlu_item):
+        lookup_name, examples = self._get_multiline_examples(KEY_LOOKUP, nlu_item)
+        if self.has_examples(examples):
+            self.lookup_names.add(lookup_name)
+
+    def scan(self, filename: Text) -> Optional[Dict[Text, List[Text]]]:
+        """The keys in the file per section, or `None` if the file needs to be read fully."""
+        self.read(filename)
+        if self.needs_full_parse:
+            return None
+        return {
+            "intents": list(self.intents),
+            "synonyms": sorted(list(set(self.entity_synonyms.values()))),
+            "regexes": sorted(list(self.regex_names)),
+            "lookups": sorted(list(self.lookup_names)),
+        }
+
+
+def scan_nlu_file_keys(
+    filename: Text, inline_synonyms: bool = True
+) -> Optional[Dict[Text, List[Text]]]:
+    return KeyScanner(inline_synonyms).scan(filename)
+
+
+def encode_string(s: Text) -> Text:
+    return ESCAPE.sub(lambda match: ESCAPE_DCT[match.group(0)], s)
+
+
+def has_string_escape_chars(s: Text) -> bool:
+    return len(set(ESCAPE_DCT.keys()).intersection(set(s))) > 0
+
+
+class NativeYAMLWriter:
+    """Writes NLU training data to YAML exactly like Rasa's `RasaYAMLWriter`."""
+
+    def dumps(self, training_data) -> Text:
+        result = self.training_data_to_dict(training_data)
+        if not result:
+            return ""
+        return dump_obj_as_yaml_to_string(result, should_preserve_key_order=True)
+
+    @classmethod
+    def training_data_to_dict(cls, training_data) -> Optional[OrderedDict]:
+        if training_data.responses:
+            raise UnsupportedNLUDataError(
+                "Writing responses is not supported without Rasa installed."
+            )
+
+        nlu_items = []
+        nlu_items.extend(cls.process_intents(training_data))
+        nlu_items.extend(cls.process_synonyms(training_data))
+        nlu_items.extend(cls.process_regexes(training_data))
+        nlu_items.extend(cls.process_lookup_tables(training_data))
+        if not nlu_items:
+            return None
+
+        result = OrderedDict()
+        result[KEY_TRAINING_DATA_FORMAT_VERSION] = DoubleQuotedScalarString(
+            LATEST_TRAINING_DATA_FORMAT_VERSION
+        )
+        result[KEY_NLU] = nlu_items
+        return result
+
+    @staticmethod
+    def prepare_training_example(message) -> Optional[Dict[Text, Any]]:
+        """The example as a dict keyed by its full intent name, or `None` if it has no intent."""
+        example = {key: value for key, value in message.data.items() if value is not None}
+        if not example.get(INTENT):
+            return None
+        example[INTENT] = example.get(INTENT_RESPONSE_KEY) or example[INTENT]
+        example.pop(RESPONSE, None)
+        example.pop(INTENT_RESPONSE_KEY, None)
+        return example
+
+    @classmethod
+    def prepare_training_examples(cls, training_examples) -> OrderedDict:
+        examples_per_intent = OrderedDict()
+        for message in training_examples:
+            example = cls.prepare_training_example(message)
+            if example is not None:
+                examples_per_intent.setdefault(example[INTENT], []).append(example)
+        return examples_per_intent
+
+    @classmethod
+    def process_intents(cls, training_data) -> List[OrderedDict]:
+        return cls.process_training_examples_by_key(
+            cls.prepare_training_examples(training_data.training_examples),
+            KEY_INTENT,
+            KEY_INTENT_EXAMPLES,
+            generate_message,
+        )
+
+    @classmethod
+    def process_synonyms(cls, training_data) -> List[OrderedDict]:
+        inverted_synonyms = OrderedDict()
+        for example, synonym in training_data.entity_synonyms.items():
+            inverted_synonyms.setdefault(synonym, []).append(example)
+        return cls.process_training_examples_by_key(
+            inverted_synonyms, KEY_SYNONYM, KEY_SYNONYM_EXAMPLES
+        )
+
+    @classmethod
+    def process_regexes(cls, training_data) -> List[OrderedDict]:
+        inverted_regexes = OrderedDict()
+        for regex in training_data.regex_features:
+            inverted_regexes.setdefault(regex["name"], []).append(regex["pattern"])
+        return cls.process_training_examples_by_key(
+            inverted_regexes, KEY_REGEX, KEY_REGEX_EXAMPLES
+        )
+
+    @classmethod
+    def process_lookup_tables(cls, training_data) -> List[OrderedDict]:
+        prepared_lookup_tables = OrderedDict()
+        for lookup_table in training_data.lookup_tables:
+            # this is a lookup table filename
+            if isinstance(lookup_table["elements"], str):
+                continue
+            prepared_lookup_tables[lookup_table["name"]] = lookup_table["elements"]
+        return cls.process_training_examples_by_key(
+            prepared_lookup_tables, KEY_LOOKUP, KEY_LOOKUP_EXAMPLES
+        )
+
+    @classmethod
+    def process_training_examples_by_key(
+        cls, training_examples, key_name, key_examples, example_extraction_predicate=lambda x: x
+    ) -> List[OrderedDict]:
+        return [
+            cls.build_item(
+                key_name,
+                key_examples,
+                name,
+                examples,
+                get_example_texts(examples, example_extraction_predicate),
+            )
+            for name, examples in training_examples.items()
+        ]
+
+    @staticmethod
+    def get_intent_metadata(examples):
+        intent_metadata = None
+        for example in examples:
+            if isinstance(example, dict) and KEY_METADATA in example:
+                if intent_metadata is None and METADATA_INTENT in example[KEY_METADATA]:
+                    intent_metadata = example[KEY_METADATA][METADATA_INTENT]
+        return intent_metadata
+
+    @staticmethod
+    def has_example_metadata(example) -> bool:
+        return (
+            isinstance(example, dict)
+            and KEY_METADATA in example
+            and METADATA_EXAMPLE in example[KEY_METADATA]
+        )
+
+    @classmethod
+    def uses_example_objects(cls, examples, texts) -> bool:
+        """Whether the examples are written as a list of objects instead of one block of text."""
+        return any(cls.has_example_metadata(ex) for ex in examples) or any(
+            has_string_escape_chars(text) for text in texts
+        )
+
+    @classmethod
+    def build_item(cls, key_name, key_examples, name, examples, texts) -> OrderedDict:
+        """The YAML structure of one intent, synonym, regex or lookup with the given example texts."""
+        item = OrderedDict()
+        item[key_name] = name
+        intent_metadata = cls.get_intent_metadata(examples)
+        if intent_metadata:
+            item[KEY_METADATA] = intent_metadata
+
+        if cls.uses_example_objects(examples, texts):
+            converted = []
+            for example, text in zip(examples, texts):
+                converted_example = {KEY_INTENT_TEXT: LiteralScalarString(text + "\n")}
+                if cls.has_example_metadata(example):
+                    converted_example[KEY_METADATA] = example[KEY_METADATA][METADATA_EXAMPLE]
+                converted.append(converted_example)
+            item[key_examples] = converted
+        else:
+            item[key_examples] = LiteralScalarString(
+                "".join([f"- {encode_string(text)}\n" for text in texts])
+            )
+        return item
+
+
+def get_example_texts(examples, example_extraction_predicate=lambda x: x) -> List[Text]:
+    return [example_extraction_predicate(example).strip(STRIP_SYMBOLS) for example in examples]
+
+
+def iter_example_texts(examples, example_extraction_predicate=lambda x: x) -> Iterator[Text]:
+    return (example_extraction_predicate(example).strip(STRIP_SYMBOLS) for example in examples)
+
+
+class StreamingYAMLWriter:
+    """Writes NLU data to a text stream one item (intent, synonym, ...) at a time.
+
+    The output is byte-identical to `NativeYAMLWriter.dumps` for the same items, but
+    neither the whole document nor the rendered examples of an item are held in memory:
+    examples written as a plain block of text are written line by line.
+
+    Examples may also be given as an iterable that isn't a list, e.g. a lookup table
+    kept in a `lookup_tables.LookupSidecar`. These are iterated over once to find out
+    whether they can be written line by line and once more to write them.
+    """
+
+    PLACEHOLDER_EXAMPLE = "x"
+    # Characters that ruamel treats as line breaks in block scalars, besides "\n"
+    SPECIAL_LINE_BREAKS = "\x85\u2028\u2029"
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.dumper = create_yaml_dumper()
+        self.items_written = 0
+
+    def render(self, obj) -> Text:
+        stream = StringIO()
+        self.dumper.dump(convert_to_ordered_dict(obj), stream)
+        return stream.getvalue()
+
+    def write_item(
+        self, key_name, key_examples, name, examples, example_extraction_predicate=lambda x: x
+    ):
+        if self.items_written == 0:
+            self.stream.write(
+                f'{KEY_TRAINING_DATA_FORMAT_VERSION}: "{LATEST_TRAINING_DATA_FORMAT_VERSION}"\n'
+                f"{KEY_NLU}:\n"
+            )
+        self.items_written += 1
+
+        if not isinstance(examples, list) and self.can_write_line_by_line(
+            # Only lookup tables are given this way, whose examples are plain strings
+            [], iter_example_texts(examples, example_extraction_predicate)
+        ):
+            self.write_block(
+                key_name,
+                key_examples,
+                name,
+                list(islice(examples, 1)),
+                iter_example_texts(examples, example_extraction_predicate),
+            )
+            return
+
+        if not isinstance(examples, list):
+            examples = list(examples)
+        texts = get_example_texts(examples, example_extraction_predicate)
+        if not self.can_write_line_by_line(examples, texts):
+            self.dumper.dump(
+                [
+                    convert_to_ordered_dict(
+                        NativeYAMLWriter.build_item(key_name, key_examples, name, examples, texts)
+                    )
+                ],
+                self.stream,
+            )
+            return
+        self.write_block(key_name, key_examples, name, examples[:1], texts)
+
+    def can_write_line_by_line(self, examples, texts: Iterable[Text]) -> bool:
+        """Whether the texts can be written as a plain block of text, i.e. as `write_block` does."""
+        has_texts = False
+        for text in texts:
+            if has_string_escape_chars(text) or any(
+                char in text for char in self.SPECIAL_LINE_BREAKS
+            ):
+                return False
+            has_texts = True
+        return has_texts and not any(
+            NativeYAMLWriter.has_example_metadata(example) for example in examples
+        )
+
+    def write_block(self, key_name, key_examples, name, first_examples, texts: Iterable[Text]):
+        # Let ruamel render everything up to the examples, using a placeholder example
+        # to find where the examples start.
+        rendered = self.render(
+            [
+                NativeYAMLWriter.build_item(
+                    key_name, key_examples, name, first_examples, [self.PLACEHOLDER_EXAMPLE]
+                )
+            ]
+        )
+        placeholder_line = f"- {self.PLACEHOLDER_EXAMPLE}\n"
+        header, _, indentation = rendered[: -len(placeholder_line)].rpartition("\n")
+        assert rendered.endswith(placeholder_line) and not indentation.strip()
+        self.stream.write(header + "\n")
+        for text in texts:
+            self.stream.write(f"{indentation}- {text}\n")
+
+
+def _generate_entity_attributes(entity_text, entity, short_allowed=True):
+    entity_type = entity.get(ENTITY_ATTRIBUTE_TYPE)
+    entity_value = entity.get(ENTITY_ATTRIBUTE_VALUE)
+    entity_role = entity.get(ENTITY_ATTRIBUTE_ROLE)
+    entity_group = entity.get(ENTITY_ATTRIBUTE_GROUP)
+
+    if entity_value and entity_value == entity_text:
+        entity_value = None
+
+    if short_allowed and entity_value is None and entity_role is None and entity_group is None:
+        return f"({entity_type})"
+
+    entity_dict = OrderedDict(
+        [
+            (ENTITY_ATTRIBUTE_TYPE, entity_type),
+            (ENTITY_ATTRIBUTE_ROLE, entity_role),
+            (ENTITY_ATTRIBUTE_GROUP, entity_group),
+            (ENTITY_ATTRIBUTE_VALUE, entity_value),
+        ]
+    )
+    return json.dumps(OrderedDict([(k, v) for k, v in entity_dict.items() if v is not None]))
+
+
+def generate_message(message: Dict[Text, Any]) -> Text:
+    """Example text with its entity annotations, as written by Rasa."""
+    md = ""
+    text = message.get(TEXT, "")
+    pos = 0
+    if not text.startswith(INTENT_MESSAGE_PREFIX):
+        entities_per_start = OrderedDict()
+        for entity in message.get(ENTITIES, []):
+            if ENTITY_ATTRIBUTE_START in entity and ENTITY_ATTRIBUTE_END in entity:
+                entities_per_start.setdefault(entity[ENTITY_ATTRIBUTE_START], []).append(entity)
+
+        for start, entities in sorted(entities_per_start.items()):
+            entity_text = text[start : entities[0][ENTITY_ATTRIBUTE_END]]
+            md += text[pos:start]
+            if len(entities) == 1:
+                md += f"[{entity_text}]" + _generate_entity_attributes(entity_text, entities[0])
+            else:
+                md += (
+                    f"[{entity_text}]["
+                    + ", ".join(
+                        [
+                            _generate_entity_attributes(entity_text, e, short_allowed=False)
+                            for e in entities
+                        ]
+                    )
+                    + "]"
+                )
+            pos = entities[0][ENTITY_ATTRIBUTE_END]
+    md += text[pos:]
+    return md
@@ -0,0 +1,209 @@
+"""Per-phase timing and memory measurements, enabled with `--profile`.
+
+Code marks its phases with `profile_phase`, which does nothing unless a `PhaseProfiler`
+is active. Phases may be nested; each phase is only charged for the time spent in it
+outside of nested phases. Memory is measured as the peak resident set size of the main
+process, which is cheap to measure: for each phase, the peak reached by its end and how
+much the peak grew while it ran. Worker processes aren't included.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import os
+import sys
+import time
+from typing import Optional, Text
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_OUTPUT = "nlu_target_files_profile.json"
+# Phases for which a cProfile dump is written if requested
+HOT_PHASES = ["parsing", "sorting", "partitioning", "rendering", "rendering_and_writing"]
+
+_active_profiler = None
+
+
+def get_peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak_rss / (1024 * 1024)
+    return peak_rss / 1024
+
+
+class PhaseStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_rss_mb = 0.0
+        self.rss_growth_mb = 0.0
+
+    def as_dict(self):
+        return OrderedDict(
+            [
+                ("name", self.name),
+                ("calls", self.calls),
+                ("wall_time_s", round(self.wall_time, 4)),
+                ("cpu_time_s", round(self.cpu_time, 4)),
+                ("peak_rss_mb", round(self.peak_rss_mb, 1)),
+                ("rss_growth_mb", round(self.rss_growth_mb, 1)),
+            ]
+        )
+
+
+class PhaseProfiler:
+    def __init__(self, command: Text, cprofile_dir: Optional[Text] = None):
+        self.command = command
+        self.cprofile_dir = cprofile_dir
+        self.phases = OrderedDict()
+        self.cprofiles = OrderedDict()
+        # Stack of [phase stats, start of the current segment (wall, cpu, peak RSS)]
+        self.stack = []
+        self.start_wall_time = time.perf_counter()
+        self.end_wall_time = None
+
+    @staticmethod
+    def _measure():
+        return time.perf_counter(), time.process_time(), get_peak_rss_mb()
+
+    def _charge(self, stats, segment_start, now):
+        stats.wall_time += now[0] - segment_start[0]
+        stats.cpu_time += now[1] - segment_start[1]
+        stats.rss_growth_mb += now[2] - segment_start[2]
+        stats.peak_rss_mb = max(stats.peak_rss_mb, now[2])
+
+    @contextmanager
+    def phase(self, name: Text):
+        now = self._measure()
+        if self.stack:
+            outer_stats, outer_start = self.stack[-1]
+            self._charge(outer_stats, outer_start, now)
+        stats = self.phases.setdefault(name, PhaseStats(name))
+        stats.calls += 1
+        self.stack.append([stats, now])
+        cprofile = self._start_cprofile(name)
+        try:
+            yield
+        finally:
+            if cprofile is not None:
+                cprofile.disable()
+            now = self._measure()
+            _, start = self.stack.pop()
+            self._charge(stats, start, now)
+            if self.stack:
+                self.stack[-1][1] = now
+
+    def _start_cprofile(self, name):
+        if not self.cprofile_dir or name not in HOT_PHASES:
+            return None
+        # Only one profiler can be enabled at a time, so nested hot phases are
+        # included in the outer one.
+        if any(stats.name in HOT_PHASES for stats, _ in self.stack[:-1]):
+            return None
+        import cProfile
+
+        cprofile = self.cprofiles.setdefault(name, cProfile.Profile())
+        cprofile.enable()
+        return cprofile
+
+    def stop(self):
+        self.end_wall_time = time.perf_counter()
+
+    @property
+    def total_wall_time(self):
+        return (self.end_wall_time or time.perf_counter()) - self.start_wall_time
+
+    def as_dict(self):
+        return OrderedDict(
+            [
+                ("command", self.command),
+                ("total_wall_time_s", round(self.total_wall_time, 4)),
+                ("peak_rss_mb", round(get_peak_rss_mb(), 1)),
+                ("phases", [stats.as_dict() for stats in self.phases.values()]),
+            ]
+        )
+
+    def write_json(self, filename: Text):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def dump_cprofiles(self):
+        """Write the collected cProfile stats per phase to `<cprofile_dir>/<phase>.prof`."""
+        if not self.cprofiles:
+            return []
+        os.makedirs(self.cprofile_dir, exist_ok=True)
+        filenames = []
+        for name, cprofile in self.cprofiles.items():
+            filename = os.path.join(self.cprofile_dir, f"{name}.prof")
+            cprofile.dump_stats(filename)
+            filenames.append(filename)
+        return filenames
+
+    def format_table(self):
+        lines = [
+            f"{'phase':<24} {'calls':>6} {'wall (s)':>10} {'cpu (s)':>10} {'peak RSS (MB)':>14} {'growth (MB)':>12}"
+        ]
+        lines.append("-" * len(lines[0]))
+        for stats in self.phases.values():
+            lines.append(
+                f"{stats.name:<24} {stats.calls:>6} {stats.wall_time:>10.3f} {stats.cpu_time:>10.3f} "
+                f"{stats.peak_rss_mb:>14.1f} {stats.rss_growth_mb:>12.1f}"
+            )
+        other_time = self.total_wall_time - sum(stats.wall_time for stats in self.phases.values())
+        lines.append(f"{'other':<24} {'':>6} {other_time:>10.3f}")
+        lines.append(
+            f"{'total':<24} {'':>6} {self.total_wall_time:>10.3f} {'':>10} {get_peak_rss_mb():>14.1f}"
+        )
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile_phase(name: Text):
+    """Attribute the time and memory spent in this block to phase `name`, if profiling."""
+    if _active_profiler is None:
+        yield
+        return
+    with _active_profiler.phase(name):
+        yield
+
+
+@contextmanager
+def profiling(
+    enabled: bool,
+    command: Text,
+    output: Text = DEFAULT_PROFILE_OUTPUT,
+    cprofile_dir: Optional[Text] = None,
+):
+    """Profile the phases run in this block if `enabled`, then write and log the results."""
+    global _active_profiler
+    if not enabled:
+        yield None
+        return
+    profiler = PhaseProfiler(command, cprofile_dir)
+    _active_profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active_profiler = None
+        profiler.stop()
+        profiler.write_json(output)
+        logger.warning(f"Profile of `{command}`:\n{profiler.format_table()}")
+        logger.warning(f"Profile written to {output}")
+        for filename in profiler.dump_cprofiles():
+            logger.warning(f"cProfile stats written to {filename}")
+
+
+def disable_profiling():
+    """Process pool initializer, so that worker processes forked while profiling don't profile."""
+    global _active_profiler
+    _active_profiler = None
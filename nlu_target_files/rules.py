@@ -0,0 +1,187 @@
+"""Pattern rules that assign keys to target files, e.g. all `faq_...` intents to one file.
+
+Rules are listed per section under `target_file_rules` in the target files config,
+each with one of `prefix`, `glob` or `regex` and a `target_file`:
+
+    target_file_rules:
+      intents:
+        - prefix: faq_
+          target_file: data/nlu/faq.yml
+        - glob: chitchat_*
+          target_file: data/nlu/chitchat.yml
+        - regex: ask_(name|age)
+          target_file: data/nlu/ask.yml
+
+Keys explicitly listed under `target_files` take priority over rules. Otherwise the
+first rule that matches a key applies; globs and regexes have to match the whole key.
+Keys that match no rule go to the default target file of their section.
+
+Rules match keys as they appear in the config. For intents, these are base intent
+names: retrieval intents like `faq/ask_name` are assigned as `faq`, so a rule can't
+match the part after the `/`.
+"""
+from collections import OrderedDict
+import fnmatch
+from os.path import relpath
+import re
+from typing import Dict, List, Optional, Text
+
+RULE_PREFIX = "prefix"
+RULE_GLOB = "glob"
+RULE_REGEX = "regex"
+RULE_KINDS = [RULE_PREFIX, RULE_GLOB, RULE_REGEX]
+RULE_TARGET_FILE = "target_file"
+
+# Characters after which `infer_prefix_rules` considers a common prefix
+PREFIX_SEPARATORS = "/_-."
+DEFAULT_MIN_KEYS_PER_RULE = 3
+
+NAMED_GROUP_PATTERN = re.compile(r"(?<!\\)\(\?P<\w+>")
+BACKREFERENCE_PATTERN = re.compile(r"\\\d|\(\?P=")
+
+
+class InvalidTargetFileRuleError(ValueError):
+    """Raised for a rule in the target files config that can't be used."""
+
+
+class TargetFileRules:
+    """The rules of one section, compiled so that matching a key doesn't depend on the number of rules.
+
+    Prefix rules are stored in a trie that is walked along the key; glob and regex rules
+    are combined into a single regex with one named group per rule. Of all rules that
+    match, the one listed first wins.
+    """
+
+    def __init__(self, rules: Optional[List[Dict[Text, Text]]] = None):
+        self.rules = [parse_rule(rule) for rule in (rules or [])]
+        self.prefix_trie = {}
+        pattern_rules = []
+        for ix, (kind, pattern, _) in enumerate(self.rules):
+            if kind == RULE_PREFIX:
+                node = self.prefix_trie
+                for char in pattern:
+                    node = node.setdefault(char, {})
+                # Only the first rule for a prefix can ever apply
+                node.setdefault(None, ix)
+            else:
+                regex = fnmatch.translate(pattern) if kind == RULE_GLOB else pattern
+                pattern_rules.append((ix, regex))
+        self.combined_regex, self.pattern_regexes = compile_pattern_rules(pattern_rules)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match_prefix(self, key: Text) -> Optional[int]:
+        node = self.prefix_trie
+        best = node.get(None)
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            ix = node.get(None)
+            if ix is not None and (best is None or ix < best):
+                best = ix
+        return best
+
+    def match_pattern(self, key: Text) -> Optional[int]:
+        if self.combined_regex is not None:
+            match = self.combined_regex.fullmatch(key)
+            return None if match is None else int(match.lastgroup[len("rule_"):])
+        for ix, regex in self.pattern_regexes:
+            if regex.fullmatch(key):
+                return ix
+        return None
+
+    def match(self, key: Text) -> Optional[Text]:
+        """The target file of the first rule matching `key`, if any."""
+        if not self.rules:
+            return None
+        matches = [ix for ix in [self.match_prefix(key), self.match_pattern(key)] if ix is not None]
+        if not matches:
+            return None
+        return self.rules[min(matches)][2]
+
+    def as_list(self) -> List[OrderedDict]:
+        return [
+            OrderedDict([(kind, pattern), (RULE_TARGET_FILE, target_file)])
+            for kind, pattern, target_file in self.rules
+        ]
+
+
+def parse_rule(rule) -> tuple:
+    """Validate a rule from the config and return it as (kind, pattern, target file)."""
+    if not isinstance(rule, dict):
+        raise InvalidTargetFileRuleError(f"Target file rule must be a mapping, got {rule!r}")
+    kinds = [kind for kind in RULE_KINDS if kind in rule]
+    unknown = set(rule.keys()) - set(RULE_KINDS) - {RULE_TARGET_FILE}
+    if len(kinds) != 1 or unknown or not rule.get(RULE_TARGET_FILE):
+        raise InvalidTargetFileRuleError(
+            f"Target file rule {dict(rule)!r} must have exactly one of "
+            f"{', '.join(RULE_KINDS)} and a {RULE_TARGET_FILE}"
+        )
+    kind = kinds[0]
+    pattern = str(rule[kind])
+    if kind == RULE_REGEX:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise InvalidTargetFileRuleError(f"Invalid regex in target file rule {pattern!r}: {e}")
+    return kind, pattern, relpath(rule[RULE_TARGET_FILE])
+
+
+def compile_pattern_rules(pattern_rules):
+    """A single regex with a group `rule_<ix>` per rule, or the separate regexes if they can't be combined.
+
+    Named groups of the rules are made non-capturing, so that rules may reuse group
+    names. Regexes with backreferences, which would refer to the wrong groups once
+    combined, are matched one by one.
+    """
+    separate = [(ix, re.compile(regex)) for ix, regex in pattern_rules]
+    if not pattern_rules or any(BACKREFERENCE_PATTERN.search(regex) for _, regex in pattern_rules):
+        return None, separate
+    try:
+        combined = re.compile(
+            "|".join(
+                [f"(?P<rule_{ix}>{NAMED_GROUP_PATTERN.sub('(?:', regex)})" for ix, regex in pattern_rules]
+            )
+        )
+    except re.error:
+        return None, separate
+    return combined, separate
+
+
+def infer_prefix_rules(target_file_per_key, min_keys: int = DEFAULT_MIN_KEYS_PER_RULE):
+    """Replace explicit entries by prefix rules where all keys with a common prefix share a target file.
+
+    Candidate prefixes end in one of `PREFIX_SEPARATORS`, e.g. `faq_` for `faq_opening_hours`.
+    The shortest prefix shared by at least `min_keys` keys that all have the same target
+    file becomes a rule, so the rules never overlap. Returns the rules and the entries
+    for the remaining keys.
+    """
+    keys_per_prefix = OrderedDict()
+    for key in target_file_per_key:
+        for ix, char in enumerate(key[:-1]):
+            if char in PREFIX_SEPARATORS:
+                keys_per_prefix.setdefault(key[: ix + 1], []).append(key)
+
+    rules = []
+    covered = set()
+    for prefix in sorted(keys_per_prefix, key=len):
+        keys = keys_per_prefix[prefix]
+        if len(keys) < min_keys or covered.intersection(keys):
+            continue
+        target_files = set([target_file_per_key[key] for key in keys])
+        if len(target_files) != 1:
+            continue
+        rules.append((keys[0], prefix, target_files.pop()))
+        covered.update(keys)
+
+    order = {key: ix for ix, key in enumerate(target_file_per_key)}
+    rules.sort(key=lambda rule: order[rule[0]])
+    remaining = OrderedDict(
+        (key, target_file) for key, target_file in target_file_per_key.items() if key not in covered
+    )
+    return [
+        OrderedDict([(RULE_PREFIX, prefix), (RULE_TARGET_FILE, target_file)])
+        for _, prefix, target_file in rules
+    ], remaining
@@ -0,0 +1,192 @@
+"""Splitting of oversized target files into numbered shard files.
+
+A target file can be given a maximum size under `target_file_limits` in the target
+files config, in examples and/or bytes:
+
+    target_file_limits:
+      data/nlu/faq.yml:
+        max_examples: 20000
+        max_bytes: 2000000
+
+As long as all its keys fit, the target file is written as usual. Otherwise its keys are
+split across shard files next to it, `data/nlu/faq_1.yml`, `data/nlu/faq_2.yml` and so
+on, without splitting any key: each intent (with all of its retrieval intents), synonym,
+regex and lookup table stays in one shard. The size of a key is its number of examples,
+synonym values, regex patterns or lookup elements, and the bytes of these as written.
+
+Assignment is stable: keys stay in the shard they are already in as long as it has room,
+and only new keys and keys from shards that overflowed are placed again, largest first,
+each in the least full shard. A new shard is added only once the others are full.
+"""
+from collections import OrderedDict, namedtuple
+import glob
+import math
+import os
+import re
+from typing import Dict, List, Optional, Text, Tuple
+
+from nlu_target_files.native_yaml import ENTITIES, TEXT, generate_message
+
+LIMIT_MAX_EXAMPLES = "max_examples"
+LIMIT_MAX_BYTES = "max_bytes"
+LIMIT_KINDS = [LIMIT_MAX_EXAMPLES, LIMIT_MAX_BYTES]
+
+# Bytes added to each item and key when it is written, e.g. `    - ` and a line break
+ITEM_OVERHEAD_BYTES = 7
+KEY_OVERHEAD_BYTES = 30
+
+ShardLimits = namedtuple("ShardLimits", ["max_examples", "max_bytes"])
+KeySize = namedtuple("KeySize", ["examples", "bytes"])
+
+
+class InvalidTargetFileLimitsError(ValueError):
+    """Raised for target file limits in the target files config that can't be used."""
+
+
+def parse_shard_limits(target_file: Text, limits) -> ShardLimits:
+    """Validate the limits of `target_file` from the config."""
+    if not isinstance(limits, dict):
+        raise InvalidTargetFileLimitsError(
+            f"Limits of target file {target_file} must be a mapping, got {limits!r}"
+        )
+    unknown = set(limits.keys()) - set(LIMIT_KINDS)
+    values = [limits.get(kind) for kind in LIMIT_KINDS]
+    if unknown or all(value is None for value in values):
+        raise InvalidTargetFileLimitsError(
+            f"Limits of target file {target_file} must have {' and/or '.join(LIMIT_KINDS)}, "
+            f"got {dict(limits)!r}"
+        )
+    for kind, value in zip(LIMIT_KINDS, values):
+        if value is not None and (type(value) is not int or value < 1):
+            raise InvalidTargetFileLimitsError(
+                f"{kind} of target file {target_file} must be a positive integer, got {value!r}"
+            )
+    return ShardLimits(*values)
+
+
+def get_shard_filename(target_file: Text, number: int) -> Text:
+    root, extension = os.path.splitext(target_file)
+    return f"{root}_{number}{extension}"
+
+
+def get_shard_number(target_file: Text, filename: Text) -> Optional[int]:
+    """The number of `filename` if it is a shard file of `target_file`, else `None`."""
+    root, extension = os.path.splitext(target_file)
+    match = re.fullmatch(re.escape(root) + r"_([1-9]\d*)" + re.escape(extension), filename)
+    return int(match.group(1)) if match else None
+
+
+def find_shard_files(target_file: Text) -> List[Text]:
+    """The shard files of `target_file` that exist, by number."""
+    root, extension = os.path.splitext(target_file)
+    shard_files = [
+        filename
+        for filename in glob.glob(f"{glob.escape(root)}_*{glob.escape(extension)}")
+        if get_shard_number(target_file, filename) is not None
+    ]
+    return sorted(shard_files, key=lambda filename: get_shard_number(target_file, filename))
+
+
+def get_items_size(texts) -> KeySize:
+    count = 0
+    size = 0
+    for text in texts:
+        count += 1
+        size += len(str(text).encode("utf-8")) + ITEM_OVERHEAD_BYTES
+    return KeySize(count, size)
+
+
+def get_key_size(nlu_data, section: Text, key: Text) -> KeySize:
+    """The size of the data of `key` in `nlu_data`, as counted against target file limits."""
+    if section == "intents":
+        examples = nlu_data.examples_index.get(key, [])
+        size = get_items_size(
+            generate_message(ex.data) if ex.get(ENTITIES) else ex.get(TEXT, "") for ex in examples
+        )
+    elif section == "synonyms":
+        size = get_items_size(nlu_data.synonyms_index.get(key, []))
+    elif section == "regexes":
+        size = get_items_size(reg["pattern"] for reg in nlu_data.regexes_index.get(key, []))
+    else:
+        elements = []
+        for lookup_table in nlu_data.lookups_index.get(key, []):
+            # lookup tables that refer to a file aren't written
+            if not isinstance(lookup_table["elements"], str):
+                elements = lookup_table["elements"]
+        size = get_items_size(elements)
+    if not size.examples:
+        return size
+    return KeySize(size.examples, size.bytes + len(str(key).encode("utf-8")) + KEY_OVERHEAD_BYTES)
+
+
+def assign_shards(
+    key_sizes: "OrderedDict[Tuple[Text, Text], KeySize]",
+    limits: ShardLimits,
+    current_shards: Optional[Dict[Tuple[Text, Text], int]] = None,
+) -> Optional[Dict[Tuple[Text, Text], int]]:
+    """The shard number of each (section, key) in `key_sizes`, or `None` if they all fit in one file.
+
+    `current_shards` are the shards the keys are in now; keys stay there while there's
+    room. The other keys are placed greedily, largest first, in the least full shard
+    with room for them, and a new shard is added when no shard has room. A key that is
+    larger than the limits by itself gets a shard of its own.
+    """
+    total = KeySize(
+        sum(size.examples for size in key_sizes.values()),
+        sum(size.bytes for size in key_sizes.values()),
+    )
+    if fits(total, KeySize(0, 0), limits):
+        return None
+    current_shards = current_shards or {}
+    shard_count = max(
+        math.ceil(total.examples / limits.max_examples) if limits.max_examples else 1,
+        math.ceil(total.bytes / limits.max_bytes) if limits.max_bytes else 1,
+    )
+    loads = OrderedDict((number, KeySize(0, 0)) for number in range(1, shard_count + 1))
+    shards = {}
+
+    def place(key, number):
+        shards[key] = number
+        load = loads.get(number, KeySize(0, 0))
+        loads[number] = KeySize(
+            load.examples + key_sizes[key].examples, load.bytes + key_sizes[key].bytes
+        )
+
+    unplaced = []
+    for key, size in key_sizes.items():
+        number = current_shards.get(key)
+        if number in loads and has_room(size, loads[number], limits):
+            place(key, number)
+        else:
+            unplaced.append(key)
+
+    positions = {key: position for position, key in enumerate(key_sizes)}
+    unplaced.sort(key=lambda key: (-get_fill(key_sizes[key], limits), positions[key]))
+    for key in unplaced:
+        candidates = [
+            number for number, load in loads.items() if has_room(key_sizes[key], load, limits)
+        ]
+        if candidates:
+            place(key, min(candidates, key=lambda number: get_fill(loads[number], limits)))
+        else:
+            place(key, max(loads) + 1)
+    return shards
+
+
+def fits(size: KeySize, load: KeySize, limits: ShardLimits) -> bool:
+    return (limits.max_examples is None or load.examples + size.examples <= limits.max_examples) and (
+        limits.max_bytes is None or load.bytes + size.bytes <= limits.max_bytes
+    )
+
+
+def has_room(size: KeySize, load: KeySize, limits: ShardLimits) -> bool:
+    """Whether a key of `size` can go into a shard of `load`; an empty shard takes any key."""
+    return not load.examples or fits(size, load, limits)
+
+
+def get_fill(size: KeySize, limits: ShardLimits) -> float:
+    """How full a shard of `size` is, as the larger fraction of its limits."""
+    return max(
+        size.examples / limits.max_examples if limits.max_examples else 0,
+        size.bytes / limits.max_bytes if limits.max_bytes else 0,
+    )
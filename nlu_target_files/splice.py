@@ -0,0 +1,197 @@
+"""Splicing of changed items into existing NLU files instead of rewriting them in full.
+
+A file is split into its header (up to and including `nlu:`), its top-level `nlu:`
+items, each with the comment and blank lines before it, and the comment and blank
+lines at the end. Given the items a full rewrite would write, `splice_nlu_file` keeps
+the existing file as it is except for:
+
+- items whose data changed, which are replaced by their new text where they are,
+- items that are no longer in the file, which are removed (comments before them stay),
+- new items, which are inserted after the item that comes before them in the full
+  rewrite, or before all other items.
+
+Items are compared by the data they load to, not by their text, so items whose data
+didn't change are kept byte for byte, including comments and formatting within them.
+The result has the items of the full rewrite, possibly in another order, and loads to
+the same data. Files that can't be split this way (see `split_nlu_file`), e.g. because they
+have other top-level keys like `responses:` or a different header, aren't spliced.
+"""
+from collections import OrderedDict
+import logging
+from typing import List, Optional, Text, Tuple
+
+from nlu_target_files.constants import DEFAULT_ENCODING
+from nlu_target_files.key_index import TOP_LEVEL_ITEM_PATTERN, decode_name
+from nlu_target_files.native_yaml import NativeYAMLReader
+from nlu_target_files.training_data import training_data_as_dict
+
+logger = logging.getLogger(__name__)
+
+
+def is_comment_or_blank_line(line: bytes) -> bool:
+    return line[:1] in b"#\r\n"
+
+
+def split_nlu_file(contents: bytes) -> Optional[Tuple[bytes, List[tuple], bytes]]:
+    """The header, the items as (item id, comment lines before it, item) and the trailing
+    comment lines of a file; `None` if the file can't be split into items safely.
+
+    The id of an item is its kind (`intent`, `synonym`, `regex` or `lookup`) and name.
+    Files with top-level keys after `nlu:`, several documents or items that aren't
+    named on their first line or appear twice can't be split.
+    """
+    header = []
+    items = []
+    in_nlu = False
+    current = None
+    pending = []
+    for line in contents.splitlines(keepends=True):
+        if is_comment_or_blank_line(line):
+            (header if current is None else pending).append(line)
+        elif line[:1] in b" \t":
+            if current is None:
+                header.append(line)
+            else:
+                # Blank lines and comments followed by indented lines are part of the item
+                current[2].extend(pending)
+                current[2].append(line)
+                pending = []
+        elif line.startswith(b"- "):
+            match = TOP_LEVEL_ITEM_PATTERN.fullmatch(line)
+            if not in_nlu or match is None:
+                return None
+            name = decode_name(match.group(2))
+            if name is None:
+                return None
+            current = [(match.group(1).decode(), name), pending, [line]]
+            pending = []
+            items.append(current)
+        elif current is not None or line.startswith(b"---") or line.startswith(b"..."):
+            return None
+        else:
+            in_nlu = line.rstrip() == b"nlu:"
+            header.append(line)
+    if current is not None and not in_nlu:
+        return None
+    item_ids = [item_id for item_id, _, _ in items]
+    if len(set(item_ids)) != len(item_ids):
+        return None
+    return (
+        b"".join(header),
+        [(item_id, b"".join(comments), b"".join(lines)) for item_id, comments, lines in items],
+        b"".join(pending),
+    )
+
+
+def strip_comments(header: bytes) -> bytes:
+    return b"".join(
+        [line for line in header.splitlines(keepends=True) if not is_comment_or_blank_line(line)]
+    )
+
+
+def load_item(header: bytes, item: bytes) -> Optional[dict]:
+    """The data of a single item, or `None` if it can't be read."""
+    try:
+        training_data = NativeYAMLReader().reads((header + item).decode(DEFAULT_ENCODING))
+    except Exception:
+        return None
+    return training_data_as_dict(training_data)
+
+
+def has_same_data(header: bytes, old_item: bytes, new_item: bytes) -> bool:
+    """Whether the existing text of an item can be kept instead of its new text."""
+    if old_item == new_item:
+        return True
+    # Items are concatenated, so the last item of a file needs its line break
+    if not old_item.endswith(b"\n"):
+        return False
+    old_data = load_item(header, old_item)
+    return old_data is not None and old_data == load_item(header, new_item)
+
+
+def splice_nlu_file(old_contents: bytes, new_contents: bytes) -> Optional[bytes]:
+    """The existing file `old_contents` with the items of `new_contents` spliced in.
+
+    Returns `None` if either file can't be split into items, or their headers differ
+    other than by comments.
+    """
+    old_split = split_nlu_file(old_contents)
+    new_split = split_nlu_file(new_contents)
+    if old_split is None or new_split is None:
+        return None
+    old_header, old_items, trailing_comments = old_split
+    new_header, new_items, _ = new_split
+    if strip_comments(old_header) != strip_comments(new_header):
+        return None
+
+    new_item_texts = OrderedDict(
+        (item_id, comments + text) for item_id, comments, text in new_items
+    )
+    # Kept items with the comments before them, including those of removed items, and
+    # their existing text where their data didn't change
+    kept_items = OrderedDict()
+    unchanged_item_texts = {}
+    comments_of_removed = b""
+    for item_id, comments, text in old_items:
+        if item_id in new_item_texts:
+            kept_items[item_id] = comments_of_removed + comments
+            comments_of_removed = b""
+            if has_same_data(new_header, text, new_item_texts[item_id]):
+                unchanged_item_texts[item_id] = text
+        else:
+            comments_of_removed += comments
+
+    # New items go after the closest item before them in the new order that is kept
+    inserted_after = OrderedDict([(None, [])])
+    previous = None
+    for item_id in new_item_texts:
+        if item_id in kept_items:
+            previous = item_id
+        else:
+            inserted_after.setdefault(previous, []).append(item_id)
+
+    parts = [old_header]
+    parts.extend([new_item_texts[item_id] for item_id in inserted_after[None]])
+    for item_id, comments in kept_items.items():
+        parts.append(comments)
+        parts.append(unchanged_item_texts.get(item_id, new_item_texts[item_id]))
+        parts.extend([new_item_texts[inserted] for inserted in inserted_after.get(item_id, [])])
+    parts.append(comments_of_removed + trailing_comments)
+    return b"".join(parts)
+
+
+def read_file(filename: Text) -> Optional[bytes]:
+    try:
+        with open(filename, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def splice_into_file(filename: Text, rendered: Text) -> Text:
+    """The text to write to `filename` instead of `rendered`: `rendered` spliced into
+    the existing file, or `rendered` itself for new files and files that can't be spliced.
+    """
+    old_contents = read_file(filename)
+    if old_contents is None:
+        return rendered
+    spliced = splice_nlu_file(old_contents, rendered.encode(DEFAULT_ENCODING))
+    if spliced is None:
+        logger.warning(f"Could not splice changes into {filename}; rewriting it in full")
+        return rendered
+    return spliced.decode(DEFAULT_ENCODING)
+
+
+def file_matches_when_spliced(filename: Text, rendered: Text) -> bool:
+    """Whether splicing `rendered` into `filename` would leave it as it is.
+
+    For files that can't be spliced, whether they have exactly the text `rendered`.
+    """
+    old_contents = read_file(filename)
+    if old_contents is None:
+        return False
+    new_contents = rendered.encode(DEFAULT_ENCODING)
+    spliced = splice_nlu_file(old_contents, new_contents)
+    if spliced is None:
+        return old_contents == new_contents
+    return spliced == old_contents
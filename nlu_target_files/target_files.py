@@ -1,23 +1,90 @@
 import asyncio
 from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import partial
+import glob
+import json
 import logging
 import os
 from os.path import relpath
-from typing import Text, Optional, Dict
+from typing import Text, Optional, Dict, List
 
 from ruamel import yaml as yaml
 from ruamel.yaml import RoundTripRepresenter
 
-import rasa.shared.data
-from rasa.shared.utils.io import write_yaml, read_yaml_file
-from rasa.shared.nlu.training_data.formats.rasa_yaml import RasaYAMLWriter
-
-from nlu_target_files.constants import DEFAULT_NLU_TARGET_FILE, NLU_DATA_PATH, TARGET_FILES_CONFIG_FILE
-from nlu_target_files.training_data import load_sortable_nlu_data, get_training_data_for_keys
+from nlu_target_files.cache import ParsedNLUFileCache, create_cache
+from nlu_target_files.changed_files import get_files_changed_since
+from nlu_target_files.constants import (
+    DEFAULT_CACHE_MAX_SIZE_MB,
+    DEFAULT_ENCODING,
+    DEFAULT_NLU_TARGET_FILE,
+    NLU_DATA_PATH,
+    TARGET_FILES_CONFIG_FILE,
+)
+from nlu_target_files.file_table import FileTable, SectionTargetFiles
+from nlu_target_files.duplicates import DEFAULT_DUPLICATE_OPTIONS, DuplicateIndex, DuplicateOptions
+from nlu_target_files.key_index import KeyIndex, get_key_index_path, hash_bytes
+from nlu_target_files.lookup_tables import DEFAULT_LOOKUP_OPTIONS, LookupOptions, create_lookup_options
+from nlu_target_files.native_yaml import (
+    StreamingYAMLWriter,
+    TrainingData,
+    dump_obj_as_yaml_to_string,
+    read_yaml_file,
+)
+from nlu_target_files.profiling import disable_profiling, profile_phase
+from nlu_target_files.rules import InvalidTargetFileRuleError, TargetFileRules, infer_prefix_rules
+from nlu_target_files.sharding import (
+    LIMIT_KINDS,
+    assign_shards,
+    find_shard_files,
+    get_key_size,
+    get_shard_filename,
+    get_shard_number,
+    parse_shard_limits,
+)
+from nlu_target_files.training_data import (
+    SortableTrainingData,
+    get_empty_keys_per_section,
+    get_explicit_keys_present,
+    get_keys_present,
+    get_nlu_files,
+    iter_nlu_files,
+    load_nlu_files,
+    load_sortable_nlu_data,
+    merge_training_data,
+    partition_keys,
+    partition_training_data,
+    scan_keys_present,
+    scan_nlu_files,
+    write_nlu_data_for_keys,
+)
+from nlu_target_files.splice import file_matches_when_spliced, splice_into_file
+from nlu_target_files.writing import file_has_text, write_file_if_changed, write_stream_if_changed
+from nlu_target_files.yaml_backends import YAML_BACKEND_AUTO, get_yaml_backend
 
 logger = logging.getLogger(__name__)
 
-DEFAULT_ENCODING = "utf-8"
+EnforcementSummary = namedtuple(
+    "EnforcementSummary", ["written", "unchanged", "deleted", "failed"]
+)
+
+FILE_WRITTEN = "written"
+FILE_UNCHANGED = "unchanged"
+FILE_EMPTY = "empty"
+CheckResult = namedtuple("CheckResult", ["misplaced_keys", "changed_files"])
+MisplacedKey = namedtuple("MisplacedKey", ["section", "key", "current_file", "target_file"])
+ProjectResult = namedtuple("ProjectResult", ["target_files_config", "exit_code", "error"])
+
+SECTION_ATTRIBUTE_PREFIXES = OrderedDict(
+    [
+        ("intents", "intent"),
+        ("synonyms", "synonym"),
+        ("regexes", "regex"),
+        ("lookups", "lookup"),
+    ]
+)
+
 
 class OrderedDefaultDict(OrderedDict):
     """ A defaultdict with OrderedDict as its base class. """
@@ -73,28 +140,64 @@ class TargetFilesConfig:
         synonym_target_files: Optional[Dict[Text, Text]] = None,
         regex_target_files: Optional[Dict[Text, Text]] = None,
         lookup_target_files: Optional[Dict[Text, Text]] = None,
-        config_filepath: Optional[Text] = TARGET_FILES_CONFIG_FILE
+        config_filepath: Optional[Text] = TARGET_FILES_CONFIG_FILE,
+        nlu_data: Optional[SortableTrainingData] = None,
+        jobs: int = 1,
+        cache: Optional[ParsedNLUFileCache] = None,
+        yaml_backend=None,
+        target_file_rules: Optional[Dict[Text, list]] = None,
+        lookup_options: LookupOptions = DEFAULT_LOOKUP_OPTIONS,
+        duplicate_options: DuplicateOptions = DEFAULT_DUPLICATE_OPTIONS,
+        target_file_limits: Optional[Dict[Text, dict]] = None,
     ):
         self.config_filepath = config_filepath
         self.nlu_data_path = nlu_data_path
-        self.nlu_data = load_sortable_nlu_data(self.nlu_data_path)
+        self.jobs = jobs
+        self.cache = cache
+        self.lookup_options = lookup_options
+        self.duplicate_options = duplicate_options
+        self.yaml_backend = yaml_backend or get_yaml_backend()
+        self._nlu_data = nlu_data
         self.default_intent_target_file = default_intent_target_file
         self.default_synonym_target_file = default_synonym_target_file
         self.default_regex_target_file = default_regex_target_file
         self.default_lookup_target_file = default_lookup_target_file
 
-        self.intent_target_files = OrderedDefaultDict(lambda: self.default_intent_target_file)
-        self.synonym_target_files = OrderedDefaultDict(lambda: self.default_synonym_target_file)
-        self.regex_target_files = OrderedDefaultDict(lambda: self.default_regex_target_file)
-        self.lookup_target_files = OrderedDefaultDict(lambda: self.default_lookup_target_file)
+        # Target files are interned, and each key refers to its file by id.
+        self.file_table = FileTable()
+        with profile_phase("config"):
+            self.intent_target_files = SectionTargetFiles(self.file_table, intent_target_files)
+            self.synonym_target_files = SectionTargetFiles(self.file_table, synonym_target_files)
+            self.regex_target_files = SectionTargetFiles(self.file_table, regex_target_files)
+            self.lookup_target_files = SectionTargetFiles(self.file_table, lookup_target_files)
+            unknown_sections = set(target_file_rules or {}) - set(SECTION_ATTRIBUTE_PREFIXES)
+            if unknown_sections:
+                raise InvalidTargetFileRuleError(
+                    f"Target file rules for unknown section(s) {', '.join(sorted(unknown_sections))}"
+                )
+            self.target_file_rules = OrderedDict(
+                (section, TargetFileRules((target_file_rules or {}).get(section)))
+                for section in SECTION_ATTRIBUTE_PREFIXES
+            )
+            self.target_file_limits = OrderedDict(
+                (relpath(target_file), parse_shard_limits(target_file, limits))
+                for target_file, limits in (target_file_limits or {}).items()
+            )
+            self.ensure_relative_paths()
+            self.sort()
 
-        self.intent_target_files.update(intent_target_files or {})
-        self.synonym_target_files.update(synonym_target_files or {})
-        self.regex_target_files.update(regex_target_files or {})
-        self.lookup_target_files.update(lookup_target_files or {})
+    @property
+    def nlu_data(self) -> SortableTrainingData:
+        """The NLU data in `nlu_data_path`, loaded when it is first needed."""
+        if self._nlu_data is None:
+            self._nlu_data = load_sortable_nlu_data(
+                self.nlu_data_path, self.jobs, self.cache, self.yaml_backend, self.lookup_options
+            )
+        return self._nlu_data
 
-        self.ensure_relative_paths()
-        self.sort()
+    @nlu_data.setter
+    def nlu_data(self, nlu_data: SortableTrainingData):
+        self._nlu_data = nlu_data
 
     @classmethod
     def infer_structure_from_files(
@@ -104,31 +207,55 @@ class TargetFilesConfig:
         default_synonym_target_file: Optional[Text],
         default_regex_target_file: Optional[Text],
         default_lookup_target_file: Optional[Text],
-        config_filepath: Optional[Text]
+        config_filepath: Optional[Text],
+        jobs: int = 1,
+        cache: Optional[ParsedNLUFileCache] = None,
+        yaml_backend=None,
+        compress_rules: bool = False,
+        full_parse: bool = False,
     ):
+        """Infer the config from where keys currently are.
+
+        Files are only scanned for the keys in them (see `scan_keys_present`) unless
+        `full_parse`, in which case they are loaded like for enforcement.
+
+        If `compress_rules`, keys with a common prefix that are all in the same file
+        are assigned by a prefix rule instead of one by one, see `infer_prefix_rules`.
+        """
+        yaml_backend = yaml_backend or get_yaml_backend()
         intent_target_files = OrderedDefaultDict(lambda: default_intent_target_file)
         synonym_target_files = OrderedDefaultDict(lambda: default_synonym_target_file)
         regex_target_files = OrderedDefaultDict(lambda: default_regex_target_file)
         lookup_target_files = OrderedDefaultDict(lambda: default_lookup_target_file)
 
-        nlu_files = rasa.shared.data.get_data_files(
-            nlu_data_path, rasa.shared.data.is_nlu_file
-        )
+        nlu_files = get_nlu_files(nlu_data_path, yaml_backend)
 
-        for filepath in nlu_files:
-            nlu_data = load_sortable_nlu_data(filepath)
+        if full_parse:
+            keys_per_file = [
+                get_keys_present(training_data)
+                for training_data in load_nlu_files(nlu_files, jobs, cache, yaml_backend)
+            ]
+        else:
+            keys_per_file = scan_nlu_files(nlu_files, jobs, yaml_backend)
+        for filepath, keys_present in zip(nlu_files, keys_per_file):
             intent_target_files.set_value_for_keys(
-                nlu_data.sorted_intents, filepath
+                keys_present["intents"], filepath
             )
             synonym_target_files.set_value_for_keys(
-                nlu_data.sorted_synonym_names, filepath
+                keys_present["synonyms"], filepath
             )
             regex_target_files.set_value_for_keys(
-                nlu_data.sorted_regex_names, filepath
+                keys_present["regexes"], filepath
             )
             lookup_target_files.set_value_for_keys(
-                nlu_data.sorted_lookup_names, filepath
+                keys_present["lookups"], filepath
             )
+        target_file_rules = {}
+        if compress_rules:
+            target_file_rules["intents"], intent_target_files = infer_prefix_rules(intent_target_files)
+            target_file_rules["synonyms"], synonym_target_files = infer_prefix_rules(synonym_target_files)
+            target_file_rules["regexes"], regex_target_files = infer_prefix_rules(regex_target_files)
+            target_file_rules["lookups"], lookup_target_files = infer_prefix_rules(lookup_target_files)
         target_files = cls(
             nlu_data_path,
             default_intent_target_file,
@@ -139,13 +266,23 @@ class TargetFilesConfig:
             synonym_target_files,
             regex_target_files,
             lookup_target_files,
-            config_filepath
-
+            config_filepath,
+            yaml_backend=yaml_backend,
+            target_file_rules=target_file_rules,
         )
         return target_files
 
     @classmethod
-    def from_dict(cls, nlu_target_files_dict, config_filepath):
+    def from_dict(
+        cls,
+        nlu_target_files_dict,
+        config_filepath,
+        jobs=1,
+        cache=None,
+        yaml_backend=None,
+        lookup_options=DEFAULT_LOOKUP_OPTIONS,
+        duplicate_options=DEFAULT_DUPLICATE_OPTIONS,
+    ):
         target_files = cls(
             nlu_target_files_dict.get("nlu_data_path"),
             nlu_target_files_dict.get("default_target_files",{}).get("intents"),
@@ -156,60 +293,69 @@ class TargetFilesConfig:
             nlu_target_files_dict.get("target_files",{}).get("synonyms",{}),
             nlu_target_files_dict.get("target_files",{}).get("regexes",{}),
             nlu_target_files_dict.get("target_files",{}).get("lookups",{}),
-            config_filepath
+            config_filepath,
+            jobs=jobs,
+            cache=cache,
+            yaml_backend=yaml_backend,
+            target_file_rules=nlu_target_files_dict.get("target_file_rules") or {},
+            lookup_options=lookup_options,
+            duplicate_options=duplicate_options,
+            target_file_limits=nlu_target_files_dict.get("target_file_limits") or {},
         )
         return target_files
 
     @classmethod
     def read_config_file(cls, config_filepath):
-        return read_yaml_file(config_filepath)
+        with profile_phase("config"):
+            return read_yaml_file(config_filepath)
 
     @classmethod
-    def load_structure_from_file(cls, config_filepath):
+    def load_structure_from_file(
+        cls,
+        config_filepath,
+        jobs=1,
+        cache=None,
+        yaml_backend=None,
+        lookup_options=DEFAULT_LOOKUP_OPTIONS,
+        duplicate_options=DEFAULT_DUPLICATE_OPTIONS,
+    ):
         loaded_structure = cls.read_config_file(config_filepath)
-        target_files = cls.from_dict(loaded_structure, config_filepath)
+        target_files = cls.from_dict(
+            loaded_structure,
+            config_filepath,
+            jobs,
+            cache,
+            yaml_backend,
+            lookup_options,
+            duplicate_options,
+        )
         return target_files
 
 
     def ensure_relative_paths(self):
         """Ensure all target paths are relative so that enforcement makes sense across machines.
+
+        Target files of keys are made relative when they are interned in the file table.
         """
         self.nlu_data_path = relpath(self.nlu_data_path)
         self.default_intent_target_file = relpath(self.default_intent_target_file)
         self.default_synonym_target_file = relpath(self.default_synonym_target_file)
         self.default_regex_target_file = relpath(self.default_regex_target_file)
         self.default_lookup_target_file = relpath(self.default_lookup_target_file)
-        self.intent_target_files = {item: relpath(target) for item, target in self.intent_target_files.items()}
-        self.synonym_target_files = {item: relpath(target) for item, target in self.synonym_target_files.items()}
-        self.regex_target_files = {item: relpath(target) for item, target in self.regex_target_files.items()}
-        self.lookup_target_files = {item: relpath(target) for item, target in self.lookup_target_files.items()}
 
-    def sort(self):
-        for section in [
-            "intent_target_files",
-            "synonym_target_files",
-            "regex_target_files",
-            "lookup_target_files",
-        ]:
-            section_to_update = getattr(self, section)
-            current_order = {ix: item for item, ix in enumerate(section_to_update)}
-            file_order = {
-                ix: filename
-                for filename, ix in enumerate(
-                    list(dict.fromkeys([nlu_file for nlu_file in section_to_update.values()]))
-                )
-            }
-            ordered = OrderedDefaultDict(str)
-            ordered.update(sorted(
-                    section_to_update.items(),
-                    key=lambda x: (file_order.get(x[1]), current_order.get(x[0])),
-                )
-            )
+    def get_section_target_files(self):
+        """The `SectionTargetFiles` of each section, keyed by section name."""
+        return OrderedDict(
+            (section, getattr(self, f"{prefix}_target_files"))
+            for section, prefix in SECTION_ATTRIBUTE_PREFIXES.items()
+        )
 
-            setattr(self, section, ordered)
+    def sort(self):
+        for section_target_files in self.get_section_target_files().values():
+            section_target_files.sort()
 
     def as_dict(self):
-        return {
+        config = {
                 "nlu_data_path": self.nlu_data_path,
                 "default_target_files": {
                     "intents": self.default_intent_target_file,
@@ -218,77 +364,570 @@ class TargetFilesConfig:
                     "lookups": self.default_lookup_target_file,
                 },
                 "target_files": {
-                    "intents": OrderedDict(self.intent_target_files),
-                    "synonyms": OrderedDict(self.synonym_target_files),
-                    "regexes": OrderedDict(self.regex_target_files),
-                    "lookups": OrderedDict(self.lookup_target_files),
+                    "intents": self.intent_target_files.as_ordered_dict(),
+                    "synonyms": self.synonym_target_files.as_ordered_dict(),
+                    "regexes": self.regex_target_files.as_ordered_dict(),
+                    "lookups": self.lookup_target_files.as_ordered_dict(),
                 },
             }
+        if any(self.target_file_rules.values()):
+            config["target_file_rules"] = OrderedDict(
+                (section, rules.as_list())
+                for section, rules in self.target_file_rules.items()
+                if rules
+            )
+        if self.target_file_limits:
+            config["target_file_limits"] = OrderedDict(
+                (
+                    target_file,
+                    OrderedDict(
+                        (kind, value) for kind, value in zip(LIMIT_KINDS, limits) if value is not None
+                    ),
+                )
+                for target_file, limits in self.target_file_limits.items()
+            )
+        return config
 
-    def as_inverted_dict(self):
-        target_files = self.as_dict()["target_files"]
-        filenames = set(
-            [fname for section in target_files.values() for fname in section.values()]
+    def get_target_filenames(self):
+        """All files that are the target file of at least one key."""
+        return set(
+            [
+                filename
+                for section_target_files in self.get_section_target_files().values()
+                for filename in section_target_files.filenames()
+            ]
         )
-        keys_per_file = OrderedDefaultDict(lambda: OrderedDefaultDict(list))
-        for filename in filenames:
-            for section in target_files.keys():
-                keys_per_file[filename][section] = [
-                    key
-                    for key, value in target_files[section].items()
-                    if value == filename
-                ]
-
-        return keys_per_file
 
     def get_handled_keys(self):
         return {
-            section: set(values.keys())
-            for section, values in self.as_dict()["target_files"].items()
+            section: set(target_files.keys())
+            for section, target_files in self.get_section_target_files().items()
         }
 
-    def enforce_on_files(self, update_config_file=False):
-        self.update_config_from_data()
-        target_keys_per_file = self.as_inverted_dict()
-        existing_nlu_files = set(
-            rasa.shared.data.get_data_files(
-                self.nlu_data_path, rasa.shared.data.is_nlu_file
-            )
+    def get_target_file(self, section, key):
+        """The target file of `key`: as listed in the config, else by the first matching rule, else the default."""
+        target_files = getattr(self, f"{SECTION_ATTRIBUTE_PREFIXES[section]}_target_files")
+        if key in target_files:
+            return target_files[key]
+        return self.target_file_rules[section].match(key) or getattr(
+            self, f"default_{SECTION_ATTRIBUTE_PREFIXES[section]}_target_file"
         )
-        existing_and_new_nlu_files = existing_nlu_files.union(
-            set(self.as_inverted_dict().keys())
+
+    def get_target_files_for_keys(self, keys_present):
+        """The target files of the keys, including the existing shard files of those with limits."""
+        target_files = set(
+            [
+                self.get_target_file(section, key)
+                for section, keys in keys_present.items()
+                for key in keys
+            ]
         )
-        writer = RasaYAMLWriter()
-        for filename in existing_and_new_nlu_files:
-            target_keys = target_keys_per_file.get(filename, [])
-            if not target_keys and filename in existing_nlu_files:
-                logger.warning(
-                    f"No data found for file {filename}; deleting {filename}"
+        for target_file in target_files.intersection(self.target_file_limits):
+            target_files.update(find_shard_files(target_file))
+        return target_files
+
+    def is_in_target_file(self, filename, target_file):
+        """Whether `filename` is `target_file` or, if it has limits, one of its shard files."""
+        return filename == target_file or (
+            target_file in self.target_file_limits
+            and get_shard_number(target_file, filename) is not None
+        )
+
+    def get_unsharded_target_file(self, filename):
+        """The target file with limits that `filename` is a shard file of, else `filename`."""
+        for target_file in self.target_file_limits:
+            if get_shard_number(target_file, filename) is not None:
+                return target_file
+        return filename
+
+    def get_current_shards(self, target_file):
+        """The shard number of each (section, key) in the existing shard files of `target_file`.
+
+        Synonyms are placed by their `synonym:` items, not by annotated examples that
+        use them; a key found in several shard files is in the first.
+        """
+        current_shards = {}
+        for shard_file in find_shard_files(target_file):
+            number = get_shard_number(target_file, shard_file)
+            keys_present = scan_keys_present(shard_file, self.yaml_backend, inline_synonyms=False)
+            for section, keys in keys_present.items():
+                for key in keys:
+                    current_shards.setdefault((section, key), number)
+        return current_shards
+
+    def shard_target_files(self, target_files, target_filenames):
+        """`target_files` and `target_filenames`, with the keys of target files that are over
+        their limits assigned to shard files instead, see `sharding.assign_shards`.
+
+        Target files whose data isn't in `nlu_data` are left as they are.
+        """
+        oversized = [
+            target_file for target_file in self.target_file_limits if target_file in target_filenames
+        ]
+        if not oversized:
+            return target_files, target_filenames
+        with profile_phase("partitioning"):
+            target_files = OrderedDict(
+                (section, OrderedDict(section_target_files.items()))
+                for section, section_target_files in target_files.items()
+            )
+            target_filenames = set(target_filenames)
+            for target_file in oversized:
+                key_sizes = OrderedDict(
+                    ((section, key), get_key_size(self.nlu_data, section, key))
+                    for section, section_target_files in self.get_section_target_files().items()
+                    for key in section_target_files.keys_in_file(target_file)
+                )
+                if not any(size.examples for size in key_sizes.values()):
+                    continue
+                shards = assign_shards(
+                    key_sizes,
+                    self.target_file_limits[target_file],
+                    self.get_current_shards(target_file),
                 )
-                os.remove(filename)
+                if shards is None:
+                    continue
+                target_filenames.discard(target_file)
+                for (section, key), number in shards.items():
+                    shard_file = get_shard_filename(target_file, number)
+                    target_files[section][key] = shard_file
+                    target_filenames.add(shard_file)
+        return target_files, target_filenames
+
+    def is_in_nlu_data_path(self, filename):
+        if os.path.isfile(self.nlu_data_path):
+            return relpath(filename) == self.nlu_data_path
+        path_in_data = relpath(filename, self.nlu_data_path)
+        return not (path_in_data == os.pardir or path_in_data.startswith(os.pardir + os.sep))
+
+    def load_changed_nlu_data(self, changed_files):
+        """Load only the NLU files needed to enforce the config on `changed_files`.
+
+        These are the changed files themselves plus the target files of all keys in
+        them, and so on for the keys in those target files. Assuming the other files
+        already match the config, this yields the same data for these files as loading
+        all of `nlu_data_path` would. Returns the NLU files that were loaded.
+        """
+        loaded = OrderedDict()
+        seen = set()
+        pending = set([relpath(f) for f in changed_files])
+        while pending:
+            seen.update(pending)
+            nlu_files = [
+                f
+                for f in sorted(pending)
+                if self.is_in_nlu_data_path(f)
+                and os.path.isfile(f)
+                and get_nlu_files(f, self.yaml_backend)
+            ]
+            target_files = set()
+            for filename, training_data in zip(
+                nlu_files, load_nlu_files(nlu_files, self.jobs, self.cache, self.yaml_backend)
+            ):
+                loaded[filename] = training_data
+                target_files.update(
+                    self.get_target_files_for_keys(get_keys_present(training_data))
+                )
+            pending = target_files - seen
+
+        nlu_files = sorted(loaded.keys())
+        self.nlu_data = merge_training_data([loaded[f] for f in nlu_files], self.lookup_options)
+        return nlu_files
+
+    def get_training_data_per_target_file(self, nlu_files=None, streaming=False):
+        """Yield every file touched by enforcement together with its data, in sorted order.
+
+        The data is `None` for existing files that should be deleted. If `nlu_files` is
+        given, only these and the target files of the keys in `nlu_data` are considered,
+        see `load_changed_nlu_data`. If `streaming`, the data is given as the keys in
+        each file (see `partition_keys`) instead of a `TrainingData`.
+
+        Duplicates are reported, and exact duplicates dropped, as set out in
+        `duplicate_options`; with `nlu_files`, only the data loaded from these is indexed.
+        """
+        self.update_config_from_data()
+        target_files, target_filenames = self.shard_target_files(
+            self.get_section_target_files(), self.get_target_filenames()
+        )
+        duplicate_index = None
+        if self.duplicate_options.report or self.duplicate_options.drop:
+            duplicate_index = DuplicateIndex(self.duplicate_options.drop)
+        if streaming:
+            contents_per_file = partition_keys(self.nlu_data, target_files, duplicate_index)
+        else:
+            contents_per_file = partition_training_data(self.nlu_data, target_files, duplicate_index)
+        if duplicate_index is not None:
+            duplicate_index.log_report()
+        if nlu_files is None:
+            existing_nlu_files = set(get_nlu_files(self.nlu_data_path, self.yaml_backend))
+        else:
+            existing_nlu_files = set(nlu_files)
+            target_filenames &= existing_nlu_files.union(contents_per_file.keys())
+        existing_and_new_nlu_files = existing_nlu_files.union(target_filenames)
+        for filename in sorted(existing_and_new_nlu_files):
+            if filename not in target_filenames and filename in existing_nlu_files:
+                yield filename, None
                 continue
-            contents_per_file = get_training_data_for_keys(self.nlu_data, target_keys)
-            logger.warning(f"Writing data to file {filename}")
-            writer.dump(filename, contents_per_file)
-        
+            if filename in contents_per_file:
+                yield filename, contents_per_file[filename]
+            elif streaming:
+                yield filename, get_empty_keys_per_section()
+            else:
+                yield filename, TrainingData()
+
+    def render_target_files(self, nlu_files=None):
+        """Yield every file touched by enforcement together with its new contents, in sorted order.
+
+        The contents are `None` for existing files that should be deleted, and empty
+        for target files without any data, which aren't written.
+        """
+        writer = self.yaml_backend.create_writer()
+        for filename, training_data in self.get_training_data_per_target_file(nlu_files):
+            if training_data is None:
+                yield filename, None
+                continue
+            yield filename, writer.dumps(training_data)
+
+    def enforce_on_files(
+        self,
+        update_config_file=False,
+        changed_files=None,
+        streaming=False,
+        key_index=False,
+        splice=False,
+    ):
+        """Rewrite the NLU data files according to the config.
+
+        If `changed_files` is given, only these files and the files their keys belong in
+        are rewritten, which gives the same result as enforcing on all files as long as
+        all other files already matched the config. See `write_target_files` for how
+        files are written. If `key_index`, the key index is updated afterwards, see
+        `update_key_index`.
+        """
+        if streaming and splice:
+            raise ValueError("Streaming enforcement can't splice changes into files")
+        nlu_files = None
+        if changed_files is not None:
+            nlu_files = self.load_changed_nlu_data(changed_files)
+            log_incremental_enforcement_info(changed_files, nlu_files)
+        summary = self.write_target_files(nlu_files, streaming=streaming, splice=splice)
+
         if update_config_file:
             self.write_target_config_to_file()
+        if key_index:
+            self.update_key_index(summary, nlu_files, splice)
+
+        log_enforcement_summary(summary)
+        return summary
+
+    def get_enforcement_signature(self, splice=False):
+        """What the output of enforcement depends on besides the NLU data: the config file
+        and the options that change the output.
+        """
+        with open(self.config_filepath, "rb") as f:
+            config_hash = hash_bytes(f.read())
+        return OrderedDict(
+            [
+                ("config_hash", config_hash),
+                ("dedupe_lookups", self.lookup_options.dedupe),
+                ("drop_duplicates", self.duplicate_options.drop),
+                ("splice", splice),
+            ]
+        )
+
+    def load_key_index(self, nlu_files=None):
+        """The key index next to the config file (see `key_index`), brought up to date
+        with the NLU files. Returns it together with the files that were stale.
+        """
+        key_index = KeyIndex.load(get_key_index_path(self.config_filepath))
+        if nlu_files is None:
+            nlu_files = get_nlu_files(self.nlu_data_path, self.yaml_backend)
+        stale = key_index.refresh([relpath(f) for f in nlu_files])
+        return key_index, stale
+
+    def update_key_index(self, summary, nlu_files=None, splice=False):
+        """Bring the key index up to date after enforcement.
+
+        The files are recorded as enforced with this config unless a file failed. With
+        `nlu_files`, i.e. after incremental enforcement, they only are if they already
+        were and all files that changed since were loaded, written or deleted.
+        """
+        key_index, stale = self.load_key_index()
+        signature = self.get_enforcement_signature(splice)
+        enforced = not summary.failed
+        if enforced and nlu_files is not None:
+            handled = set([relpath(f) for f in list(nlu_files) + summary.written + summary.deleted])
+            enforced = key_index.enforcement_signature == signature and stale <= handled
+        key_index.set_enforcement_signature(signature if enforced else None)
+        if key_index.changed:
+            key_index.save()
+
+    def write_target_files(self, nlu_files=None, only_files=None, streaming=False, splice=False):
+        """Write the target files with the data in `nlu_data` and delete files without data.
+
+        `nlu_files` is passed on to `get_training_data_per_target_file`. If `only_files`
+        is given, other files are left alone.
+
+        Files are rendered and written in a pool of `jobs` processes if `jobs` > 1.
+        A file that can't be written doesn't stop the others from being written;
+        failures are collected in the returned summary. Files without data are only
+        deleted once all other files were written, so that no data is lost on failure.
+
+        If `streaming`, each file is written item by item straight from the index of
+        `nlu_data` (see `write_streamed_target_file`), one file at a time, so that
+        neither the data nor the text of a whole file is ever copied into memory.
+
+        If `splice`, only the items that changed are replaced in existing files, see
+        `splice`; this doesn't work with `streaming`.
+        """
+        summary = EnforcementSummary([], [], [], [])
+        training_data_per_file = [
+            (filename, training_data)
+            for filename, training_data in self.get_training_data_per_target_file(
+                nlu_files, streaming
+            )
+            if only_files is None
+            or filename in only_files
+            or self.get_unsharded_target_file(filename) in only_files
+        ]
+        if streaming:
+            write = partial(write_streamed_target_file, nlu_data=self.nlu_data)
+            jobs = 1
+        else:
+            write = partial(write_target_file, yaml_backend=self.yaml_backend, splice=splice)
+            jobs = self.jobs
+        for filename, outcome in iter_written_target_files(
+            [
+                (filename, training_data)
+                for filename, training_data in training_data_per_file
+                if training_data is not None
+            ],
+            write,
+            jobs,
+        ):
+            if isinstance(outcome, Exception):
+                logger.error(f"Could not write file {filename}: {outcome!r}")
+                summary.failed.append((filename, outcome))
+            elif outcome == FILE_WRITTEN:
+                logger.warning(f"Writing data to file {filename}")
+                summary.written.append(filename)
+            elif outcome == FILE_UNCHANGED:
+                summary.unchanged.append(filename)
+
+        files_to_delete = [
+            filename
+            for filename, training_data in training_data_per_file
+            if training_data is None
+        ]
+        if summary.failed and files_to_delete:
+            logger.error(
+                f"Not deleting {len(files_to_delete)} file(s) without data "
+                f"because other files could not be written: {', '.join(files_to_delete)}"
+            )
+            files_to_delete = []
+        for filename in files_to_delete:
+            logger.warning(
+                f"No data found for file {filename}; deleting {filename}"
+            )
+            try:
+                with profile_phase("writing"):
+                    os.remove(filename)
+            except OSError as e:
+                logger.error(f"Could not delete file {filename}: {e!r}")
+                summary.failed.append((filename, e))
+                continue
+            summary.deleted.append(filename)
+        return summary
+
+    def check_on_files(self, full_report=False, key_index=False, splice=False):
+        """Find out whether enforcement would change any files, without writing anything.
+
+        Keys found in a file other than their target file are reported first, as this
+        only requires parsing the files up to the first misplaced key. If all keys are
+        in place, the target files are rendered and compared with the files on disk.
+        Unless `full_report` is set, checking stops at the first mismatch.
+
+        If `key_index`, the key index is brought up to date first. If no file changed
+        since the files were enforced with this config, nothing is parsed; otherwise
+        misplaced keys are looked up in the index where all files could be indexed.
+
+        If `splice`, files are compared with what enforcing with `splice` would leave,
+        so that files only need to have the right items, not the exact text.
+        """
+        result = CheckResult([], [])
+        nlu_files = get_nlu_files(self.nlu_data_path, self.yaml_backend)
+        index = None
+        keys_per_file = None
+        if key_index:
+            index, stale = self.load_key_index(nlu_files)
+            signature = self.get_enforcement_signature(splice)
+            if not stale and index.enforcement_signature == signature:
+                logger.warning("According to the key index, no NLU file changed since enforcing this config")
+                return result
+            index.set_enforcement_signature(None)
+            keys_per_file = index.get_keys_per_file()
+        try:
+            for filename, keys_present in (keys_per_file or {}).items():
+                if self.add_misplaced_keys(result, filename, keys_present, full_report):
+                    return result
+            training_data_per_file = []
+            # Closed when returning early, so that the cache is still evicted
+            with profile_phase("parsing"), closing(
+                iter_nlu_files(nlu_files, self.jobs, self.cache, self.yaml_backend)
+            ) as parsed_files:
+                for filename, training_data in zip(nlu_files, parsed_files):
+                    if keys_per_file is None and self.add_misplaced_keys(
+                        result, filename, get_explicit_keys_present(training_data), full_report
+                    ):
+                        return result
+                    training_data_per_file.append(training_data)
+
+            self.nlu_data = merge_training_data(training_data_per_file, self.lookup_options)
+            file_matches = file_matches_when_spliced if splice else file_has_text
+            for filename, rendered in self.render_target_files():
+                if rendered is None or (rendered and not file_matches(filename, rendered)):
+                    result.changed_files.append(filename)
+                    if not full_report:
+                        return result
+            if index is not None and not (result.misplaced_keys or result.changed_files):
+                index.set_enforcement_signature(signature)
+            return result
+        finally:
+            if index is not None and index.changed:
+                index.save()
+
+    def add_misplaced_keys(self, result, filename, keys_present, full_report=False):
+        """Add the keys in `filename` that belong in another file to `result`.
+
+        Returns whether checking should stop, i.e. if a key is misplaced and not `full_report`.
+        """
+        for section, keys in keys_present.items():
+            for key in keys:
+                target_file = self.get_target_file(section, key)
+                if not self.is_in_target_file(relpath(filename), target_file):
+                    result.misplaced_keys.append(MisplacedKey(section, key, filename, target_file))
+                    if not full_report:
+                        return True
+        return False
 
     def update_config_from_data(self):
-        all_keys_in_data = self.nlu_data.get_all_keys_present()
-        all_keys_in_nlu_target_files = self.get_handled_keys()
-        new_keys = {
-            key: set(all_keys_in_data[key]) - set(all_keys_in_nlu_target_files[key])
-            for key in all_keys_in_data.keys()
-        }
-        self.intent_target_files.set_value_for_keys(new_keys["intents"], self.default_intent_target_file)
-        self.synonym_target_files.set_value_for_keys(new_keys["synonyms"], self.default_synonym_target_file)
-        self.regex_target_files.set_value_for_keys(new_keys["regexes"], self.default_regex_target_file)
-        self.lookup_target_files.set_value_for_keys(new_keys["lookups"], self.default_lookup_target_file)
+        nlu_data = self.nlu_data
+        with profile_phase("config"):
+            all_keys_in_data = nlu_data.get_all_keys_present()
+            all_keys_in_nlu_target_files = self.get_handled_keys()
+            new_keys = {
+                key: set(all_keys_in_data[key]) - set(all_keys_in_nlu_target_files[key])
+                for key in all_keys_in_data.keys()
+            }
+            new_keys = {
+                section: self.assign_keys_by_rules(section, keys)
+                for section, keys in new_keys.items()
+            }
+            self.intent_target_files.set_value_for_keys(new_keys["intents"], self.default_intent_target_file)
+            self.synonym_target_files.set_value_for_keys(new_keys["synonyms"], self.default_synonym_target_file)
+            self.regex_target_files.set_value_for_keys(new_keys["regexes"], self.default_regex_target_file)
+            self.lookup_target_files.set_value_for_keys(new_keys["lookups"], self.default_lookup_target_file)
+
+    def assign_keys_by_rules(self, section, keys):
+        """Assign the keys that match a target file rule implicitly; returns the other keys."""
+        rules = self.target_file_rules[section]
+        if not rules:
+            return keys
+        target_files = getattr(self, f"{SECTION_ATTRIBUTE_PREFIXES[section]}_target_files")
+        unmatched = []
+        for key in keys:
+            target_file = rules.match(key)
+            if target_file is None:
+                unmatched.append(key)
+            else:
+                target_files.set_value_for_keys([key], target_file, implicit=True)
+        return unmatched
 
     def write_target_config_to_file(self):
-        write_yaml(self.as_dict(), self.config_filepath, True)
+        with profile_phase("writing"):
+            write_file_if_changed(
+                self.config_filepath,
+                dump_obj_as_yaml_to_string(self.as_dict(), should_preserve_key_order=True),
+            )
+
+
+
+def write_target_file(filename, training_data, yaml_backend, splice=False):
+    """Render and write a single target file as part of enforcement.
+
+    If `splice`, the items that changed are spliced into the existing file instead.
+    Returns one of `FILE_WRITTEN`, `FILE_UNCHANGED` or `FILE_EMPTY`.
+    """
+    with profile_phase("rendering"):
+        rendered = yaml_backend.create_writer().dumps(training_data)
+    if not rendered:
+        # Like `RasaYAMLWriter.dump`, don't write files without any data.
+        return FILE_EMPTY
+    if splice:
+        with profile_phase("splicing"):
+            rendered = splice_into_file(filename, rendered)
+    with profile_phase("writing"):
+        written = write_file_if_changed(filename, rendered)
+    return FILE_WRITTEN if written else FILE_UNCHANGED
+
 
+def write_streamed_target_file(filename, keys_per_section, nlu_data):
+    """Write a single target file item by item with a `StreamingYAMLWriter`.
+
+    Gives the same file as `write_target_file`, but takes the keys in the file (see
+    `partition_keys`) and reads their data from the index of `nlu_data` while writing.
+    The file is written next to its target and only moved into place if it changed.
+    """
+
+    def write(stream):
+        writer = StreamingYAMLWriter(stream)
+        write_nlu_data_for_keys(writer, nlu_data, keys_per_section)
+        return writer.items_written > 0
+
+    with profile_phase("rendering_and_writing"):
+        written = write_stream_if_changed(filename, write)
+    if written is None:
+        return FILE_EMPTY
+    return FILE_WRITTEN if written else FILE_UNCHANGED
+
+
+def iter_written_target_files(training_data_per_file, write, jobs=1):
+    """Write each file with `write(filename, data)`, in a pool of `jobs` processes if `jobs` > 1.
+
+    `write` is `write_target_file` or `write_streamed_target_file` with the remaining
+    arguments bound. Yields each filename with its outcome, or the exception raised
+    while writing it, in the order of `training_data_per_file`.
+    """
+    training_data_per_file = list(training_data_per_file)
+    if jobs > 1 and len(training_data_per_file) > 1:
+        with profile_phase("rendering_and_writing"), ProcessPoolExecutor(
+            max_workers=min(jobs, len(training_data_per_file)),
+            initializer=disable_profiling,
+        ) as executor:
+            futures = [
+                (filename, executor.submit(write, filename, training_data))
+                for filename, training_data in training_data_per_file
+            ]
+            for filename, future in futures:
+                try:
+                    yield filename, future.result()
+                except Exception as e:
+                    yield filename, e
+        return
+
+    for filename, training_data in training_data_per_file:
+        try:
+            yield filename, write(filename, training_data)
+        except Exception as e:
+            yield filename, e
+
+
+def load_yaml_backend(name):
+    """Get the YAML backend called `name` and import the modules it needs."""
+    yaml_backend = get_yaml_backend(name)
+    with profile_phase("import"):
+        yaml_backend.import_modules()
+    return yaml_backend
 
 
 def log_inference_warning(
@@ -325,24 +964,297 @@ Therefore you may see a large diff the first time you run this command.
     )
 
 
+def log_incremental_enforcement_info(changed_files, nlu_files):
+    logger.warning(
+        f"{len(changed_files)} changed file(s) given; "
+        f"enforcing on {len(nlu_files)} NLU file(s) and the target files of their keys"
+    )
+
+
+def log_enforcement_summary(summary):
+    logger.warning(
+        f"{len(summary.written)} file(s) written, "
+        f"{len(summary.unchanged)} file(s) unchanged, "
+        f"{len(summary.deleted)} file(s) deleted"
+        + (f", {len(summary.failed)} file(s) failed" if summary.failed else "")
+    )
+
+
+def log_check_result(result):
+    for misplaced_key in result.misplaced_keys:
+        logger.warning(
+            f"{SECTION_ATTRIBUTE_PREFIXES[misplaced_key.section].capitalize()} "
+            f"'{misplaced_key.key}' is in {misplaced_key.current_file} "
+            f"but belongs in {misplaced_key.target_file}"
+        )
+    for filename in result.changed_files:
+        logger.warning(f"File {filename} would be changed by enforcement")
+    if result.misplaced_keys or result.changed_files:
+        logger.warning(
+            "NLU data does not match the target files config. "
+            "Run `python -m nlu_target_files enforce` to fix it."
+        )
+    else:
+        logger.warning("NLU data matches the target files config.")
+
+
 def infer_nlu_target_files(
-    nlu_data_path, target_files_config, default_nlu_target_file
+    nlu_data_path,
+    target_files_config,
+    default_nlu_target_file,
+    jobs=1,
+    cache_dir=None,
+    cache_max_size_mb=DEFAULT_CACHE_MAX_SIZE_MB,
+    yaml_backend=YAML_BACKEND_AUTO,
+    compress_rules=False,
+    full_parse=False,
 ):
     log_inference_warning(nlu_data_path, target_files_config)
+    yaml_backend = load_yaml_backend(yaml_backend)
     target_files = TargetFilesConfig.infer_structure_from_files(
         nlu_data_path,
         default_nlu_target_file,
         default_nlu_target_file,
         default_nlu_target_file,
         default_nlu_target_file,
-        config_filepath=target_files_config
+        config_filepath=target_files_config,
+        jobs=jobs,
+        cache=create_cache(cache_dir, cache_max_size_mb, yaml_backend),
+        yaml_backend=yaml_backend,
+        compress_rules=compress_rules,
+        full_parse=full_parse,
     )
     target_files.write_target_config_to_file()
 
 
-def enforce_nlu_target_files(target_files_config, update_config_file):
+def enforce_nlu_target_files(
+    target_files_config,
+    update_config_file,
+    jobs=1,
+    cache_dir=None,
+    cache_max_size_mb=DEFAULT_CACHE_MAX_SIZE_MB,
+    yaml_backend=YAML_BACKEND_AUTO,
+    changed_files=None,
+    since=None,
+    streaming=False,
+    lookup_chunk_size=None,
+    dedupe_lookups=False,
+    lookup_sidecar_threshold=None,
+    report_duplicates=False,
+    drop_duplicates=False,
+    key_index=False,
+    splice=False,
+):
+    yaml_backend = load_yaml_backend(yaml_backend)
     target_files = TargetFilesConfig.load_structure_from_file(
-        target_files_config
+        target_files_config,
+        jobs,
+        create_cache(cache_dir, cache_max_size_mb, yaml_backend),
+        yaml_backend,
+        create_lookup_options(lookup_chunk_size, dedupe_lookups, lookup_sidecar_threshold),
+        DuplicateOptions(report_duplicates, drop_duplicates),
     )
     log_enforcement_info(target_files_config, target_files.nlu_data_path)
-    target_files.enforce_on_files(update_config_file)
+    if since is not None:
+        changed_files = get_files_changed_since(since)
+    return target_files.enforce_on_files(
+        update_config_file, changed_files, streaming, key_index, splice
+    )
+
+
+def check_nlu_target_files(
+    target_files_config,
+    full_report=False,
+    jobs=1,
+    cache_dir=None,
+    cache_max_size_mb=DEFAULT_CACHE_MAX_SIZE_MB,
+    yaml_backend=YAML_BACKEND_AUTO,
+    lookup_chunk_size=None,
+    dedupe_lookups=False,
+    lookup_sidecar_threshold=None,
+    report_duplicates=False,
+    drop_duplicates=False,
+    key_index=False,
+    splice=False,
+):
+    """Returns whether the NLU data already matches the target files config."""
+    yaml_backend = load_yaml_backend(yaml_backend)
+    target_files = TargetFilesConfig.load_structure_from_file(
+        target_files_config,
+        jobs,
+        create_cache(cache_dir, cache_max_size_mb, yaml_backend),
+        yaml_backend,
+        create_lookup_options(lookup_chunk_size, dedupe_lookups, lookup_sidecar_threshold),
+        DuplicateOptions(report_duplicates, drop_duplicates),
+    )
+    result = target_files.check_on_files(full_report, key_index, splice)
+    log_check_result(result)
+    return not (result.misplaced_keys or result.changed_files)
+
+
+def locate_nlu_keys(target_files_config, keys, sections=None, show=False):
+    """Log where each of `keys` is according to the key index, which is brought up to date first.
+
+    Looks in all sections unless `sections` is given. If `show`, the blocks of the keys
+    are logged as well. Returns whether all keys were found.
+    """
+    target_files = TargetFilesConfig.load_structure_from_file(
+        target_files_config, yaml_backend=load_yaml_backend(YAML_BACKEND_AUTO)
+    )
+    key_index, _ = target_files.load_key_index()
+    if key_index.changed:
+        key_index.save()
+    found_all = True
+    for key in keys:
+        locations = [
+            (section, filename, block)
+            for section in sections or SECTION_ATTRIBUTE_PREFIXES
+            for filename, block in key_index.locate(section, key)
+        ]
+        if not locations:
+            logger.warning(f"{key}: not found")
+            found_all = False
+        for section, filename, block in locations:
+            first_line, last_line = block["lines"]
+            start, end = block["bytes"]
+            logger.warning(
+                f"{section} {key}: {filename} lines {first_line}-{last_line} (bytes {start}-{end})"
+            )
+            if show:
+                contents = key_index.read_block(filename, block)
+                if contents is None:
+                    logger.warning(f"{filename} changed while reading it")
+                else:
+                    logger.warning(contents.decode(DEFAULT_ENCODING).rstrip("\n"))
+    unindexed_files = [filename for filename, entry in key_index.files.items() if entry["keys"] is None]
+    if unindexed_files:
+        logger.warning(
+            f"Keys in these files couldn't be indexed, as they aren't laid out like enforced files: "
+            f"{', '.join(unindexed_files)}"
+        )
+    return found_all
+
+
+class OverlappingNLUDataPathsError(ValueError):
+    """Raised when projects in a batch share NLU data, which they would both rewrite."""
+
+
+def is_glob_pattern(pattern: Text) -> bool:
+    return any(char in pattern for char in "*?[")
+
+
+def expand_target_files_configs(patterns: List[Text]) -> List[Text]:
+    """The config files named by `patterns`, which may be glob patterns, without duplicates."""
+    target_files_configs = []
+    for pattern in patterns:
+        if not is_glob_pattern(pattern):
+            target_files_configs.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            logger.warning(f"No target files configs match {pattern}")
+        target_files_configs.extend(matches)
+    return list(OrderedDict.fromkeys([relpath(config) for config in target_files_configs]))
+
+
+def find_overlapping_nlu_data_paths(target_files_configs: List[Text]):
+    """Pairs of configs of which one's `nlu_data_path` is, or is inside, the other's.
+
+    Paths are compared with symlinks resolved, so a path that links to another
+    project's data overlaps with it.
+
+    Configs that can't be read are skipped; they fail on their own when they are run.
+    """
+    nlu_data_paths = OrderedDict()
+    for config in target_files_configs:
+        try:
+            nlu_data_path = TargetFilesConfig.read_config_file(config).get("nlu_data_path")
+        except Exception:
+            continue
+        if nlu_data_path:
+            nlu_data_paths[config] = os.path.realpath(nlu_data_path)
+
+    overlapping = []
+    configs = list(nlu_data_paths.keys())
+    for ix, config in enumerate(configs):
+        for other_config in configs[ix + 1:]:
+            path, other_path = nlu_data_paths[config], nlu_data_paths[other_config]
+            if os.path.commonpath([path, other_path]) in (path, other_path):
+                overlapping.append((config, other_config))
+    return overlapping
+
+
+def run_project(command, target_files_config, kwargs):
+    """Run `enforce` or `check` on a single project of a batch.
+
+    Never raises; errors are logged and recorded in the returned `ProjectResult`.
+    """
+    logger.warning(f"Running {command} for {target_files_config}")
+    try:
+        if command == "enforce":
+            summary = enforce_nlu_target_files(target_files_config, **kwargs)
+            exit_code = 1 if summary.failed else 0
+        else:
+            exit_code = 0 if check_nlu_target_files(target_files_config, **kwargs) else 1
+    except Exception as e:
+        logger.exception(f"{command} failed for {target_files_config}")
+        return ProjectResult(target_files_config, 1, repr(e))
+    return ProjectResult(target_files_config, exit_code, None)
+
+
+def run_batch(command, target_files_configs, project_jobs=1, **kwargs) -> List[ProjectResult]:
+    """Run `enforce` or `check` on several projects, each with its own target files config.
+
+    Projects run one after the other in this process, or in a pool of `project_jobs`
+    processes if `project_jobs` > 1, so that interpreter startup and imports are paid
+    only once. `kwargs` are passed on to `enforce_nlu_target_files` or
+    `check_nlu_target_files`. Raises `OverlappingNLUDataPathsError` before running
+    anything if two projects share NLU data.
+    """
+    overlapping = find_overlapping_nlu_data_paths(target_files_configs)
+    if overlapping:
+        raise OverlappingNLUDataPathsError(
+            "The nlu_data_path of these target files configs overlap: "
+            + ", ".join([f"{config} and {other_config}" for config, other_config in overlapping])
+        )
+    if kwargs.get("since") is not None:
+        kwargs["changed_files"] = get_files_changed_since(kwargs.pop("since"))
+    # Import the backend once here, so that forked worker processes don't need to.
+    load_yaml_backend(kwargs.get("yaml_backend", YAML_BACKEND_AUTO))
+
+    if project_jobs > 1 and len(target_files_configs) > 1:
+        results = []
+        with ProcessPoolExecutor(
+            max_workers=min(project_jobs, len(target_files_configs)),
+            initializer=disable_profiling,
+        ) as executor:
+            futures = [
+                (config, executor.submit(run_project, command, config, kwargs))
+                for config in target_files_configs
+            ]
+            for config, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.error(f"{command} failed for {config}: {e!r}")
+                    results.append(ProjectResult(config, 1, repr(e)))
+    else:
+        results = [run_project(command, config, kwargs) for config in target_files_configs]
+
+    log_batch_results(command, results)
+    return results
+
+
+def log_batch_results(command, results):
+    for result in results:
+        status = "ok" if result.exit_code == 0 else f"exit code {result.exit_code}"
+        if result.error:
+            status += f" ({result.error})"
+        logger.warning(f"{command} {result.target_files_config}: {status}")
+    failed = [result for result in results if result.exit_code != 0]
+    logger.warning(f"{command}: {len(results) - len(failed)} of {len(results)} project(s) ok")
+
+
+def write_batch_report(results, filename):
+    with open(filename, "w", encoding=DEFAULT_ENCODING) as f:
+        json.dump([result._asdict() for result in results], f, indent=2)
@@ -1,23 +1,34 @@
-import asyncio
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import logging
+from pathlib import Path
+import tempfile
 
-from ruamel import yaml as yaml
+from nlu_target_files.lookup_tables import DEFAULT_LOOKUP_OPTIONS, sort_lookup_elements
 
-from rasa.shared.importers.rasa import RasaFileImporter
-import rasa.shared.data
-import rasa.shared.utils.io
-from rasa.shared.nlu.training_data.training_data import TrainingData
+from nlu_target_files.native_yaml import (
+    KEY_INTENT,
+    KEY_INTENT_EXAMPLES,
+    KEY_LOOKUP,
+    KEY_LOOKUP_EXAMPLES,
+    KEY_REGEX,
+    KEY_REGEX_EXAMPLES,
+    KEY_SYNONYM,
+    KEY_SYNONYM_EXAMPLES,
+    YAML_FILE_EXTENSIONS,
+    NativeYAMLWriter,
+    TrainingData,
+    check_duplicate_synonym,
+    generate_message,
+    scan_nlu_file_keys,
+)
+from nlu_target_files.profiling import profile_phase
+from nlu_target_files.yaml_backends import get_yaml_backend
 
 logger = logging.getLogger(__name__)
 
 class SortableTrainingData(TrainingData):
-    def get_intent_order(self):
-        intent_order = list(
-            dict.fromkeys([ex.data["intent"] for ex in self.training_examples])
-        )
-        return intent_order
-
     def sort_synonyms(self):
         self.entity_synonyms = OrderedDict(
             sorted(
@@ -36,10 +47,25 @@ class SortableTrainingData(TrainingData):
             )
         )
 
-    def sort_lookup_values(self):
+    def get_lookup_spill_dir(self):
+        """Directory for the run and sidecar files of large lookup tables, removed along with the data."""
+        if getattr(self, "lookup_spill_dir", None) is None:
+            self.lookup_spill_dir = tempfile.TemporaryDirectory(prefix="nlu_target_files_lookups_")
+        return self.lookup_spill_dir.name
+
+    def sort_lookup_values(self, lookup_options=DEFAULT_LOOKUP_OPTIONS):
+        """Sort the elements of each lookup table, see `lookup_tables.sort_lookup_elements`."""
+        if lookup_options == DEFAULT_LOOKUP_OPTIONS:
+            sort_elements = sorted
+        else:
+            def sort_elements(elements):
+                # A lookup table that refers to a file; writers leave these out
+                if isinstance(elements, str):
+                    return elements
+                return sort_lookup_elements(elements, lookup_options, self.get_lookup_spill_dir)
         self.lookup_tables = sorted(
             [
-                {"name": lookup["name"], "elements": sorted(lookup["elements"])}
+                {"name": lookup["name"], "elements": sort_elements(lookup["elements"])}
                 for lookup in self.lookup_tables
             ],
             key=lambda x: x["name"],
@@ -48,15 +74,34 @@ class SortableTrainingData(TrainingData):
             list(set([lookup.get("name") for lookup in self.lookup_tables]))
         )
 
+    def build_examples_index(self):
+        self.examples_index = OrderedDict()
+        for ex in self.training_examples:
+            self.examples_index.setdefault(ex.data["intent"], []).append(ex)
+
+    def build_key_indexes(self):
+        """Index synonyms, regexes and lookups by name so that lookups per key
+        don't require scanning all the data."""
+        self.synonyms_index = OrderedDict()
+        for syn_value, syn_name in self.entity_synonyms.items():
+            self.synonyms_index.setdefault(syn_name, []).append(syn_value)
+        self.regexes_index = OrderedDict()
+        for reg in self.regex_features:
+            self.regexes_index.setdefault(reg.get("name"), []).append(reg)
+        self.lookups_index = OrderedDict()
+        for lookup in self.lookup_tables:
+            self.lookups_index.setdefault(lookup.get("name"), []).append(lookup)
+
     def get_examples_per_intent(self, intent_list):
         examples_per_intent = {
-            intent: [ex for ex in self.training_examples if ex.data["intent"] == intent]
+            intent: self.examples_index.get(intent, [])
             for intent in intent_list
         }
         return examples_per_intent
 
     def sort_intent_examples(self):
-        self.sorted_intents = self.get_intent_order()
+        self.build_examples_index()
+        self.sorted_intents = list(self.examples_index.keys())
         examples_per_intent = self.get_examples_per_intent(self.sorted_intents)
         sorted_examples = [
             ex
@@ -65,11 +110,12 @@ class SortableTrainingData(TrainingData):
         ]
         self.training_examples = sorted_examples
 
-    def sort_data(self):
+    def sort_data(self, lookup_options=DEFAULT_LOOKUP_OPTIONS):
         self.sort_synonyms()
         self.sort_regex_names()
-        self.sort_lookup_values()
+        self.sort_lookup_values(lookup_options)
         self.sort_intent_examples()
+        self.build_key_indexes()
 
     def get_all_keys_present(self):
         return {
@@ -80,40 +126,345 @@ class SortableTrainingData(TrainingData):
         }
 
 
-def load_sortable_nlu_data(nlu_data_path):
-    nlu_files = rasa.shared.data.get_data_files(
-        [nlu_data_path], rasa.shared.data.is_nlu_file
-    )
-    training_data_importer = RasaFileImporter(training_data_paths=nlu_files)
-    loop = asyncio.get_event_loop()
-    nlu_data = loop.run_until_complete(training_data_importer.get_nlu_data())
-    nlu_data.__class__ = SortableTrainingData
-    nlu_data.sort_data()
-    return nlu_data
-
-
-def get_training_data_for_keys(nlu_data, included_keys):
-    training_data_for_keys = TrainingData()
-    training_data_for_keys.training_examples = [
-        ex
-        for ex in nlu_data.training_examples
-        if ex.data.get("intent") in included_keys["intents"]
+def get_nlu_files(nlu_data_path, yaml_backend=None):
+    with profile_phase("discovery"):
+        return (yaml_backend or get_yaml_backend()).get_nlu_files(nlu_data_path)
+
+
+def load_nlu_file(nlu_file, yaml_backend=None):
+    return (yaml_backend or get_yaml_backend()).load_nlu_file(nlu_file)
+
+
+def training_data_as_dict(training_data):
+    """Compact, JSON serializable form of the training data loaded from a single file."""
+    return {
+        "examples": [ex.data for ex in training_data.training_examples],
+        "synonyms": list(training_data.entity_synonyms.items()),
+        "regexes": training_data.regex_features,
+        "lookups": training_data.lookup_tables,
+        "responses": training_data.responses,
+    }
+
+
+def training_data_from_dict(training_data_dict, yaml_backend=None):
+    yaml_backend = yaml_backend or get_yaml_backend()
+    training_data = TrainingData()
+    training_data.training_examples = [
+        yaml_backend.create_message(data) for data in training_data_dict["examples"]
     ]
-    training_data_for_keys.entity_synonyms = OrderedDict(
-        {
-            syn_value: syn_name
-            for syn_value, syn_name in nlu_data.entity_synonyms.items()
-            if syn_name in included_keys["synonyms"]
-        }
+    training_data.entity_synonyms = dict(training_data_dict["synonyms"])
+    training_data.regex_features = training_data_dict["regexes"]
+    training_data.lookup_tables = training_data_dict["lookups"]
+    training_data.responses = training_data_dict["responses"]
+    return training_data
+
+
+def _iter_parsed(nlu_files, jobs, yaml_backend):
+    if jobs > 1 and len(nlu_files) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(nlu_files))) as executor:
+            yield from executor.map(yaml_backend.load_nlu_file, nlu_files)
+    else:
+        for nlu_file in nlu_files:
+            yield yaml_backend.load_nlu_file(nlu_file)
+
+
+def iter_nlu_files(nlu_files, jobs=1, cache=None, yaml_backend=None):
+    """Yield the training data of each NLU file, in the order of `nlu_files`.
+
+    Files are parsed in a pool of `jobs` processes if `jobs` > 1, otherwise one at a
+    time as they are requested. If a `ParsedNLUFileCache` is given, only files whose
+    contents aren't cached yet are parsed, and the cache is evicted to its size limit
+    once the generator is exhausted or closed; callers that stop early should close it.
+    """
+    yaml_backend = yaml_backend or get_yaml_backend()
+    if cache is None:
+        yield from _iter_parsed(nlu_files, jobs, yaml_backend)
+        return
+
+    content_hashes = [cache.hash_file(nlu_file) for nlu_file in nlu_files]
+    cached_entries = [cache.get(content_hash) for content_hash in content_hashes]
+    parsed = _iter_parsed(
+        [
+            nlu_file
+            for nlu_file, entry in zip(nlu_files, cached_entries)
+            if entry is None
+        ],
+        jobs,
+        yaml_backend,
     )
-    training_data_for_keys.regex_features = [
-        reg
-        for reg in nlu_data.regex_features
-        if reg.get("name") in included_keys["regexes"]
-    ]
-    training_data_for_keys.lookup_tables = [
-        lookup
-        for lookup in nlu_data.lookup_tables
-        if lookup.get("name") in included_keys["lookups"]
-    ]
-    return training_data_for_keys
+    try:
+        for nlu_file, content_hash, entry in zip(nlu_files, content_hashes, cached_entries):
+            if entry is not None:
+                yield training_data_from_dict(entry, yaml_backend)
+                continue
+            training_data = next(parsed)
+            try:
+                cache.put(content_hash, training_data_as_dict(training_data))
+            except (TypeError, ValueError, OSError) as e:
+                # The cache must never fail on valid data; the file is parsed again next time
+                logger.warning(f"Could not cache parsed NLU file {nlu_file}: {e!r}")
+            yield training_data
+    finally:
+        # Also when the caller stops early, e.g. `check` at the first misplaced key
+        parsed.close()
+        cache.evict()
+        cache.log_stats()
+
+
+def load_nlu_files(nlu_files, jobs=1, cache=None, yaml_backend=None):
+    """Load each NLU file separately; see `iter_nlu_files`."""
+    with profile_phase("parsing"):
+        return list(iter_nlu_files(nlu_files, jobs, cache, yaml_backend))
+
+
+def merge_training_data(training_data_per_file, lookup_options=DEFAULT_LOOKUP_OPTIONS):
+    """Merge per-file training data in file order into one `SortableTrainingData`.
+
+    Equivalent to `TrainingData().merge(...)` as done by Rasa's importer (later files
+    win for synonyms), but without deep copying every file's data. Lookup tables are
+    sorted according to `lookup_options`.
+    """
+    with profile_phase("sorting"):
+        training_examples = []
+        entity_synonyms = {}
+        regex_features = []
+        lookup_tables = []
+        responses = {}
+        for training_data in training_data_per_file:
+            if not training_data:
+                continue
+            training_examples.extend(training_data.training_examples)
+            regex_features.extend(training_data.regex_features)
+            lookup_tables.extend(training_data.lookup_tables)
+            for text, syn in training_data.entity_synonyms.items():
+                check_duplicate_synonym(
+                    entity_synonyms, text, syn, "merging training data"
+                )
+            entity_synonyms.update(training_data.entity_synonyms)
+            responses.update(training_data.responses)
+
+        nlu_data = SortableTrainingData(
+            training_examples, entity_synonyms, regex_features, lookup_tables, responses
+        )
+        nlu_data.sort_data(lookup_options)
+        return nlu_data
+
+
+def load_sortable_nlu_data(
+    nlu_data_path, jobs=1, cache=None, yaml_backend=None, lookup_options=DEFAULT_LOOKUP_OPTIONS
+):
+    nlu_files = get_nlu_files(nlu_data_path, yaml_backend)
+    return merge_training_data(
+        load_nlu_files(nlu_files, jobs, cache, yaml_backend), lookup_options
+    )
+
+
+def get_keys_present(training_data):
+    """Keys as returned by `SortableTrainingData.get_all_keys_present`, without sorting the data."""
+    return {
+        "intents": list(
+            dict.fromkeys([ex.data["intent"] for ex in training_data.training_examples])
+        ),
+        "synonyms": sorted(list(set(training_data.entity_synonyms.values()))),
+        "regexes": sorted(
+            list(set([reg.get("name") for reg in training_data.regex_features]))
+        ),
+        "lookups": sorted(
+            list(set([lookup.get("name") for lookup in training_data.lookup_tables]))
+        ),
+    }
+
+
+def scan_keys_present(nlu_file, yaml_backend=None, inline_synonyms=True):
+    """Keys as `get_keys_present` returns them for the data in `nlu_file`, but without loading it where possible.
+
+    YAML files are scanned for keys with `native_yaml.KeyScanner`; other files, and
+    files the scanner can't handle the same way, are loaded. Unless `inline_synonyms`,
+    synonyms only defined by entity annotations are left out of scanned files.
+    """
+    keys_present = None
+    if Path(nlu_file).suffix in YAML_FILE_EXTENSIONS:
+        keys_present = scan_nlu_file_keys(nlu_file, inline_synonyms)
+    if keys_present is None:
+        keys_present = get_keys_present(load_nlu_file(nlu_file, yaml_backend))
+    return keys_present
+
+
+def scan_nlu_files(nlu_files, jobs=1, yaml_backend=None):
+    """The keys present in each NLU file, see `scan_keys_present`; in a pool of `jobs` processes if `jobs` > 1."""
+    scan = partial(scan_keys_present, yaml_backend=yaml_backend or get_yaml_backend())
+    with profile_phase("parsing"):
+        if jobs > 1 and len(nlu_files) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(nlu_files))) as executor:
+                return list(executor.map(scan, nlu_files))
+        return [scan(nlu_file) for nlu_file in nlu_files]
+
+
+def get_inline_synonyms(training_data):
+    """Synonyms defined by entity annotations in examples, e.g. `[NYC]{"entity": "city", "value": "New York"}`.
+
+    Rasa adds these to `entity_synonyms` just like the items of `synonym:` sections.
+    """
+    inline_synonyms = {}
+    for ex in training_data.training_examples:
+        text = ex.data.get("text", "")
+        for entity in ex.data.get("entities", []):
+            entity_text = text[entity["start"] : entity["end"]]
+            if entity_text != entity["value"]:
+                inline_synonyms[entity_text] = entity["value"]
+    return inline_synonyms
+
+
+def get_explicit_keys_present(training_data):
+    """Like `get_keys_present`, but leaving out synonyms that are only defined inline.
+
+    Inline synonyms stay in the examples they're annotated in, so unlike the other keys
+    they don't tell which file a synonym currently lives in.
+    """
+    keys_present = get_keys_present(training_data)
+    inline_synonyms = get_inline_synonyms(training_data)
+    keys_present["synonyms"] = sorted(
+        list(
+            set(
+                [
+                    syn_name
+                    for syn_value, syn_name in training_data.entity_synonyms.items()
+                    if inline_synonyms.get(syn_value) != syn_name
+                ]
+            )
+        )
+    )
+    return keys_present
+
+
+def partition_training_data(nlu_data, target_file_per_key, duplicate_index=None):
+    """Split the data into one `TrainingData` per target file in a single pass.
+
+    `target_file_per_key` maps each section ("intents", "synonyms", "regexes", "lookups")
+    to a dict of key -> target file. Keys without a target file are left out.
+    Items keep the order they have in `nlu_data`. If a `DuplicateIndex` is given, the
+    examples, synonyms and regexes are added to it in the same pass, and the exact
+    duplicates it drops are left out.
+    """
+    with profile_phase("partitioning"):
+        return _partition_training_data(nlu_data, target_file_per_key, duplicate_index)
+
+
+def _partition_training_data(nlu_data, target_file_per_key, duplicate_index=None):
+    training_data_per_file = OrderedDict()
+
+    def bucket(section, key):
+        filename = target_file_per_key.get(section, {}).get(key)
+        if filename is None:
+            return None
+        if filename not in training_data_per_file:
+            training_data = TrainingData()
+            training_data.entity_synonyms = OrderedDict()
+            training_data_per_file[filename] = training_data
+        return training_data_per_file[filename]
+
+    for intent in nlu_data.sorted_intents:
+        examples = nlu_data.examples_index[intent]
+        if duplicate_index is not None:
+            examples = duplicate_index.add_examples(examples)
+        training_data = bucket("intents", intent)
+        if training_data is not None:
+            training_data.training_examples.extend(examples)
+    for syn_value, syn_name in nlu_data.entity_synonyms.items():
+        if duplicate_index is not None:
+            duplicate_index.add_synonym(syn_value, syn_name)
+        training_data = bucket("synonyms", syn_name)
+        if training_data is not None:
+            training_data.entity_synonyms[syn_value] = syn_name
+    regex_features = nlu_data.regex_features
+    if duplicate_index is not None:
+        regex_features = duplicate_index.add_regexes(regex_features)
+    for reg in regex_features:
+        training_data = bucket("regexes", reg.get("name"))
+        if training_data is not None:
+            training_data.regex_features.append(reg)
+    for lookup in nlu_data.lookup_tables:
+        training_data = bucket("lookups", lookup.get("name"))
+        if training_data is not None:
+            training_data.lookup_tables.append(lookup)
+
+    return training_data_per_file
+
+
+def get_empty_keys_per_section():
+    return OrderedDict((section, []) for section in ["intents", "synonyms", "regexes", "lookups"])
+
+
+def partition_keys(nlu_data, target_file_per_key, duplicate_index=None):
+    """Like `partition_training_data`, but only collects the keys in each target file.
+
+    Returns an OrderedDict with an OrderedDict of section to keys per target file, in
+    the order the data would be in the corresponding `TrainingData`. The data itself
+    can then be written key by key with `write_nlu_data_for_keys`. Exact duplicates
+    dropped by `duplicate_index` are removed from the indexes of `nlu_data`.
+    """
+    with profile_phase("partitioning"):
+        keys_per_file = OrderedDict()
+
+        def add_key(section, key):
+            filename = target_file_per_key.get(section, {}).get(key)
+            if filename is None:
+                return
+            if filename not in keys_per_file:
+                keys_per_file[filename] = get_empty_keys_per_section()
+            keys_per_file[filename][section].append(key)
+
+        for intent in nlu_data.sorted_intents:
+            if duplicate_index is not None:
+                nlu_data.examples_index[intent] = duplicate_index.add_examples(
+                    nlu_data.examples_index[intent]
+                )
+            add_key("intents", intent)
+        for syn_name, syn_values in nlu_data.synonyms_index.items():
+            if duplicate_index is not None:
+                for syn_value in syn_values:
+                    duplicate_index.add_synonym(syn_value, syn_name)
+            add_key("synonyms", syn_name)
+        for reg_name in nlu_data.regexes_index:
+            if duplicate_index is not None:
+                nlu_data.regexes_index[reg_name] = duplicate_index.add_regexes(
+                    nlu_data.regexes_index[reg_name]
+                )
+            add_key("regexes", reg_name)
+        for lookup_name in nlu_data.lookups_index:
+            add_key("lookups", lookup_name)
+        return keys_per_file
+
+
+def write_nlu_data_for_keys(writer, nlu_data, keys_per_section):
+    """Write the data for the keys from `partition_keys` item by item with a `StreamingYAMLWriter`.
+
+    Gives the same output as `NativeYAMLWriter.dumps` on the `TrainingData` that
+    `partition_training_data` would build for these keys, without building it.
+    """
+    for intent in keys_per_section["intents"]:
+        examples_per_intent = NativeYAMLWriter.prepare_training_examples(
+            nlu_data.examples_index[intent]
+        )
+        for name, examples in examples_per_intent.items():
+            writer.write_item(KEY_INTENT, KEY_INTENT_EXAMPLES, name, examples, generate_message)
+    for syn_name in keys_per_section["synonyms"]:
+        writer.write_item(
+            KEY_SYNONYM, KEY_SYNONYM_EXAMPLES, syn_name, nlu_data.synonyms_index[syn_name]
+        )
+    for reg_name in keys_per_section["regexes"]:
+        writer.write_item(
+            KEY_REGEX,
+            KEY_REGEX_EXAMPLES,
+            reg_name,
+            [reg["pattern"] for reg in nlu_data.regexes_index[reg_name]],
+        )
+    for lookup_name in keys_per_section["lookups"]:
+        elements = None
+        for lookup_table in nlu_data.lookups_index[lookup_name]:
+            # this is a lookup table filename
+            if isinstance(lookup_table["elements"], str):
+                continue
+            elements = lookup_table["elements"]
+        if elements is not None:
+            writer.write_item(KEY_LOOKUP, KEY_LOOKUP_EXAMPLES, lookup_name, elements)
@@ -0,0 +1,458 @@
+"""Watch mode: enforce the target files config whenever NLU data or the config changes.
+
+The config and the parsed data of every NLU file are loaded once and kept in memory.
+On each change only the changed files are parsed again, and only the target files of
+the keys in them are rewritten. Changes are detected with inotify on Linux, and by
+polling file modification times elsewhere.
+"""
+from collections import OrderedDict
+import ctypes
+import ctypes.util
+import logging
+import os
+from os.path import relpath
+import select
+import struct
+import time
+from typing import Iterable, Optional, Set, Text
+
+from nlu_target_files.constants import (
+    DEFAULT_CACHE_MAX_SIZE_MB,
+    DEFAULT_WATCH_DEBOUNCE_SECONDS,
+    DEFAULT_WATCH_POLL_INTERVAL_SECONDS,
+)
+from nlu_target_files.cache import create_cache
+from nlu_target_files.duplicates import DEFAULT_DUPLICATE_OPTIONS, DuplicateOptions
+from nlu_target_files.lookup_tables import DEFAULT_LOOKUP_OPTIONS, LookupOptions, create_lookup_options
+from nlu_target_files.target_files import (
+    TargetFilesConfig,
+    load_yaml_backend,
+    log_enforcement_info,
+    log_enforcement_summary,
+)
+from nlu_target_files.training_data import (
+    get_keys_present,
+    get_nlu_files,
+    load_nlu_file,
+    load_nlu_files,
+    merge_training_data,
+)
+from nlu_target_files.yaml_backends import YAML_BACKEND_AUTO
+
+logger = logging.getLogger(__name__)
+
+def get_signature(path: Text):
+    """Modification time and size of `path`, or `None` if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def iter_files(path: Text):
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, _, files in os.walk(path, followlinks=True):
+        for f in files:
+            yield os.path.join(root, f)
+
+
+class PollingWatcher:
+    """Finds changed files by comparing modification times and sizes on each call."""
+
+    def __init__(self, paths: Iterable[Text]):
+        self.paths = list(paths)
+        self.signatures = self.scan()
+
+    def scan(self):
+        return {
+            filename: get_signature(filename)
+            for path in self.paths
+            for filename in iter_files(path)
+        }
+
+    def read_changes(self, timeout: float) -> Set[Text]:
+        """Wait `timeout` seconds, then return the files changed, added or removed since the last call."""
+        time.sleep(timeout)
+        signatures = self.scan()
+        changed = set(
+            [
+                filename
+                for filename in set(signatures).union(self.signatures)
+                if signatures.get(filename) != self.signatures.get(filename)
+            ]
+        )
+        self.signatures = signatures
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Watches directories recursively with Linux's inotify API, through ctypes.
+
+    Files, like the target files config, are watched through a watch on their
+    directory alone, which only reports events for the files themselves, so that
+    e.g. `.git/` next to the config isn't watched.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    EVENT_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    )
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, paths: Iterable[Text]):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = list(paths)
+        self.directories = {}
+        self.recursive_watches = set()
+        # Watches of directories that are only watched for some files in them -> these files
+        self.files_per_watch = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                self.add_watches(path)
+        for path in self.paths:
+            if not os.path.isdir(path):
+                self.add_file_watch(path)
+
+    def add_watch(self, directory: Text) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.EVENT_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Could not watch {directory}")
+        self.directories[wd] = directory
+        return wd
+
+    def add_watches(self, directory: Text):
+        """Watch `directory` and all directories in it."""
+        for root, _, _ in os.walk(directory, followlinks=True):
+            wd = self.add_watch(root)
+            self.recursive_watches.add(wd)
+            self.files_per_watch.pop(wd, None)
+
+    def add_file_watch(self, path: Text):
+        """Watch the file `path` through a watch on its directory alone."""
+        # Watching a directory again gives the same watch descriptor
+        wd = self.add_watch(os.path.dirname(path) or ".")
+        if wd not in self.recursive_watches:
+            self.files_per_watch.setdefault(wd, set()).add(os.path.normpath(path))
+
+    def read_changes(self, timeout: float) -> Set[Text]:
+        """Wait up to `timeout` seconds for changes, and return the paths that changed.
+
+        Paths may be directories that were created or moved, in which case everything
+        in them should be considered changed.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = os.fsdecode(data[offset: offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    # Events were lost, so everything may have changed.
+                    changed.update(self.paths)
+                    continue
+                directory = self.directories.get(wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, name) if name else directory
+                if wd in self.files_per_watch:
+                    if os.path.normpath(path) in self.files_per_watch[wd]:
+                        changed.add(path)
+                    continue
+                if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self.add_watches(path)
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(paths: Iterable[Text], polling: bool = False):
+    """An `InotifyWatcher` if inotify is available and `polling` isn't set, else a `PollingWatcher`."""
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Can't use inotify ({e}); polling for changes instead")
+    return PollingWatcher(paths)
+
+
+def wait_for_changes(watcher, debounce: float, poll_interval: float) -> Set[Text]:
+    """Block until something changes, then until nothing changed for `debounce` seconds.
+
+    Returns everything that changed in the meantime, so that e.g. an editor saving
+    several files, or saving a file in several steps, results in a single update.
+    """
+    changed = set()
+    while not changed:
+        changed.update(watcher.read_changes(poll_interval))
+    while True:
+        more_changes = watcher.read_changes(debounce)
+        if not more_changes:
+            return changed
+        changed.update(more_changes)
+
+
+class WatchSession:
+    """The target files config and the parsed data of each NLU file, kept in memory between changes."""
+
+    def __init__(
+        self,
+        target_files_config: Text,
+        update_config_file: bool = False,
+        streaming: bool = False,
+        jobs: int = 1,
+        cache=None,
+        yaml_backend=None,
+        lookup_options: LookupOptions = DEFAULT_LOOKUP_OPTIONS,
+        duplicate_options: DuplicateOptions = DEFAULT_DUPLICATE_OPTIONS,
+    ):
+        self.target_files_config = target_files_config
+        self.update_config_file = update_config_file
+        self.streaming = streaming
+        self.jobs = jobs
+        self.cache = cache
+        self.yaml_backend = yaml_backend
+        self.lookup_options = lookup_options
+        self.duplicate_options = duplicate_options
+        self.config = None
+        self.config_signature = None
+        self.training_data_per_file = OrderedDict()
+        self.signatures = {}
+        # Changes that couldn't be handled yet because a file couldn't be parsed,
+        # and the signatures of the files that couldn't be parsed
+        self.pending = set()
+        self.failed_signatures = {}
+
+    def load(self):
+        """Load the config and all NLU data, and enforce the config on all files."""
+        config_signature = get_signature(self.target_files_config)
+        self.config = TargetFilesConfig.load_structure_from_file(
+            self.target_files_config,
+            self.jobs,
+            self.cache,
+            self.yaml_backend,
+            self.lookup_options,
+            self.duplicate_options,
+        )
+        self.config_signature = config_signature
+        nlu_files = [
+            relpath(f) for f in get_nlu_files(self.config.nlu_data_path, self.yaml_backend)
+        ]
+        self.training_data_per_file = OrderedDict()
+        self.signatures = {}
+        for nlu_file, training_data in zip(
+            nlu_files, load_nlu_files(nlu_files, self.jobs, self.cache, self.yaml_backend)
+        ):
+            self.training_data_per_file[nlu_file] = training_data
+            self.signatures[nlu_file] = get_signature(nlu_file)
+        log_enforcement_info(self.target_files_config, self.config.nlu_data_path)
+        return self.enforce()
+
+    @property
+    def watched_paths(self):
+        return [self.config.nlu_data_path, self.target_files_config]
+
+    def is_nlu_file(self, filename: Text) -> bool:
+        return (
+            self.config.is_in_nlu_data_path(filename)
+            and os.path.isfile(filename)
+            and bool(get_nlu_files(filename, self.yaml_backend))
+        )
+
+    def get_target_files(self, training_data) -> Set[Text]:
+        if training_data is None:
+            return set()
+        return self.config.get_target_files_for_keys(get_keys_present(training_data))
+
+    def expand_changed_paths(self, paths: Iterable[Text]) -> Set[Text]:
+        """The files that may have changed, given changed files and directories."""
+        filenames = set()
+        for path in paths:
+            path = relpath(path)
+            if os.path.isdir(path):
+                filenames.update([relpath(f) for f in iter_files(path)])
+            prefix = path + os.sep
+            filenames.update([f for f in self.training_data_per_file if f.startswith(prefix)])
+            filenames.add(path)
+        return filenames
+
+    def handle_changes(self, paths: Iterable[Text]):
+        """Update the data for the changed `paths` and enforce the config where needed.
+
+        Returns the enforcement summary, or `None` if nothing needed to be done.
+        """
+        changed_paths = self.expand_changed_paths(set(paths).union(self.pending))
+        self.pending = set()
+        if relpath(self.target_files_config) in changed_paths:
+            if get_signature(self.target_files_config) != self.config_signature:
+                logger.warning(f"{self.target_files_config} changed; reloading everything")
+                return self.load()
+
+        changed_files = sorted(
+            [
+                f
+                for f in changed_paths
+                if get_signature(f) != self.signatures.get(f)
+                and (f in self.training_data_per_file or self.is_nlu_file(f))
+            ]
+        )
+        if not changed_files:
+            return None
+        if any(
+            f in self.failed_signatures and self.failed_signatures[f] == get_signature(f)
+            for f in changed_files
+        ):
+            # A file that couldn't be parsed hasn't changed since; keep waiting for it.
+            self.pending.update(changed_files)
+            return None
+        logger.warning(f"{len(changed_files)} NLU file(s) changed: {', '.join(changed_files)}")
+
+        parsed = OrderedDict()
+        for nlu_file in changed_files:
+            try:
+                parsed[nlu_file] = (
+                    load_nlu_file(nlu_file, self.yaml_backend) if self.is_nlu_file(nlu_file) else None
+                )
+            except Exception as e:
+                # Most likely the file is being edited; try again when it changes next.
+                logger.error(f"Could not load {nlu_file}, not enforcing until it is fixed: {e!r}")
+                self.failed_signatures[nlu_file] = get_signature(nlu_file)
+                self.pending.update(changed_files)
+                return None
+        self.failed_signatures = {}
+
+        affected_files = set(changed_files)
+        for nlu_file, training_data in parsed.items():
+            affected_files.update(self.get_target_files(self.training_data_per_file.get(nlu_file)))
+            affected_files.update(self.get_target_files(training_data))
+            self.set_training_data(nlu_file, training_data)
+        return self.enforce(affected_files)
+
+    def set_training_data(self, nlu_file: Text, training_data):
+        if training_data is None:
+            self.training_data_per_file.pop(nlu_file, None)
+            self.signatures.pop(nlu_file, None)
+            return
+        self.training_data_per_file[nlu_file] = training_data
+        self.signatures[nlu_file] = get_signature(nlu_file)
+
+    def enforce(self, only_files: Optional[Set[Text]] = None):
+        """Enforce the config with the data in memory, on `only_files` or all files.
+
+        Written and deleted files are loaded again afterwards, so that the data in
+        memory matches the files on disk and changes made here aren't picked up as
+        changes by the user.
+        """
+        self.config.nlu_data = merge_training_data(
+            [self.training_data_per_file[f] for f in sorted(self.training_data_per_file)],
+            self.lookup_options,
+        )
+        summary = self.config.write_target_files(
+            sorted(self.training_data_per_file), only_files, self.streaming
+        )
+        for filename in summary.written:
+            if self.config.is_in_nlu_data_path(filename):
+                self.set_training_data(filename, load_nlu_file(filename, self.yaml_backend))
+        for filename in summary.deleted:
+            self.set_training_data(filename, None)
+        if self.update_config_file:
+            self.config.write_target_config_to_file()
+            self.config_signature = get_signature(self.target_files_config)
+        log_enforcement_summary(summary)
+        return summary
+
+
+def watch_nlu_target_files(
+    target_files_config,
+    update_config_file=False,
+    streaming=False,
+    jobs=1,
+    cache_dir=None,
+    cache_max_size_mb=DEFAULT_CACHE_MAX_SIZE_MB,
+    yaml_backend=YAML_BACKEND_AUTO,
+    debounce=DEFAULT_WATCH_DEBOUNCE_SECONDS,
+    poll_interval=DEFAULT_WATCH_POLL_INTERVAL_SECONDS,
+    polling=False,
+    max_updates=None,
+    lookup_chunk_size=None,
+    dedupe_lookups=False,
+    lookup_sidecar_threshold=None,
+    report_duplicates=False,
+    drop_duplicates=False,
+):
+    """Enforce the config, then again on every change until interrupted.
+
+    `max_updates` stops watching after enforcing on that many batches of changes,
+    e.g. for testing.
+    """
+    yaml_backend = load_yaml_backend(yaml_backend)
+    session = WatchSession(
+        target_files_config,
+        update_config_file,
+        streaming,
+        jobs,
+        create_cache(cache_dir, cache_max_size_mb, yaml_backend),
+        yaml_backend,
+        create_lookup_options(lookup_chunk_size, dedupe_lookups, lookup_sidecar_threshold),
+        DuplicateOptions(report_duplicates, drop_duplicates),
+    )
+    session.load()
+    watcher = create_watcher(session.watched_paths, polling)
+    logger.warning(
+        f"Watching {session.config.nlu_data_path} and {target_files_config} for changes "
+        f"with {type(watcher).__name__}; press Ctrl+C to stop"
+    )
+    updates = 0
+    try:
+        while max_updates is None or updates < max_updates:
+            changed_paths = wait_for_changes(watcher, debounce, poll_interval)
+            try:
+                summary = session.handle_changes(changed_paths)
+            except Exception:
+                logger.exception("Could not enforce the config on the changed files")
+                summary = None
+            if session.watched_paths != watcher.paths:
+                watcher.close()
+                watcher = create_watcher(session.watched_paths, polling)
+            if summary is not None:
+                updates += 1
+    except KeyboardInterrupt:
+        logger.warning("Stopped watching")
+    finally:
+        watcher.close()
@@ -0,0 +1,91 @@
+import filecmp
+import logging
+import os
+import tempfile
+from typing import Callable, Optional, TextIO, Text
+
+from nlu_target_files.constants import DEFAULT_ENCODING
+
+logger = logging.getLogger(__name__)
+
+
+def file_has_contents(filename: Text, contents: bytes) -> bool:
+    try:
+        if os.path.getsize(filename) != len(contents):
+            return False
+        with open(filename, "rb") as f:
+            return f.read() == contents
+    except FileNotFoundError:
+        return False
+
+
+def _create_temporary_file(filename: Text):
+    directory = os.path.dirname(filename) or "."
+    os.makedirs(directory, exist_ok=True)
+    return tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+
+
+def _replace_with_temporary_file(filename: Text, tmp_filename: Text):
+    if os.path.exists(filename):
+        os.chmod(tmp_filename, os.stat(filename).st_mode & 0o7777)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_filename, 0o666 & ~umask)
+    os.replace(tmp_filename, filename)
+
+
+def write_file_atomically(filename: Text, contents: bytes):
+    """Write to a temporary file next to `filename` and rename it into place,
+    so that an interrupted run never leaves a partially written file behind.
+    """
+    fd, tmp_filename = _create_temporary_file(filename)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(contents)
+        _replace_with_temporary_file(filename, tmp_filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def file_has_text(filename: Text, text: Text) -> bool:
+    return file_has_contents(filename, text.encode(DEFAULT_ENCODING))
+
+
+def write_file_if_changed(filename: Text, text: Text) -> bool:
+    """Write `text` to `filename` unless the file already has exactly these contents.
+
+    Returns whether the file was written.
+    """
+    if file_has_text(filename, text):
+        return False
+    write_file_atomically(filename, text.encode(DEFAULT_ENCODING))
+    return True
+
+
+def write_stream_if_changed(filename: Text, write: Callable[[TextIO], bool]) -> Optional[bool]:
+    """Like `write_file_if_changed`, for text produced by `write(stream)` piece by piece.
+
+    The text is written to a temporary file next to `filename`, which replaces `filename`
+    only if the contents differ, so the text is never held in memory as a whole.
+    `write` returns whether it wrote anything; if it didn't, `filename` is left alone
+    and `None` is returned. Otherwise returns whether the file was written.
+    """
+    fd, tmp_filename = _create_temporary_file(filename)
+    try:
+        with os.fdopen(fd, "w", encoding=DEFAULT_ENCODING, newline="") as f:
+            wrote_anything = write(f)
+        if not wrote_anything:
+            os.remove(tmp_filename)
+            return None
+        if os.path.isfile(filename) and filecmp.cmp(tmp_filename, filename, shallow=False):
+            os.remove(tmp_filename)
+            return False
+        _replace_with_temporary_file(filename, tmp_filename)
+        return True
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
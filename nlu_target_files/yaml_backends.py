@@ -0,0 +1,110 @@
+import importlib.util
+from typing import Optional, Text
+
+YAML_BACKEND_AUTO = "auto"
+YAML_BACKEND_RASA = "rasa"
+YAML_BACKEND_NATIVE = "native"
+YAML_BACKENDS = [YAML_BACKEND_AUTO, YAML_BACKEND_RASA, YAML_BACKEND_NATIVE]
+
+
+class RasaYAMLBackend:
+    """Reads NLU files with Rasa's importer and writes them with `RasaYAMLWriter`.
+
+    Supports every training data format Rasa does, but requires Rasa to be installed.
+    """
+
+    name = YAML_BACKEND_RASA
+
+    @property
+    def version(self):
+        import rasa
+
+        return rasa.__version__
+
+    @staticmethod
+    def import_modules():
+        import rasa.shared.data
+        import rasa.shared.nlu.training_data.formats.rasa_yaml
+        import rasa.shared.nlu.training_data.loading
+
+    @staticmethod
+    def get_nlu_files(nlu_data_path):
+        import rasa.shared.data
+
+        return rasa.shared.data.get_data_files(
+            [nlu_data_path], rasa.shared.data.is_nlu_file
+        )
+
+    @staticmethod
+    def load_nlu_file(nlu_file):
+        from rasa.shared.nlu.training_data import loading
+
+        return loading.load_data(nlu_file)
+
+    @staticmethod
+    def create_message(data):
+        from rasa.shared.nlu.training_data.message import Message
+
+        return Message(data=data)
+
+    @staticmethod
+    def create_writer():
+        from rasa.shared.nlu.training_data.formats.rasa_yaml import RasaYAMLWriter
+
+        return RasaYAMLWriter()
+
+
+class NativeYAMLBackend:
+    """Reads and writes NLU files in YAML format without importing Rasa; see `native_yaml`."""
+
+    name = YAML_BACKEND_NATIVE
+
+    @property
+    def version(self):
+        from nlu_target_files.native_yaml import LATEST_TRAINING_DATA_FORMAT_VERSION
+
+        return LATEST_TRAINING_DATA_FORMAT_VERSION
+
+    @staticmethod
+    def import_modules():
+        import nlu_target_files.native_yaml
+
+    @staticmethod
+    def get_nlu_files(nlu_data_path):
+        from nlu_target_files.native_yaml import get_nlu_files
+
+        return get_nlu_files(nlu_data_path)
+
+    @staticmethod
+    def load_nlu_file(nlu_file):
+        from nlu_target_files.native_yaml import read_nlu_file
+
+        return read_nlu_file(nlu_file)
+
+    @staticmethod
+    def create_message(data):
+        from nlu_target_files.native_yaml import Message
+
+        return Message(data)
+
+    @staticmethod
+    def create_writer():
+        from nlu_target_files.native_yaml import NativeYAMLWriter
+
+        return NativeYAMLWriter()
+
+
+def get_yaml_backend(name: Optional[Text] = YAML_BACKEND_AUTO):
+    """The backend called `name`; "auto" picks Rasa if it is installed, else the native one."""
+    if name in (None, YAML_BACKEND_AUTO):
+        if importlib.util.find_spec("rasa") is not None:
+            name = YAML_BACKEND_RASA
+        else:
+            name = YAML_BACKEND_NATIVE
+    if name == YAML_BACKEND_RASA:
+        return RasaYAMLBackend()
+    if name == YAML_BACKEND_NATIVE:
+        return NativeYAMLBackend()
+    raise ValueError(
+        f"Unknown YAML backend '{name}', expected one of {', '.join(YAML_BACKENDS)}"
+    )